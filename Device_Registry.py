@@ -0,0 +1,168 @@
+"""
+Registry of the USB-serial instruments
+
+Enumerates the COM ports at most once per session and keeps the serial number / PID:VID to port
+mapping on disk, so connecting does not need a full port enumeration every time. A cached port is
+only reused while the device on it still has the serial number / PID:VID it was cached for, port
+numbers can swap after a replug or reboot.
+"""
+
+import json
+import os
+import sys
+
+from serial.tools import list_ports, list_ports_linux
+from serial.tools.list_ports_common import ListPortInfo
+
+
+REGISTRY_FILE: str = os.path.join(os.path.expanduser("~"), ".tuning_fork_ports.json")
+
+
+class DeviceRegistry:
+    def __init__(self, path: str | os.PathLike = REGISTRY_FILE) -> None:
+        """
+        :param path: JSON file with cached ports, `""` keeps the cache in memory only. default: `REGISTRY_FILE`
+        :type path: str | os.PathLike
+        """
+        self.path = path
+        self._ports: list[ListPortInfo] | None = None
+        self.cache: dict[str, str] = {}
+
+        if self.path != "" and os.path.exists(self.path):
+            try:
+                with open(self.path) as file:
+                    self.cache = dict(json.load(file))
+            except (OSError, ValueError):
+                self.cache = {}
+
+    @staticmethod
+    def key(sn: str | None = None, pid: int | None = None, vid: int | None = None) -> str:
+        """Cache key of a device, by serial number or else by PID and VID."""
+        if sn is not None:
+            return f"sn:{sn}"
+        if pid is None or vid is None:
+            raise ValueError("A device needs a serial number or both a PID and VID!")
+        return f"pidvid:{pid:04X}:{vid:04X}"
+
+    def enumerate(self, refresh: bool = False) -> list[ListPortInfo]:
+        """All serial ports, enumerated once per registry unless `refresh`."""
+        if self._ports is None or refresh:
+            self._ports = list(list_ports.comports())
+        return self._ports
+
+    def save(self) -> None:
+        if self.path == "":
+            return
+        try:
+            with open(self.path, "w") as file:
+                json.dump(self.cache, file, indent=2)
+        except OSError as e:
+            print(f"Could not save device registry '{self.path}': {e}")
+
+    def forget(self, key: str | None = None) -> None:
+        """Drops one cached port, or all of them for `None`."""
+        if key is None:
+            self.cache.clear()
+        else:
+            self.cache.pop(key, None)
+        self.save()
+
+    @staticmethod
+    def _matches(info: ListPortInfo, sn: str | None, pid: int | None, vid: int | None) -> bool:
+        """If the device on a port is the one with serial number `sn`, or else `pid` and `vid`."""
+        if sn is not None:
+            return info.serial_number == sn
+        return info.pid == pid and info.vid == vid
+
+    def _identity(self, port: str) -> ListPortInfo | None:
+        """
+        Device on a port, `None` if the port is gone
+
+        Linux reads the USB descriptors of the one port from sysfs, elsewhere the ports are enumerated
+        (once per registry).
+        """
+        if sys.platform.startswith("linux"):
+            if not os.path.exists(port):
+                return None
+            # sysfs only knows the kernel name, not /dev/serial/by-id links
+            return list_ports_linux.SysFS(os.path.realpath(port))
+        return next((p for p in self.enumerate() if p.device == port), None)
+
+    def _find(self, sn: str | None, pid: int | None, vid: int | None) -> str:
+        found = [p for p in self.enumerate() if self._matches(p, sn, pid, vid)]
+
+        if len(found) == 0:
+            raise LookupError(f"No serial port found for {self.key(sn, pid, vid)}!")
+        if len(found) > 1:
+            raise LookupError(
+                f"{len(found)} serial ports match {self.key(sn, pid, vid)}: "
+                f"{', '.join(p.device for p in found)}!"
+            )
+        return found[0].device
+
+    def resolve(
+        self,
+        sn: str | None = None,
+        pid: int | None = None,
+        vid: int | None = None,
+    ) -> str:
+        """
+        Port of a device
+
+        Uses the cached port if the device on it is still this one, otherwise drops it, enumerates
+        (once) and updates the cache.
+
+        :raises LookupError: No or more than one port matches the device.
+
+        :returns: Port name, e.g. `COM3` or `/dev/ttyUSB0`.
+        :rtype: str
+        """
+        key = self.key(sn, pid, vid)
+        port = self.cache.get(key)
+        if port is not None:
+            info = self._identity(port)
+            if info is not None and self._matches(info, sn, pid, vid):
+                return port
+            if info is not None:
+                print(f"Cached port {port} of {key} now belongs to another device, searching again")
+            self.forget(key)
+
+        port = self._find(sn, pid, vid)
+        self.cache[key] = port
+        self.save()
+        return port
+
+    def resolveAll(self, devices: dict[str, dict]) -> dict[str, str]:
+        """
+        Ports of all instruments in one pass
+
+        :param devices: Name to device description, e.g. `{"normal": {"sn": "A9JSTXTQA"}, "height": {"pid": 0x4001, "vid": 0x0FE7}}`.
+        :type devices: dict[str, dict]
+
+        :raises LookupError: Lists every device that could not be resolved.
+
+        :returns: Name to port.
+        :rtype: dict[str, str]
+        """
+        ports: dict[str, str] = {}
+        errors: list[str] = []
+        for name, description in devices.items():
+            try:
+                ports[name] = self.resolve(**description)
+            except LookupError as e:
+                errors.append(f"{name}: {e}")
+
+        if len(errors) > 0:
+            raise LookupError("\n".join(errors))
+        return ports
+
+
+_defaultRegistry: DeviceRegistry | None = None
+
+
+def defaultRegistry() -> DeviceRegistry:
+    """Registry shared by all drivers that are not given a port."""
+    global _defaultRegistry
+    if _defaultRegistry is None:
+        _defaultRegistry = DeviceRegistry()
+    return _defaultRegistry
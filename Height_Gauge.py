@@ -1,31 +1,29 @@
 import serial
 from numpy import nan
-from LockIn_Amplifier import find_unique_dev_by_pidvid
+from Device_Registry import DeviceRegistry, defaultRegistry
+from Serial_Transport import SerialTransport
+from metrics import getMetrics
+from profiler import traced
 
 
 class mitutoyo(object):
-    def __init__(self, port="") -> None:
+    def __init__(self, port="", registry: DeviceRegistry | None = None) -> None:
         if port == "":
-            port = str(find_unique_dev_by_pidvid(pid=0x4001, vid=0x0FE7)).split(" ")[0]
+            port = (registry or defaultRegistry()).resolve(pid=0x4001, vid=0x0FE7)
             print("Using Mitutoyo port:", port)
         self.ser = serial.Serial(port=port, baudrate=115200)
+        self.transport = SerialTransport(self.ser, terminator=b"\r")
 
     def answer(self) -> str:
-        f = self.ser.read().decode()
-        a: str = ""
-        c: str = ""
+        """Reads a reply, without the leading status byte ("9" is an error)."""
+        a = self.transport.readLine()
 
-        while c != "\r":
-            c = self.ser.read().decode()
-
-            if c != "\r":
-                a += c
-
-        if f == "9":
+        if a[:1] == "9":
             print("Error")
 
-        return a
+        return a[1:]
 
+    @traced("height", tags=lambda *a, **k: {"device": "mitutoyo"})
     def measurement(self) -> float:
         """
         Measures height
@@ -33,8 +31,7 @@ class mitutoyo(object):
         Returns height value or nan on bad read.
         """
         m: float = 0.0
-        cmd = "1\r".encode()
-        self.ser.write(cmd)
+        self.transport.write("1\r")
         a = self.answer().split("\r")[0]
 
         if a.startswith("1A"):
@@ -42,11 +39,14 @@ class mitutoyo(object):
                 m = float(a.replace("1A", ""))
             except ValueError:
                 m = nan
+        else:
+            m = nan
+        getMetrics().checkNan(m)
         return m
 
+    @traced("height", tags=lambda *a, **k: {"device": "mitutoyo"})
     def info(self) -> str:
-        cmd = "V\r".encode()
-        self.ser.write(cmd)
+        self.transport.write("V\r")
         a = self.answer()
 
         return a
@@ -9,13 +9,82 @@ Integration of SR830 Lock-In Amlifier from Stanford Research Systems
 ##  Ra;       | This command returns the current normal sine out amplitude
 ##  Rp;       | This command returns the current normal phase
 
+import asyncio
 import serial
+import clock
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 from serial.tools import list_ports
 from serial.tools.list_ports_common import ListPortInfo
 
+import numpy as np
 from numpy import nan
 
+from Serial_Transport import SerialTransport
+from Device_Registry import DeviceRegistry, defaultRegistry
+from metrics import getMetrics
+from profiler import traced
+
+
+SNAP_PARAMETERS: dict[str, int] = {
+    "X": 1,
+    "Y": 2,
+    "R": 3,
+    "theta": 4,
+    "aux1": 5,
+    "aux2": 6,
+    "aux3": 7,
+    "aux4": 8,
+    "freq": 9,
+    "ch1": 10,
+    "ch2": 11,
+}
+
+
+SAMPLE_RATES: list[float] = [2.0**i for i in range(-4, 10)]
+"""Buffer sample rates in Hz for `SRAT` index 0 (62.5 mHz) to 13 (512 Hz), index 14 is external trigger."""
+
+TIME_CONSTANTS: list[float] = [10e-6, 30e-6, 100e-6, 300e-6, 1e-3, 3e-3, 10e-3, 30e-3, 100e-3, 300e-3, 1e0, 3e0, 10e0, 30e0, 100e0, 300e0, 1e3, 3e3, 10e3, 30e3]
+"""Time constants in s for `OFLT` index 0 (10 \u00b5s) to 19 (30 ks)."""
+
+SENSITIVITIES: list[float] = [2e-9, 5e-9, 10e-9, 20e-9, 50e-9, 100e-9, 200e-9, 500e-9, 1e-6, 2e-6, 5e-6, 10e-6, 20e-6, 50e-6, 100e-6, 200e-6, 500e-6, 1e-3, 2e-3, 5e-3, 10e-3, 20e-3, 50e-3, 100e-3, 200e-3, 500e-3, 1e0]
+"""Full scale in V for `SENS` index 0 (2 nV) to 26 (1 V)."""
+
+LIAS_INPUT_OVERLOAD: int = 1 << 0
+LIAS_FILTER_OVERLOAD: int = 1 << 1
+LIAS_OUTPUT_OVERLOAD: int = 1 << 2
+
+STATE_COMMANDS: dict[str, str] = {
+    "amplitude": "SLVL",
+    "sensitivity": "SENS",
+    "timeConstant": "OFLT",
+    "slope": "OFSL",
+    "reserve": "RMOD",
+}
+"""
+Configuration cached in `SR830.state` and the command setting it, append `?` to query.
+
+The frequency is not cached, with the external reference of the function generator it changes without
+the lock-in being told.
+"""
+
+STATE_LIMITS: dict[str, tuple[int, int]] = {
+    "sensitivity": (0, 26),
+    "timeConstant": (0, 19),
+    "slope": (0, 3),
+    "reserve": (0, 2),
+}
+
+ESR_EXECUTION_ERROR: int = 1 << 4
+ESR_COMMAND_ERROR: int = 1 << 5
+ESR_USER_REQUEST: int = 1 << 6
+"""Standard event status bit set by any front panel key press or knob rotation."""
+
+BUFFER_SIZE: int = 16383
+"""Maximum number of points per channel in the data buffer."""
+
 
 def find_unique_dev_by_pidvid(pid: int, vid: int) -> ListPortInfo | None:
     """Find port by Vendor ID and Product ID"""
@@ -32,27 +101,202 @@ def find_unique_dev_by_serial_number(sn: str) -> ListPortInfo | None:
 
 
 class SR830:
-    def __init__(self, SN: str, readDrops: int = 3) -> None:
-        port = str(find_unique_dev_by_serial_number(sn=SN)).split(" ")[0]
+    def __init__(
+        self,
+        SN: str,
+        readDrops: int = 3,
+        sentinel: bool | None = None,
+        port: str = "",
+        registry: DeviceRegistry | None = None,
+    ) -> None:
+        """
+        :param SN: Serial number of the USB-serial adapter the lock-in is connected to.
+        :type SN: str
+
+        :param readDrops: Maximum attempts per query, retries only happen when a reply fails validation. default: `3`
+        :type readDrops: int
+
+        :param sentinel: Frame queries with a trailing `OUTX?`, so a stale reply is detected: `True` frames every query, `False` none and `None` the single value queries, which can not be told from a stale reply by their field count. default: `None`
+        :type sentinel: bool | None
+
+        :param port: Port to use, looked up from `SN` in the device registry if empty. default: `""`
+        :type port: str
+
+        :param registry: Registry to look up `SN` in. default: shared registry
+        :type registry: DeviceRegistry | None
+        """
+        if port == "":
+            port = (registry or defaultRegistry()).resolve(sn=SN)
+        self.SN = SN
         self.ser = serial.Serial(port, baudrate=9600, timeout=20)
+        self.transport = SerialTransport(self.ser, terminator=b"\r")
         self.readDrops = readDrops
+        self.sentinel = sentinel
+
+        self.queries = 0
+        self.retries = 0
 
+        self.state: dict[str, float | int | None] = {
+            name: None for name in STATE_COMMANDS
+        }
+
+    @traced("lockin", tags=lambda self, cmd, *a, **k: {"device": self.SN, "command": cmd})
     def _write(self, cmd: str) -> None:
-        senddata = cmd + "\n\r"
-        self.ser.write(senddata.encode())
-        return
-
-    def _write_read(self, cmd: str) -> str:
-        for _ in range(self.readDrops):
-            self._write(cmd)
-            kar = self.ser.read().decode()
-            feedback = kar
-            while kar != "\r":
-                kar = self.ser.read().decode()
-                feedback = feedback + kar
-            feedback = feedback.strip()
+        self.transport.write(cmd + "\n\r")
+
+    def _read_line(self) -> str:
+        return self.transport.readLine().strip()
+
+    @staticmethod
+    def _valid(feedback: str, fields: int | None) -> bool:
+        """Checks if a reply consists of `fields` comma separated numbers, any non-empty reply is valid for `None`."""
+        if fields is None:
+            return feedback != ""
+        values = feedback.split(",")
+        if len(values) != fields:
+            return False
+        try:
+            for v in values:
+                float(v)
+        except ValueError:
+            return False
+        return True
 
-        return feedback
+    @traced("lockin", tags=lambda self, cmd, *a, **k: {"device": self.SN, "command": cmd})
+    def _write_read(self, cmd: str, fields: int | None = None) -> str:
+        """
+        Query the instrument
+
+        Drains stale input, writes `cmd` and reads a single reply. A reply that fails validation
+        (wrong number of fields, not numeric or a missing `OUTX?` sentinel) is discarded and the query
+        is repeated, up to `readDrops` attempts. Retries are counted in `retries`, see `queryStats`.
+
+        Returns the reply, empty on timeout or when no attempt gave a valid reply, so callers read it
+        as a bad read (NaN).
+        """
+        self.queries += 1
+        framed = self.sentinel if self.sentinel is not None else fields == 1
+        for attempt in range(self.readDrops):
+            if attempt > 0:
+                self.retries += 1
+
+            self.transport.reset_input_buffer()
+            if framed:
+                self._write(cmd + ";OUTX?")
+            else:
+                self._write(cmd)
+
+            feedback = self._read_line()
+            if framed and self._read_line() != "0":
+                continue
+            if self._valid(feedback, fields):
+                return feedback
+
+        # a reply without its sentinel may be stale or misaligned, it is no reading
+        return ""
+
+    def queryStats(self) -> dict[str, int | float]:
+        """
+        Query counters since connecting
+
+        Returns `queries`, `retries` and `retryRate` (retries per query).
+        """
+        return {
+            "queries": self.queries,
+            "retries": self.retries,
+            "retryRate": self.retries / self.queries if self.queries > 0 else 0.0,
+        }
+
+    def invalidateState(self) -> None:
+        """Forget the cached configuration, it is queried again on next use."""
+        for name in self.state:
+            self.state[name] = None
+
+    def checkExternalChanges(self) -> bool:
+        """
+        Checks the front panel has been touched since the last check
+
+        Reads (and clears) the standard event status byte, the cached configuration is dropped
+        when a key press or knob rotation was registered.
+
+        Returns `True` if the cache was invalidated.
+        """
+        feedback = self._write_read("*ESR?", fields=1)
+        try:
+            esr = int(feedback)
+        except ValueError:
+            self.invalidateState()
+            return True
+
+        if esr & ESR_USER_REQUEST:
+            self.invalidateState()
+            return True
+        return False
+
+    def getState(self, name: str) -> float | int:
+        """
+        Cached configuration value
+
+        Queries the instrument only if `name` is not cached, see `STATE_COMMANDS`.
+
+        Returns value or NaN on bad read.
+        """
+        if name not in STATE_COMMANDS:
+            raise KeyError(f"Unknown state '{name}'!")
+        if self.state[name] is None:
+            feedback = self._write_read(STATE_COMMANDS[name] + "?", fields=1)
+            try:
+                value = float(feedback)
+            except ValueError:
+                return nan
+            self.state[name] = int(value) if name in STATE_LIMITS else value
+        return self.state[name]
+
+    def refreshState(self) -> dict[str, float | int | None]:
+        """Queries the full configuration again, returns the new state."""
+        self.invalidateState()
+        for name in STATE_COMMANDS:
+            self.getState(name)
+        return dict(self.state)
+
+    def configure(self, **settings: float | int) -> None:
+        """
+        Apply several settings at once
+
+        Settings already in the cache are skipped, the rest is sent as one `;` separated write followed
+        by a single `*ESR?` verification read. Keywords are names from `STATE_COMMANDS`, values are the
+        indices of the respective set methods, e.g.
+        `configure(sensitivity=20, timeConstant=8, slope=1, reserve=1)`.
+        """
+        for name, value in settings.items():
+            if name not in STATE_COMMANDS:
+                raise KeyError(f"Unknown setting '{name}'!")
+            if name in STATE_LIMITS:
+                low, high = STATE_LIMITS[name]
+                if not low <= value <= high:
+                    raise IndexError(f"Index {value} for '{name}' out of range! ({low} - {high})")
+
+        changes = {
+            name: value for name, value in settings.items() if self.state[name] != value
+        }
+        if len(changes) == 0:
+            return
+
+        commands = [f"{STATE_COMMANDS[name]} {value}" for name, value in changes.items()]
+        feedback = self._write_read(";".join(commands + ["*ESR?"]), fields=1)
+        try:
+            esr = int(feedback)
+        except ValueError:
+            self.invalidateState()
+            raise ConnectionError(f"No verification for '{';'.join(commands)}'!")
+
+        if esr & ESR_USER_REQUEST:
+            self.invalidateState()
+        if esr & (ESR_EXECUTION_ERROR | ESR_COMMAND_ERROR):
+            self.invalidateState()
+            raise ValueError(f"Lock-in rejected '{';'.join(commands)}' (ESR {esr})!")
+
+        self.state.update(changes)
 
     def setFrequency(self, frequency: float) -> None:
         """
@@ -70,7 +314,7 @@ class SR830:
         Reads current frequency set or NaN on bad read.
         """
         command = "FREQ?"
-        feedback = self._write_read(command)
+        feedback = self._write_read(command, fields=1)
         try:
             freq = float(feedback)
         except ValueError:
@@ -86,6 +330,7 @@ class SR830:
         command = "SLVL " + str(self.sine_out_amplitude)
 
         self._write(command)
+        self.state["amplitude"] = self.sine_out_amplitude
 
     def readAmplitude(self) -> float:
         """
@@ -93,11 +338,12 @@ class SR830:
 
         Returns amplitude or NaN on bad read.
         """
-        rawA = self._write_read("outp? 3")
+        rawA = self._write_read("outp? 3", fields=1)
         try:
             amp = round(float(rawA), 6)
         except ValueError:
             amp = nan
+        getMetrics().checkNan(amp)
         return amp
 
     def readPhase(self) -> float:
@@ -107,18 +353,63 @@ class SR830:
         Returns current phase or NaN on bad read.
         """
         command = "OUTP? 4"
-        feedback = self._write_read(command)
+        feedback = self._write_read(command, fields=1)
 
         try:
             pha = float(feedback)
         except ValueError:
             pha = nan
 
+        getMetrics().checkNan(pha)
         return pha
     
+    def snap(self, *params: str) -> np.record:
+        """
+        Read several parameters at the same instant
+
+        Uses `SNAP?`, so all values are sampled together and read back in a single query.
+        Accepts 2 to 6 names from `SNAP_PARAMETERS`, default: `("R", "theta", "X", "Y")`.
+
+        | name   | parameter           |
+        |--------|---------------------|
+        | X      | X (V)               |
+        | Y      | Y (V)               |
+        | R      | R (V)               |
+        | theta  | \u03b8 (deg)          |
+        | aux1-4 | Aux In 1-4 (V)      |
+        | freq   | Reference frequency |
+        | ch1    | CH1 display         |
+        | ch2    | CH2 display         |
+
+        Returns a numpy record with a field per parameter, fields are NaN on bad read.
+        """
+        if len(params) == 0:
+            params = ("R", "theta", "X", "Y")
+        if not 2 <= len(params) <= 6:
+            raise ValueError(f"SNAP? takes 2 to 6 parameters, got {len(params)}!")
+        for p in params:
+            if p not in SNAP_PARAMETERS:
+                raise KeyError(f"Unknown SNAP? parameter '{p}'!")
+
+        command = "SNAP? " + ",".join(str(SNAP_PARAMETERS[p]) for p in params)
+        feedback = self._write_read(command, fields=len(params))
+
+        try:
+            values = [float(v) for v in feedback.split(",")]
+            if len(values) != len(params):
+                raise ValueError
+        except ValueError:
+            values = len(params) * [nan]
+
+        getMetrics().checkNan(*values)
+        return np.rec.fromrecords([tuple(values)], names=list(params))[0]
+
     def readSensitivity(self):
         command = "SENS?"
-        return self._write_read(command)
+        feedback = self._write_read(command, fields=1)
+        if self._valid(feedback, 1):
+            self.state["sensitivity"] = int(float(feedback))
+        return feedback
 
     def setSensitivity(self, index: int) -> None:
         """
@@ -163,10 +454,131 @@ class SR830:
             raise IndexError(f"Index {index} is too high! (Max 26)")
         command = f"SENS {index}"
         self._write(command)
+        self.state["sensitivity"] = index
+
+    def readOverload(self) -> int:
+        """
+        Read overload status
+
+        Reads (and clears) the LIA status byte, returns its input, filter and output overload bits
+        (`LIAS_*_OVERLOAD`), 0 if there was no overload. Treats a bad read as an output overload.
+        """
+        feedback = self._write_read("LIAS?", fields=1)
+        try:
+            status = int(feedback)
+        except ValueError:
+            return LIAS_OUTPUT_OVERLOAD
+        return status & (LIAS_INPUT_OVERLOAD | LIAS_FILTER_OVERLOAD | LIAS_OUTPUT_OVERLOAD)
+
+    def autoRange(
+        self,
+        amplitude: float,
+        upper: float = 0.8,
+        lower: float = 0.15,
+        checkOverload: bool = True,
+        maxStep: int = 1,
+    ) -> bool:
+        """
+        Steps the sensitivity to fit a reading
+
+        Goes up a range on an overload (`LIAS?`) or when `amplitude` is above `upper` of full scale,
+        and down when it is below `lower`. A new range puts the reading at about half scale, but moves
+        at most `maxStep` ranges per call in either direction: a single low reading (e.g. not settled)
+        can not send a signal near full scale to the most sensitive range, and from there back up one
+        overload at a time. With the 1-2-5 ranges, one step and the gap between `lower` and `upper`
+        keep the next reading from switching back.
+
+        :param amplitude: Latest R reading, in V.
+        :type amplitude: float
+
+        :param upper: Fraction of full scale above which the range is increased. default: `0.8`
+        :type upper: float
+
+        :param lower: Fraction of full scale below which the range is decreased. default: `0.15`
+        :type lower: float
+
+        :param checkOverload: Also read the overload bits, costs a query. default: `True`
+        :type checkOverload: bool
+
+        :param maxStep: Most ranges to change the sensitivity by per call. default: `1`
+        :type maxStep: int
+
+        :returns: `True` if the sensitivity changed and the reading has to be repeated after settling.
+        :rtype: bool
+        """
+        index = self.getState("sensitivity")
+        if not np.isfinite(index):
+            return False
+        index = int(index)
+        fullScale = SENSITIVITIES[index]
+
+        overload = self.readOverload() if checkOverload else 0
+        if overload or not np.isfinite(amplitude):
+            newIndex = index + 1
+        elif amplitude > upper * fullScale or amplitude < lower * fullScale:
+            fits = [
+                i for i, sens in enumerate(SENSITIVITIES) if abs(amplitude) <= 0.5 * sens
+            ]
+            newIndex = fits[0] if len(fits) > 0 else len(SENSITIVITIES) - 1
+        else:
+            return False
+
+        newIndex = min(max(newIndex, index - maxStep, 0), index + maxStep, len(SENSITIVITIES) - 1)
+        if newIndex == index:
+            return False
+        self.setSensitivity(newIndex)
+        return True
 
     def readTimeConstant(self):
         command = "OFLT?"
-        return self._write_read(command)
+        feedback = self._write_read(command, fields=1)
+        if self._valid(feedback, 1):
+            self.state["timeConstant"] = int(float(feedback))
+        return feedback
+
+    def readFilterSlope(self):
+        command = "OFSL?"
+        feedback = self._write_read(command, fields=1)
+        if self._valid(feedback, 1):
+            self.state["slope"] = int(float(feedback))
+        return feedback
+
+    def setFilterSlope(self, index: int) -> None:
+        """
+        Sets the low pass filter slope
+
+        | index | slope      |
+        |-------|------------|
+        | 0     | 6 dB/oct   |
+        | 1     | 12 dB/oct  |
+        | 2     | 18 dB/oct  |
+        | 3     | 24 dB/oct  |
+        """
+        if index < 0:
+            raise IndexError(f"Index {index} is too low! (Min 0)")
+        elif index > 3:
+            raise IndexError(f"Index {index} is too high! (Max 3)")
+        command = f"OFSL {index}"
+        self._write(command)
+        self.state["slope"] = index
+
+    def setReserve(self, index: int) -> None:
+        """
+        Sets the reserve mode
+
+        | index | reserve      |
+        |-------|--------------|
+        | 0     | High Reserve |
+        | 1     | Normal       |
+        | 2     | Low Noise    |
+        """
+        if index < 0:
+            raise IndexError(f"Index {index} is too low! (Min 0)")
+        elif index > 2:
+            raise IndexError(f"Index {index} is too high! (Max 2)")
+        command = f"RMOD {index}"
+        self._write(command)
+        self.state["reserve"] = index
 
     def setTimeConstant(self, index: int) -> None:
         """
@@ -201,14 +613,163 @@ class SR830:
             raise IndexError(f"Index {index} is too low! (Min 0)")
         elif index > 19:
             raise IndexError(f"Index {index} is too high! (Max 19)")
-        table = [10e-6, 30e-6, 100e-6, 300e-6, 1e-3, 3e-3, 10e-3, 30e-3, 100e-3, 300e-3, 1e0, 3e0, 10e0, 30e0, 100e0, 300e0, 1e3, 3e3, 10e3, 30e3]
+        table = TIME_CONSTANTS
         freq = self.readFrequency()
-        if table[index]/freq > 1:
+        if table[index] * freq > 1:
             command = f"OFLT {index}"
             self._write(command)
+            self.state["timeConstant"] = index
         else:
             raise ValueError(f"Frequency of '{freq}' is too low for time constant '{table[index]}'!")
 
+    def configureBuffer(
+        self, rateIndex: int = 13, loop: bool = False, triggerStart: bool = False
+    ) -> None:
+        """
+        Sets up the internal data buffer for a buffered acquisition
+
+        CH1 is set to display R and CH2 to display \u03b8, these are the values stored in the buffer.
+        Clears the buffer.
+
+        :param rateIndex: `SRAT` index, see `SAMPLE_RATES`, 14 samples on the external trigger. default: `13` (512 Hz)
+        :type rateIndex: int
+
+        :param loop: Keep filling the buffer from the start when it is full, otherwise stop when full. default: `False`
+        :type loop: bool
+
+        :param triggerStart: Start the acquisition on an external trigger instead of `startBuffer`. default: `False`
+        :type triggerStart: bool
+        """
+        if rateIndex < 0:
+            raise IndexError(f"Index {rateIndex} is too low! (Min 0)")
+        elif rateIndex > 14:
+            raise IndexError(f"Index {rateIndex} is too high! (Max 14)")
+        self._write("DDEF 1,1,0")
+        self._write("DDEF 2,1,0")
+        self._write(f"SRAT {rateIndex}")
+        self._write(f"SEND {int(loop)}")
+        self._write(f"TSTR {int(triggerStart)}")
+        self.resetBuffer()
+
+    def startBuffer(self) -> None:
+        """Starts or resumes filling the data buffer."""
+        self._write("STRT")
+
+    def pauseBuffer(self) -> None:
+        """Pauses filling the data buffer."""
+        self._write("PAUS")
+
+    def resetBuffer(self) -> None:
+        """Clears the data buffer."""
+        self._write("REST")
+
+    def readBufferLength(self) -> int:
+        """
+        Read number of points stored in the buffer
+
+        Returns 0 on bad read.
+        """
+        feedback = self._write_read("SPTS?", fields=1)
+        try:
+            points = int(feedback)
+        except ValueError:
+            points = 0
+        return points
+
+    @traced("lockin", tags=lambda self, channel, *a, **k: {"device": self.SN, "command": f"TRCB? {channel}"})
+    def readBuffer(
+        self, channel: int, start: int = 0, count: int | None = None, lia: bool = False
+    ) -> np.ndarray:
+        """
+        Read stored points from the data buffer in binary
+
+        Transfers with `TRCB?` (IEEE float) or `TRCL?` (LIA format, half the conversion work on the
+        instrument) in blocks and decodes them straight into a numpy array.
+
+        :param channel: Buffer channel, 1 (CH1, R) or 2 (CH2, \u03b8).
+        :type channel: int
+
+        :param start: First point to read. default: `0`
+        :type start: int
+
+        :param count: Number of points to read, all stored points from `start` on `None`. default: `None`
+        :type count: int | None
+
+        :param lia: Use `TRCL?` instead of `TRCB?`. default: `False`
+        :type lia: bool
+
+        :returns: Buffer values, shorter than `count` if the transfer timed out.
+        :rtype: ndarray[float32]
+        """
+        if channel not in [1, 2]:
+            raise ValueError(f"Buffer channel {channel} does not exist! (1 or 2)")
+        if count is None:
+            count = self.readBufferLength() - start
+
+        blocks = []
+        block = 4096
+        for offset in range(start, start + count, block):
+            n = min(block, start + count - offset)
+            self.transport.reset_input_buffer()
+            self._write(f"{'TRCL' if lia else 'TRCB'}? {channel},{offset},{n}")
+            raw = self.transport.readExact(4 * n)
+            raw = raw[: len(raw) - len(raw) % 4]
+            if lia:
+                words = np.frombuffer(raw, dtype=[("m", "<i2"), ("e", "<i2")])
+                blocks.append(
+                    (words["m"] * np.exp2(words["e"].astype(np.float32) - 124)).astype(
+                        np.float32
+                    )
+                )
+            else:
+                blocks.append(np.frombuffer(raw, dtype="<f4"))
+            if len(raw) < 4 * n:
+                break
+
+        if len(blocks) == 0:
+            return np.empty(0, dtype=np.float32)
+        return np.concatenate(blocks)
+
+    def acquire(self, duration: float, rateIndex: int = 13, lia: bool = False) -> np.ndarray:
+        """
+        Record a time series of R and \u03b8 with the data buffer
+
+        Fills the buffer for `duration` seconds at `SAMPLE_RATES[rateIndex]` and transfers it in bulk.
+        Far faster than polling `readAmplitude`/`readPhase`, use for time-series measurements and averaging.
+
+        :param duration: Acquisition time in seconds, limited by `BUFFER_SIZE` points.
+        :type duration: float
+
+        :param rateIndex: `SRAT` index, see `SAMPLE_RATES`. default: `13` (512 Hz)
+        :type rateIndex: int
+
+        :returns: Record array with fields `t` (s since start), `R` (V) and `theta` (deg).
+        :rtype: np.recarray
+        """
+        if not 0 <= rateIndex <= 13:
+            raise IndexError(f"Index {rateIndex} is not a sample rate! (0 - 13)")
+        rate = SAMPLE_RATES[rateIndex]
+        if duration * rate > BUFFER_SIZE:
+            raise ValueError(
+                f"{duration} s at {rate} Hz does not fit the buffer of {BUFFER_SIZE} points!"
+            )
+
+        self.configureBuffer(rateIndex)
+        self.startBuffer()
+        clock.sleep(duration)
+        self.pauseBuffer()
+
+        points = self.readBufferLength()
+        R = self.readBuffer(1, 0, points, lia=lia)
+        theta = self.readBuffer(2, 0, points, lia=lia)
+        n = min(len(R), len(theta))
+
+        data = np.recarray(n, dtype=[("t", np.float64), ("R", np.float32), ("theta", np.float32)])
+        data.t = np.arange(n) / rate
+        data.R = R[:n]
+        data.theta = theta[:n]
+        return data
+
     def close(self) -> None:
         self.ser.close()
 
@@ -217,3 +778,44 @@ class SR830:
 
     def __exit__(self, exc_type, exc_val, exc_tb) -> None:
         self.close()
+
+
+class AsyncSR830:
+    """
+    asyncio front end for an `SR830`
+
+    Every call runs the blocking driver in one worker thread per lock-in, so commands to one
+    instrument stay in order while different lock-ins are read concurrently, e.g.
+    `await asyncio.gather(normal.snap(), shear.snap())` takes as long as the slowest of both.
+    """
+
+    def __init__(self, ctrl: SR830) -> None:
+        self.ctrl = ctrl
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="SR830")
+
+    async def run(self, func, *args, **kwargs):
+        """Runs any blocking `func(*args, **kwargs)` in the worker thread of this lock-in."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+    async def read_amplitude(self) -> float:
+        return await self.run(self.ctrl.readAmplitude)
+
+    async def read_phase(self) -> float:
+        return await self.run(self.ctrl.readPhase)
+
+    async def read_frequency(self) -> float:
+        return await self.run(self.ctrl.readFrequency)
+
+    async def snap(self, *params: str) -> np.record:
+        return await self.run(self.ctrl.snap, *params)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        self.ctrl.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
@@ -6,11 +6,20 @@ At resonance, the amplitude will be greatest and the phase shift at 0.
 """
 
 import numpy as np
-import time
 from LockIn_Amplifier import SR830  # Ensure sfa.py is in the same directory
 from rigol_dg1022 import RigolDG
+from settle import Settler, dwell
+from metrics import getMetrics
+from profiler import traced
+from scheduler import Job, readAmplitude, readSnap, run, runInterleaved
+from estimator import ResonanceEstimator
 
 
+LINEAR_PHASE: float = 30.0
+"""Phase in deg up to which the phase is close enough to linear in frequency to interpolate the zero."""
+
+
+@traced("pll")
 def PLL1D(
     ctrl: SR830,
     freqGen: RigolDG,
@@ -34,75 +43,159 @@ def PLL1D(
     :param debugPrint: If results should constantly be printed, default: False
     :type debugPrint: bool
 
-    :returns: [fRes, ampRes, phaRes]
-    :rtype: list[float]
-    """
-    debugPrint: bool = kwargs.get("debugPrint", False)
-    freqs = np.linspace(freqMin, freqMax, points)
-    amplitudes = np.zeros_like(freqs)
+    :param settle: Wait the predicted settle time after each step instead of `delay`, default: None
+    :type settle: Settler | None
 
-    for i, f in enumerate(freqs):
-        freqGen.set_frequency(freqGenChannel, f)
-        time.sleep(delay)
+    :param solver: `"proportional"` steps `Kp * phase`, `"secant"` steps to the zero of the phase using the phase slope of the last two readings, default: "proportional"
+    :type solver: str
 
-        amp = ctrl.readAmplitude()
+    :param slope: Initial phase slope dθ/df in deg/Hz for the secant solver and the linewidth prior of the estimator, the first secant step is a `Kp` step without it, default: None
+    :type slope: float | None
 
-        amplitudes[i] = amp
+    :param coarse: Initial guess from the coarse sweep, `"argmax"` of the amplitude, `"fit"` of the oscillator model to amplitude and phase up to the first point past resonance, or `"adaptive"` to bracket the phase zero with at most `points` readings before the fit; both need fewer readings than `"argmax"` for a less accurate guess, the adaptive readings are followed by a double dwell at the guess unless `settle` predicts it, default: "argmax"
+    :type coarse: str
 
-    best_index = np.argmax(amplitudes)
-    fRes: float = freqs[best_index]
+    :param guess: Start the lock at this frequency without a coarse sweep, `freqMin` to `freqMax` then only limits the secant steps, default: None
+    :type guess: float | None
 
-    if debugPrint:
-        print(f"Initial guess from amplitude sweep: {fRes:.3f} Hz")
+    :param precision: Stop once a `ResonanceEstimator` fed with every reading knows fRes to this standard deviation in Hz and the phase is within `tolerance`; fRes is then its estimate. With a `guess` and no `slope` or `settle` its linewidth prior is wide, default: None
+    :type precision: float | None
+
+    :param phaseNoise: Standard deviation of a phase reading in deg for the estimator, default: 0.5
+    :type phaseNoise: float
 
-    freqGen.set_frequency(freqGenChannel, fRes)
-    time.sleep(delay)
+    :returns: [fRes, ampRes, phaRes]
+    :rtype: list[float]
+    """
+    settle: Settler | None = kwargs.get("settle", None)
+    steps = __PLL1DSteps(freqMin, freqMax, points, tolerance, iterations, Kp, **kwargs)
+    return run(Job(steps, ctrl, freqGenChannel, settle), freqGen, delay)
+
+
+def __PLL1DSteps(
+    freqMin: float,
+    freqMax: float,
+    points: int,
+    tolerance: float,
+    iterations: int,
+    Kp: float,
+    **kwargs,
+):
+    """Steps of `PLL1D` for the scheduler, returns [fRes, ampRes, phaRes]."""
+    debugPrint: bool = kwargs.get("debugPrint", False)
+    settle: Settler | None = kwargs.get("settle", None)
+    solver: str = kwargs.get("solver", "proportional")
+    if solver not in ["proportional", "secant"]:
+        raise ValueError(f"Unknown solver '{solver}'!")
+    coarse: str = kwargs.get("coarse", "argmax")
+    if coarse not in ["argmax", "fit", "adaptive"]:
+        raise ValueError(f"Unknown coarse search '{coarse}'!")
+    metrics = getMetrics()
+    metrics.count("pllRuns")
+    guess: float | None = kwargs.get("guess", None)
+    precision: float | None = kwargs.get("precision", None)
+    if guess is None:
+        fRes, fitSlope, fLast, coarseAmplitude = yield from __coarseSteps(freqMin, freqMax, points, coarse)
+        if debugPrint:
+            print(f"Initial guess from {coarse} coarse search: {fRes:.3f} Hz")
+    else:
+        fRes, fitSlope, fLast, coarseAmplitude = guess, None, np.inf, np.nan
 
-    phaseDeg = ctrl.readPhase()
+    # the adaptive readings jump by up to half the range right before this one, which decides whether
+    # the lock is done already: without a Settler it waits two delays
+    dwells = 2 if guess is None and coarse == "adaptive" else 1
+    reading = yield (fRes, fRes - fLast, readSnap, dwells)
+    phaseDeg = reading["theta"]
 
     if debugPrint:
         print(f"Iteration -1: Frequency = {fRes:.6f} Hz, Phase = {phaseDeg:.2f} deg")
 
-    if abs(np.deg2rad(phaseDeg)) < tolerance:
-        return [fRes, ctrl.readAmplitude(), phaseDeg]
+    estimator: ResonanceEstimator | None = None
+    if precision is not None:
+        # the coarse search gives the prior: its spacing bounds the guess, its slope the linewidth
+        slope = kwargs.get("slope", fitSlope if fitSlope is not None else __phaseSlope(settle))
+        if slope is not None:
+            linewidth = -360 / (np.pi * slope)
+            linewidthStd = linewidth / 2
+        elif guess is None:
+            linewidth = (freqMax - freqMin) / 4
+            linewidthStd = linewidth / 2
+        else:
+            # a bracket around a guess says nothing about the linewidth, a wide prior around Q = 1000
+            linewidth = fRes / 1000
+            linewidthStd = fRes / 250
+        spread = (freqMax - freqMin) / max(points - 1, 1) if guess is None else (freqMax - freqMin) / 2
+        amplitude = np.nanmax([coarseAmplitude, float(reading["R"])])
+        estimator = ResonanceEstimator(
+            fRes,
+            linewidth,
+            amplitude,
+            std=(max(spread, linewidth), linewidthStd, amplitude / 2),
+            phaseNoise=kwargs.get("phaseNoise", 0.5),
+        )
+        if __estimated(estimator, precision, fRes, reading, tolerance, debugPrint):
+            return [estimator.fRes, reading["R"], phaseDeg]
+    elif abs(np.deg2rad(phaseDeg)) < tolerance:
+        return [fRes, reading["R"], phaseDeg]
+
+    if solver == "secant":
+        return (
+            yield from __secantSteps(
+                fRes,
+                reading,
+                tolerance,
+                iterations,
+                Kp,
+                slope=kwargs.get("slope", fitSlope if fitSlope is not None else __phaseSlope(settle)),
+                maxStep=(freqMax - freqMin) / max(points - 1, 1),
+                debugPrint=debugPrint,
+                estimator=estimator,
+                precision=precision,
+            )
+        )
 
     fPrev = fRes
     phasePrev = phaseDeg
     fRes = fRes + Kp * np.deg2rad(phaseDeg)
 
     for i in range(iterations):
-        freqGen.set_frequency(freqGenChannel, fRes)
-        time.sleep(delay)
+        reading = yield (fRes, fRes - fPrev, readSnap)
+        metrics.count("pllIterations")
 
-        phaseDeg = ctrl.readPhase()
+        phaseDeg = reading["theta"]
         if debugPrint:
             print(
                 f"Iteration {i:3d}: Frequency = {fRes:.6f} Hz, Phase = {phaseDeg:.2f} deg"
             )
 
-        if abs(np.deg2rad(phaseDeg)) < tolerance:
+        if estimator is not None:
+            # the estimate decides alone, a single noisy phase near zero proves nothing
+            if __estimated(estimator, precision, fRes, reading, tolerance, debugPrint):
+                return [estimator.fRes, reading["R"], phaseDeg]
+        elif abs(np.deg2rad(phaseDeg)) < tolerance:
             if phaseDeg * phasePrev < 0:
                 f_interp = fPrev - phasePrev * (fPrev - fRes) / (phasePrev - phaseDeg)
                 if debugPrint:
                     print(f"  → Interpolated f_res = {f_interp:.6f} Hz")
-                return [f_interp, ctrl.readAmplitude(), phaseDeg]
+                return [f_interp, reading["R"], phaseDeg]
             else:
                 if debugPrint:
                     print(f"  → In tolerenace, f_res = {fRes:.6f} Hz")
-                return [fRes, ctrl.readAmplitude(), phaseDeg]
+                return [fRes, reading["R"], phaseDeg]
 
-        if phasePrev * phaseDeg < 0:
+        elif phasePrev * phaseDeg < 0:
             f_interp = fPrev - phasePrev * (fRes - fPrev) / (phaseDeg - phasePrev)
             if debugPrint:
                 print(f"  → Sign change, interpolated f_res = {f_interp:.6f} Hz")
-            return [f_interp, ctrl.readAmplitude(), phaseDeg]
+            return [f_interp, reading["R"], phaseDeg]
 
         fPrev = fRes
         phasePrev = phaseDeg
         fRes = fRes + Kp * np.deg2rad(phaseDeg)
 
     else:
-        opt = [fRes, ctrl.readAmplitude(), phaseDeg]
+        opt = [estimator.fRes if estimator is not None else fRes, reading["R"], phaseDeg]
+        metrics.count("pllNotConverged")
         if debugPrint:
             print(
                 "Maximum iterations reached without full convergence in the PLL loop."
@@ -111,6 +204,438 @@ def PLL1D(
     return opt
 
 
+def __resonanceFit(
+    freqs: np.ndarray, amplitudes: np.ndarray, phasesDeg: np.ndarray
+) -> tuple[float, float] | None:
+    """
+    Fit the driven oscillator to amplitude and phase
+
+    The lock-in reading `Z = R e^{iθ}` of the oscillator is `c / (f0² - f² + iγf)`, same model as
+    `AnalysisFunctions.A` and `AnalysisFunctions.phase` with γ = 2 ξ f0 and the phase offset in the
+    complex `c`. `c / Z` is linear in f0², γ and c, so the fit is a single weighted least squares
+    solve of both amplitude and phase without start values.
+
+    Returns (f0, γ) in Hz, or `None` if there are too few readings or the fit is not physical.
+    """
+    valid = np.isfinite(amplitudes) & np.isfinite(phasesDeg) & (amplitudes > 0)
+    if np.count_nonzero(valid) < 3:
+        return None
+    f = freqs[valid]
+    Z = amplitudes[valid] * np.exp(1j * np.deg2rad(phasesDeg[valid]))
+    u = 1 / Z
+
+    # f² = f0² - Re(c u), 0 = γ f - Im(c u), unknowns [f0², γ, Re c, Im c]
+    zeros, ones = np.zeros_like(f), np.ones_like(f)
+    M = np.concatenate(
+        [
+            np.column_stack([ones, zeros, -u.real, u.imag]),
+            np.column_stack([zeros, f, -u.imag, -u.real]),
+        ]
+    )
+    b = np.concatenate([f**2, zeros])
+    # weight by |Z|, readings near resonance carry the information and the least noise in 1/Z
+    w = np.tile(np.abs(Z) / np.max(np.abs(Z)), 2)
+    try:
+        (f0Squared, gamma, _, _), *_ = np.linalg.lstsq(M * w[:, None], b * w, rcond=None)
+    except np.linalg.LinAlgError:
+        return None
+
+    if f0Squared <= 0 or gamma <= 0:
+        return None
+    return float(np.sqrt(f0Squared)), float(gamma)
+
+
+def __coarseSteps(freqMin: float, freqMax: float, points: int, coarse: str):
+    """
+    Initial resonance guess of `PLL1D`
+
+    `"argmax"` reads the amplitude on `points` evenly spaced frequencies and takes the largest.
+    `"fit"` reads amplitude and phase on the same frequencies upwards until the phase turns negative
+    after a positive reading, i.e. the resonance was passed, and fits the oscillator model.
+    `"adaptive"` reads both ends of the range and then halves the bracket around the phase zero
+    (positive below, negative above resonance) until a reading lies in the near-linear part of the
+    phase or `points` readings are taken, then fits the model to all readings.
+
+    Both fits trade accuracy of the guess for readings: `"fit"` skips the points above the resonance
+    and its guess is off by up to a few mHz instead of a few µHz, `"adaptive"` jumps by up to half the
+    range between readings that then have not fully settled after a fixed `delay`, its guess can be
+    off by some 10 mHz. The lock corrects both, as long as its first reading has settled.
+
+    Steps for the scheduler, returns (guess, phase slope at resonance in deg/Hz or `None`, last
+    frequency set, largest amplitude read).
+    """
+    metrics = getMetrics()
+
+    def read(f: float, fPrev: float):
+        if coarse == "argmax":
+            amplitude = yield (f, f - fPrev, readAmplitude)
+            return float(amplitude), np.nan
+        reading = yield (f, f - fPrev, readSnap)
+        return float(reading["R"]), float(reading["theta"])
+
+    readings: list[tuple[float, float, float]] = []
+    if coarse == "adaptive":
+        lo, hi = freqMin, freqMax
+        fPrev = np.inf
+        for f in [freqMin, freqMax]:
+            readings.append((f, *(yield from read(f, fPrev))))
+            fPrev = f
+        bracketed = readings[0][2] > 0 > readings[1][2]
+        while bracketed and len(readings) < points:
+            f = (lo + hi) / 2
+            readings.append((f, *(yield from read(f, fPrev))))
+            fPrev = f
+            phaseDeg = readings[-1][2]
+            if abs(phaseDeg) <= LINEAR_PHASE:
+                break
+            if phaseDeg > 0:
+                lo = f
+            else:
+                hi = f
+        if not bracketed:
+            # no phase zero between the ends, fall back on the evenly spaced sweep
+            for f in np.linspace(freqMin, freqMax, max(points - 2, 1) + 2)[1:-1]:
+                readings.append((f, *(yield from read(f, fPrev))))
+                fPrev = f
+            lo, hi = freqMin, freqMax
+    else:
+        freqs = np.linspace(freqMin, freqMax, points)
+        for i, f in enumerate(freqs):
+            readings.append((f, *(yield from read(f, freqs[i - 1] if i > 0 else np.inf))))
+            if coarse == "fit" and readings[-1][2] < 0 and any(phase > 0 for _, _, phase in readings):
+                break
+        lo, hi = freqMin, freqMax
+
+    freqs, amplitudes, phases = (np.array(column) for column in zip(*readings))
+    fLast = float(freqs[-1])
+    finite = np.any(np.isfinite(amplitudes))
+    guess = float(freqs[np.nanargmax(amplitudes)]) if finite else fLast
+    amplitude = float(np.nanmax(amplitudes)) if finite else np.nan
+    if coarse == "argmax":
+        return guess, None, fLast, amplitude
+
+    fit = __resonanceFit(freqs, amplitudes, phases)
+    if fit is None or not lo <= fit[0] <= hi:
+        metrics.count("coarseFitRejected")
+        return guess, None, fLast, amplitude
+    f0, gamma = fit
+    return f0, -360 / (np.pi * gamma), fLast, amplitude
+
+
+def __estimated(
+    estimator: ResonanceEstimator,
+    precision: float,
+    f: float,
+    reading: np.record,
+    tolerance: float,
+    debugPrint: bool = False,
+) -> bool:
+    """
+    Updates `estimator` with the reading at `f`, returns if it knows the resonance to `precision` Hz
+    and the phase of the reading is within `tolerance` in rad.
+
+    The estimate only holds as far as its prior does, a phase that is still off shows a lock that is not done.
+    """
+    estimator.update(f, float(reading["R"]), float(reading["theta"]))
+    if debugPrint:
+        print(f"  → Estimate f_res = {estimator.fRes:.6f} ± {estimator.fResStd:.6f} Hz")
+    if estimator.known(precision) and abs(np.deg2rad(float(reading["theta"]))) < tolerance:
+        getMetrics().count("estimatorStops")
+        return True
+    return False
+
+
+def __phaseSlope(settle: Settler | None) -> float | None:
+    """Phase slope at resonance in deg/Hz, -2 / linewidth rad/Hz, if the settler knows the linewidth."""
+    if settle is None or settle.linewidth is None:
+        return None
+    return -360 / (np.pi * settle.linewidth)
+
+
+def __secantSteps(
+    fRes: float,
+    reading: np.record,
+    tolerance: float,
+    iterations: int,
+    Kp: float,
+    slope: float | None = None,
+    maxStep: float = np.inf,
+    debugPrint: bool = False,
+    estimator: ResonanceEstimator | None = None,
+    precision: float | None = None,
+):
+    """
+    Lock onto the phase zero with secant steps
+
+    The phase slope dθ/df is estimated from the last two readings, so each step is a Newton step on
+    the phase regardless of the damping. Once the zero is bracketed by a positive and a negative phase,
+    a step that leaves the bracket (or a slope with the wrong sign) is replaced by a regula falsi step.
+    Steps are limited to `maxStep`, the phase flattens far from resonance.
+
+    With an `estimator` the slope at resonance comes from its linewidth, which averages over all
+    readings instead of differencing the last two noisy ones, and the lock stops once the estimator
+    knows the resonance to `precision` Hz instead of at a phase within `tolerance`.
+
+    `reading` is the record of R and θ at `fRes`. Steps for the scheduler, returns [fRes, ampRes,
+    phaRes] like `PLL1D`.
+    """
+    metrics = getMetrics()
+    phaseDeg = float(reading["theta"])
+    # (frequency, phase, iteration) of the last reading below (positive phase) and above resonance
+    below: tuple[float, float, int] | None = None
+    above: tuple[float, float, int] | None = None
+    fallbacks = 0
+
+    for i in range(iterations):
+        # the phase falls with frequency, a reading contradicting the bracket replaces its other end
+        if phaseDeg > 0:
+            if above is not None and fRes >= above[0]:
+                above = None
+            below = (fRes, phaseDeg, i)
+        else:
+            if below is not None and fRes <= below[0]:
+                below = None
+            above = (fRes, phaseDeg, i)
+
+        if slope is not None and slope < 0:
+            step = -phaseDeg / slope
+        else:
+            step = Kp * np.deg2rad(phaseDeg)
+        fNext = fRes + float(np.clip(step, -maxStep, maxStep))
+
+        if below is not None and above is not None:
+            lo, hi = sorted([below[0], above[0]])
+            if lo < fNext < hi:
+                fallbacks = 0
+            elif fallbacks < 2:
+                fallbacks += 1
+                fNext = below[0] - below[1] * (above[0] - below[0]) / (above[1] - below[1])
+            else:
+                # repeated fallbacks point at a bracket end read before it settled, read it again
+                fallbacks = 0
+                fNext = below[0] if below[2] < above[2] else above[0]
+
+        fPrev, phasePrev = fRes, phaseDeg
+        fRes = fNext
+        reading = yield (fRes, fRes - fPrev, readSnap)
+        metrics.count("pllIterations")
+
+        phaseDeg = float(reading["theta"])
+        if debugPrint:
+            print(f"Iteration {i:3d}: Frequency = {fRes:.6f} Hz, Phase = {phaseDeg:.2f} deg")
+
+        if estimator is not None:
+            if __estimated(estimator, precision, fRes, reading, tolerance, debugPrint):
+                return [estimator.fRes, reading["R"], phaseDeg]
+            slope = -360 / (np.pi * estimator.linewidth)
+            continue
+
+        if fRes != fPrev:
+            slope = (phaseDeg - phasePrev) / (fRes - fPrev)
+
+        # a sign change within the near-linear part of the phase gives the zero by interpolation
+        if abs(np.deg2rad(phaseDeg)) < tolerance or (
+            phaseDeg * phasePrev < 0 and max(abs(phaseDeg), abs(phasePrev)) <= LINEAR_PHASE
+        ):
+            if phaseDeg * phasePrev < 0:
+                fRes = fPrev - phasePrev * (fRes - fPrev) / (phaseDeg - phasePrev)
+                if debugPrint:
+                    print(f"  → Interpolated f_res = {fRes:.6f} Hz")
+            return [fRes, reading["R"], phaseDeg]
+
+    metrics.count("pllNotConverged")
+    if debugPrint:
+        print("Maximum iterations reached without full convergence in the PLL loop.")
+    return [estimator.fRes if estimator is not None else fRes, reading["R"], phaseDeg]
+
+
+def __seedSearch2D(
+    ctrls: list[SR830],
+    freqGen: RigolDG,
+    ranges: list[list[float]],
+    points: list[int],
+    delay: float,
+    settle: list[Settler] | None,
+) -> tuple[list[float], list[float | None], list[float]]:
+    """
+    Initial guesses of both modes of `PLL2D`, reading both lock-ins in every dwell
+
+    Reads both ends of both ranges, then halves the bracket around each phase zero until that phase
+    is within `LINEAR_PHASE` (same as the `"adaptive"` coarse search of `PLL1D`). A mode without a
+    phase zero between its ends is read on evenly spaced frequencies instead. Each mode has at most
+    its `points` readings; the oscillator model fitted to them gives the guess and the phase slope.
+
+    Returns (guesses, phase slopes at resonance in deg/Hz or `None`, frequencies set last).
+    """
+    readings: list[list[tuple[float, float, float]]] = [[], []]
+    fSet = [np.inf, np.inf]
+
+    def read(freqs: list[float], channels: list[int] = [0, 1]) -> None:
+        for ch in channels:
+            if freqs[ch] != fSet[ch]:
+                freqGen.set_frequency(ch + 1, freqs[ch])
+        dwell(settle, delay, [f - fPrev for f, fPrev in zip(freqs, fSet)])
+        fSet[:] = freqs
+        for ch in channels:
+            reading = ctrls[ch].snap("R", "theta")
+            readings[ch].append((freqs[ch], float(reading["R"]), float(reading["theta"])))
+
+    read([r[0] for r in ranges])
+    read([r[1] for r in ranges])
+
+    bounds = [list(r) for r in ranges]
+    bracketed = [readings[ch][0][2] > 0 > readings[ch][1][2] for ch in range(2)]
+    # modes without a bracket are swept instead
+    planned = [
+        [] if bracketed[ch] else list(np.linspace(*ranges[ch], max(points[ch], 2))[1:-1])
+        for ch in range(2)
+    ]
+
+    def done(ch: int) -> bool:
+        if len(readings[ch]) >= points[ch]:
+            return True
+        if bracketed[ch]:
+            return len(readings[ch]) > 2 and abs(readings[ch][-1][2]) <= LINEAR_PHASE
+        return len(planned[ch]) == 0
+
+    while not (done(0) and done(1)):
+        freqs = list(fSet)
+        active = []
+        for ch in range(2):
+            if done(ch):
+                continue
+            active.append(ch)
+            freqs[ch] = sum(bounds[ch]) / 2 if bracketed[ch] else float(planned[ch].pop(0))
+        read(freqs, active)
+        for ch in active:
+            if bracketed[ch]:
+                bounds[ch][0 if readings[ch][-1][2] > 0 else 1] = freqs[ch]
+
+    seeds: list[float] = []
+    slopes: list[float | None] = []
+    for ch in range(2):
+        freqs, amplitudes, phases = (np.array(column) for column in zip(*readings[ch]))
+        fit = __resonanceFit(freqs, amplitudes, phases)
+        if fit is not None and bounds[ch][0] <= fit[0] <= bounds[ch][1]:
+            seeds.append(fit[0])
+            slopes.append(-360 / (np.pi * fit[1]))
+        else:
+            getMetrics().count("coarseFitRejected")
+            seeds.append(float(freqs[np.nanargmax(amplitudes)]))
+            slopes.append(None)
+    return seeds, slopes, fSet
+
+
+def __jointLock(
+    ctrls: list[SR830],
+    freqGen: RigolDG,
+    seeds: list[float],
+    slopes: list[float | None],
+    fSet: list[float],
+    tolerance: float,
+    iterations: int,
+    Kp: float,
+    delay: float,
+    settle: list[Settler] | None,
+    maxStep: list[float],
+    debugPrint: bool = False,
+    precision: float | None = None,
+    phaseNoise: float = 0.5,
+) -> tuple[list[float], list[float]]:
+    """
+    Lock both modes at once with Broyden steps on both phases
+
+    The Jacobian of (θNormal, θShear) over (fNormal, fShear) starts diagonal from the phase slopes (a
+    `Kp` step without one) and gets a rank one update after every step, which picks up the coupling
+    between the modes. A step that made the phases worse, e.g. after a reading that had not settled,
+    starts the Jacobian over instead. Every iteration sets both frequencies and reads both lock-ins
+    in one dwell.
+
+    With a `precision` in Hz each mode gets a `ResonanceEstimator`, and the lock stops once both know
+    their resonance to it; the estimates are then the frequencies returned.
+
+    Returns the iteration with the smallest phases as ([fNormal, normalAmp, normalPha],
+    [fShear, shearAmp, shearPha]) like `PLL2D`.
+    """
+    metrics = getMetrics()
+    diagonal = np.array([s if s is not None and s < 0 else -np.rad2deg(1) / Kp for s in slopes])
+    jacobian = np.diag(diagonal)
+    f = np.array(seeds, dtype=float)
+    fPrev, phasePrev = None, None
+    best: tuple[float, np.ndarray, np.ndarray, np.ndarray] | None = None
+    estimators: list[ResonanceEstimator] | None = None
+
+    for i in range(iterations):
+        for ch in range(2):
+            if f[ch] != fSet[ch]:
+                freqGen.set_frequency(ch + 1, f[ch])
+        dwell(settle, delay, list(f - np.asarray(fSet)))
+        fSet = list(f)
+        metrics.count("pllIterations")
+
+        readingNormal, readingShear = (ctrl.snap("R", "theta") for ctrl in ctrls)
+        amplitude = np.array([float(readingNormal["R"]), float(readingShear["R"])])
+        phase = np.array([float(readingNormal["theta"]), float(readingShear["theta"])])
+        if debugPrint:
+            print(
+                f"Iteration {i:3d}: Normal {f[0]:.6f} Hz, {phase[0]:.2f} deg; "
+                f"Shear {f[1]:.6f} Hz, {phase[1]:.2f} deg"
+            )
+
+        error = float(np.max(np.abs(phase))) if np.all(np.isfinite(phase)) else np.inf
+        if best is None or error < best[0]:
+            best = (error, f.copy(), amplitude, phase)
+
+        if precision is not None:
+            if estimators is None:
+                estimators = [
+                    ResonanceEstimator(
+                        f[ch],
+                        -360 / (np.pi * diagonal[ch]) if slopes[ch] is not None else maxStep[ch] * 2,
+                        max(amplitude[ch], 1e-12),
+                        phaseNoise=phaseNoise,
+                    )
+                    for ch in range(2)
+                ]
+            for ch in range(2):
+                estimators[ch].update(f[ch], amplitude[ch], phase[ch])
+            converged = np.array([estimator.known(precision) for estimator in estimators])
+            best = (error, np.array([estimator.fRes for estimator in estimators]), amplitude, phase)
+        else:
+            converged = np.abs(np.deg2rad(phase)) < tolerance
+        if np.all(converged):
+            if precision is not None:
+                metrics.count("estimatorStops")
+            if debugPrint:
+                print(f"Joint PLL converged after {i} iterations")
+            break
+
+        if fPrev is not None:
+            dx = f - fPrev
+            if error > np.max(np.abs(phasePrev)):
+                jacobian = np.diag(diagonal)
+            elif dx @ dx > 0:
+                jacobian = jacobian + np.outer(phase - phasePrev - jacobian @ dx, dx) / (dx @ dx)
+            # the phases fall with frequency, anything else comes from a spoiled update
+            if not (np.all(np.diag(jacobian) < 0) and np.linalg.det(jacobian) > 0):
+                jacobian = np.diag(diagonal)
+
+        step = -np.linalg.solve(jacobian, phase) if np.all(np.isfinite(phase)) else np.zeros(2)
+        fPrev, phasePrev = f, phase
+        f = f + np.clip(step, -np.asarray(maxStep), np.asarray(maxStep))
+    else:
+        metrics.count("pllNotConverged", int(np.count_nonzero(~converged)))
+        if debugPrint:
+            print("Maximum iterations reached without full convergence in the joint PLL loop.")
+
+    _, f, amplitude, phase = best
+    return (
+        [float(f[0]), float(amplitude[0]), float(phase[0])],
+        [float(f[1]), float(amplitude[1]), float(phase[1])],
+    )
+
+
+@traced("pll")
 def PLL2D(
     ctrlNormal: SR830,
     ctrlShear: SR830,
@@ -125,17 +650,67 @@ def PLL2D(
     **kwargs,
 ) -> tuple[list[float], list[float]]:
     """
-    Sweeps through the shear frequencies nested in a sweep of the normal frequencies .\n
-    Starts a 2D sweep. At worst O(n^2) time complexity.
+    Finds the coupled resonances of both modes.
+
+    `method="joint"` (default) steps both frequencies in the same dwell: a seed search bisects both
+    phase zeros at once with at most `points` readings per mode, then Broyden steps solve both phases
+    to zero together. The 2×2 Jacobian of the phases starts from the fitted phase slopes and learns
+    the normal-shear coupling from the steps, within `iterations²` dwells.
+
+    `method="nested"` sweeps through the shear frequencies nested in a sweep of the normal frequencies
+    and runs a shear PLL loop inside every normal iteration. At worst O(n^2) time complexity.
 
     :param debugPrint: If results should constantly be printed, default: False
     :type debugPrint: bool
 
+    :param settle: Wait the predicted settle time after each step instead of `delay`, as [Normal, Shear], default: None
+    :type settle: list[Settler] | None
+
+    :param method: `"joint"` or `"nested"`, default: "joint"
+    :type method: str
+
+    :param precision: Joint method only, stop once the `ResonanceEstimator` of each mode knows its resonance to this standard deviation in Hz, default: None
+    :type precision: float | None
+
+    :param phaseNoise: Standard deviation of a phase reading in deg for the estimators, default: 0.5
+    :type phaseNoise: float
+
     :returns: [[fNormal, normalAmp, normalPha], [fShear, shearAmp, shearPha]]
     :rtype: tuple[list[float],list[float]]
 
     """
     debugPrint: bool = kwargs.get("debugPrint", False)
+    settle: list[Settler] | None = kwargs.get("settle", None)
+    method: str = kwargs.get("method", "joint")
+    if method not in ["joint", "nested"]:
+        raise ValueError(f"Unknown method '{method}'!")
+    metrics = getMetrics()
+    metrics.count("pllRuns", 2)
+
+    if method == "joint":
+        ctrls = [ctrlNormal, ctrlShear]
+        ranges = [freqNormalRange, freqShearRange]
+        seeds, slopes, fSet = __seedSearch2D(ctrls, freqGen, ranges, points, delay, settle)
+        if debugPrint:
+            print(f"Initial guess from seed search: \n Normal: {seeds[0]:.3f} Hz\nShear: {seeds[1]:.3f} Hz")
+        maxStep = [(r[1] - r[0]) / max(n - 1, 1) for r, n in zip(ranges, points)]
+        return __jointLock(
+            ctrls,
+            freqGen,
+            seeds,
+            slopes,
+            fSet,
+            tolerance,
+            iterations**2,
+            Kp,
+            delay,
+            settle,
+            maxStep,
+            debugPrint,
+            precision=kwargs.get("precision", None),
+            phaseNoise=kwargs.get("phaseNoise", 0.5),
+        )
+
     optNormal: list[float] = [freqNormalRange[0], 0.0, 180.0]
     optShear: list[float] = [freqShearRange[0], 0.0, 180.0]
 
@@ -143,17 +718,19 @@ def PLL2D(
     freqsShear = np.linspace(*freqShearRange, num=points[1], endpoint=True)
 
     amps = np.zeros(shape=(points[0], points[1]))
+    fSetNormal, fSetShear = np.inf, np.inf
 
     for i, fNormal in enumerate(freqsNormal.data):
         freqGen.set_frequency(1, fNormal)
 
         for j, fShear in enumerate(freqsShear.data):
             freqGen.set_frequency(2, fShear)
-            time.sleep(delay)
+            dwell(settle, delay, [fNormal - fSetNormal, fShear - fSetShear])
+            fSetNormal, fSetShear = fNormal, fShear
 
             amps[i, j] = np.sqrt(
                 (ctrlNormal.readAmplitude() ** 2) / 2
-                + (ctrlNormal.readAmplitude() ** 2) / 2
+                + (ctrlShear.readAmplitude() ** 2) / 2
             )
 
     indAmp = np.unravel_index(np.argmax(amps), amps.shape)
@@ -171,7 +748,9 @@ def PLL2D(
         # Shear loop
         for j in range(iterations):
             freqGen.set_frequency(2, fResShear)
-            time.sleep(delay)
+            dwell(settle, delay, [fResNormal - fSetNormal, fResShear - fSetShear])
+            fSetNormal, fSetShear = fResNormal, fResShear
+            metrics.count("pllIterations")
 
             phaseDegShear = ctrlShear.readPhase()
 
@@ -193,6 +772,7 @@ def PLL2D(
 
         else:
             optShear = [fResShear, ctrlShear.readAmplitude(), phaseDegShear]
+            metrics.count("pllNotConverged")
             if debugPrint:
                 print(
                     "(Shear) Maximum iterations reached without full convergence in the PLL loop."
@@ -218,6 +798,7 @@ def PLL2D(
         fResNormal = fResNormal + Kp * np.deg2rad(phaseDegNormal)
     else:
         optNormal = [fResNormal, ctrlNormal.readAmplitude(), phaseDegNormal]
+        metrics.count("pllNotConverged")
         if debugPrint:
             print(
                 "(Normal) Maximum iterations reached without full convergence in the PLL loop."
@@ -226,6 +807,7 @@ def PLL2D(
     return (optNormal, optShear)
 
 
+@traced("pll")
 def PLL2x1D(
     ctrlNormal: SR830,
     ctrlShear: SR830,
@@ -240,47 +822,123 @@ def PLL2x1D(
     **kwargs,
 ) -> list[list[float]]:
     """
-    Sweeps through normal frequencies and the shear frequencies sequentially.\n
-    Starts 2 seperate 1D sweeps, instead of the full 2D sweep. O(n) time complexity.
+    Locks the normal and the shear mode with two `PLL1D` runs instead of the full 2D sweep. O(n) time complexity.
 
     (This function is secretly twice PLL1D in a trenchcoat)
 
+    Both runs are interleaved by default: each dwell serves a step of both modes, see `scheduler.py`.
+    As stepping one mode shifts the resonance of the other, a mode that locked before the other is
+    read again at the end; when its phase has moved more than `crossTalk` it is locked again on its own.
+
     :param debugPrint: If results should constantly be printed, default: False
     :type debugPrint: bool
 
+    :param settle: Wait the predicted settle time after each step instead of `delay`, as [Normal, Shear], default: None
+    :type settle: list[Settler] | None
+
+    :param solver: Phase solver of both `PLL1D` runs, `"proportional"` or `"secant"`, default: "proportional"
+    :type solver: str
+
+    :param coarse: Coarse search of both `PLL1D` runs, `"argmax"`, `"fit"` or `"adaptive"`, default: "argmax"
+    :type coarse: str
+
+    :param precision: Stop each `PLL1D` run once its estimator knows the resonance to this standard deviation in Hz, default: None
+    :type precision: float | None
+
+    :param interleave: Run both modes in the same dwells, `False` runs normal and then shear, default: True
+    :type interleave: bool
+
+    :param crossTalk: Largest phase change in deg of a locked mode caused by the steps of the other one, default: 1.0
+    :type crossTalk: float
+
     :returns: [[fNormal, normalAmp, normalPha], [fShear, shearAmp, shearPha]]
     :rtype: list[list[float]]
     """
     debugPrint: bool = kwargs.get("debugPrint", False)
+    settle: list[Settler] | None = kwargs.get("settle", None)
+    solver: str = kwargs.get("solver", "proportional")
+    coarse: str = kwargs.get("coarse", "argmax")
+    interleave: bool = kwargs.get("interleave", True)
+    crossTalk: float = kwargs.get("crossTalk", 1.0)
+    precision: float | None = kwargs.get("precision", None)
+    phaseNoise: float = kwargs.get("phaseNoise", 0.5)
+
+    ctrls = [ctrlNormal, ctrlShear]
+    ranges = [freqNormalRange, freqShearRange]
+    settles = settle if settle is not None else [None, None]
+    names = ["Normal", "Shear"]
+
+    def options(ch: int) -> dict:
+        return {
+            "debugPrint": debugPrint,
+            "settle": settles[ch],
+            "solver": solver,
+            "coarse": coarse,
+            "precision": precision,
+            "phaseNoise": phaseNoise,
+        }
+
+    if not interleave:
+        return [
+            PLL1D(
+                ctrls[ch],
+                freqGen,
+                ranges[ch][0],
+                ranges[ch][1],
+                points[ch],
+                freqGenChannel=ch + 1,
+                tolerance=tolerance,
+                iterations=iterations,
+                Kp=Kp,
+                delay=delay,
+                **options(ch),
+            )
+            for ch in range(2)
+        ]
+
+    jobs = [
+        Job(
+            __PLL1DSteps(ranges[ch][0], ranges[ch][1], points[ch], tolerance, iterations, Kp, **options(ch)),
+            ctrls[ch],
+            ch + 1,
+            settles[ch],
+        )
+        for ch in range(2)
+    ]
+    opts = runInterleaved(jobs, freqGen, delay)
+
+    # the mode that locked first saw the later steps of the other one, check it is still locked
+    last = max(job.rounds for job in jobs)
+    early = [ch for ch in range(2) if jobs[ch].rounds < last]
+    if len(early) > 0:
+        ch = early[0]
+        freqGen.set_frequency(ch + 1, opts[ch][0])
+        dwell(settles[ch], delay, opts[ch][0] - jobs[ch].frequency)
+        phaseDeg = ctrls[ch].readPhase()
+        if debugPrint:
+            print(f"({names[ch]}) Phase {phaseDeg:.2f} deg at {opts[ch][0]:.6f} Hz after the other mode locked")
 
-    optNormal = PLL1D(
-        ctrlNormal,
-        freqGen,
-        freqNormalRange[0],
-        freqNormalRange[1],
-        points[0],
-        freqGenChannel=1,
-        tolerance=tolerance,
-        iterations=iterations,
-        Kp=Kp,
-        delay=delay,
-        debugPrint=debugPrint,
-    )
-    optShear = PLL1D(
-        ctrlShear,
-        freqGen,
-        freqShearRange[0],
-        freqShearRange[1],
-        points[1],
-        freqGenChannel=2,
-        tolerance=tolerance,
-        iterations=iterations,
-        Kp=Kp,
-        delay=delay,
-        debugPrint=debugPrint,
-    )
+        if not abs(phaseDeg) <= crossTalk:
+            getMetrics().count("crossTalk")
+            print(
+                f"({names[ch]}) Phase moved to {phaseDeg:.2f} deg while the other mode locked, locking again"
+            )
+            width = (ranges[ch][1] - ranges[ch][0]) / max(points[ch] - 1, 1)
+            opts[ch] = PLL1D(
+                ctrls[ch],
+                freqGen,
+                opts[ch][0] - width,
+                opts[ch][0] + width,
+                freqGenChannel=ch + 1,
+                tolerance=tolerance,
+                iterations=iterations,
+                Kp=Kp,
+                delay=delay,
+                guess=opts[ch][0],
+                **options(ch),
+            )
 
-    return [optNormal, optShear]
+    return opts
 
 
 if __name__ == "__main__":
@@ -5,7 +5,8 @@ Integration of the E-625 Piezo Servo Controller from PI
 from pipython import GCSDevice
 from threading import Thread
 import threading
-import time
+import clock
+from profiler import traced
 
 
 class E625:
@@ -22,17 +23,21 @@ class E625:
 
         self.target = "A"
 
+    @traced("zStage", tags=lambda *a, **k: {"device": "E625"})
     def servoloop(self, closed=False):
         self.pidevice.SVO(self.target, closed)
 
+    @traced("zStage", tags=lambda *a, **k: {"device": "E625"})
     def relative_voltage(self, voltage):
         self.pidevice.SVO(self.target, False)
         self.pidevice.SVR(self.target, voltage)
 
+    @traced("zStage", tags=lambda *a, **k: {"device": "E625"})
     def absolute_voltage(self, voltage):
         self.pidevice.SVO(self.target, False)
         self.pidevice.SVA(self.target, voltage)
 
+    @traced("zStage", tags=lambda *a, **k: {"device": "E625"})
     def request_voltage(self):
         return self.pidevice.qVOL(self.target)["A"]
 
@@ -46,7 +51,7 @@ class E625:
             self.absolute_voltage(v)
 
             v = v + step
-            time.sleep(waittime)
+            clock.sleep(waittime)
 
         self.stop()
 
@@ -1,5 +1,14 @@
 #include <SerialPort.h>
 
+/* function prototypes*/
+struct LockIn;
+bool readCommand();
+void pollLockIn(LockIn &lockin, unsigned long now);
+void sendFrame();
+void printDouble_S0( double val, unsigned int precision);
+void printDouble_S1( double val, unsigned int precision);
+void printDouble_S2( double val, unsigned int precision);
+
 /* global variables*/
 
 // normal mode variables
@@ -30,13 +39,41 @@ double linear_term_amplitude_shear;
 int frequency_controller_flag_shear;
 int amplitude_controller_flag_shear;
 
+// lock-in polling, one SNAP query (R and theta) in flight per lock-in, the replies are collected without waiting
+const int LOCKIN_BUFFER_SIZE = 32;
+const unsigned long LOCKIN_TIMEOUT = 200; // ms without a complete reply before the query is sent again
+struct LockIn {
+  HardwareSerial *port;
+  char reply[LOCKIN_BUFFER_SIZE];
+  int reply_length;
+  bool waiting;            // query sent, reply not complete yet
+  bool fresh;              // reading not used by the controller yet
+  unsigned long sent;      // millis() of the query
+  unsigned long replied;   // millis() of the last complete reply
+  double amplitude;
+  double phase;
+};
+LockIn lockin_normal = {&Serial1};
+LockIn lockin_shear = {&Serial2};
+unsigned long control_interval; // ms from a reading to the next query, the time the fork and lock-in get to settle after a step
+
 // general variables
-int serial_bytes_inputBuffer;
+const int COMMAND_BUFFER_SIZE = 32;
+char command_buffer[COMMAND_BUFFER_SIZE];
+int command_length;
 String user_input;
-String lock_in_responce;
 String command;
+unsigned long loop_counter;
+unsigned long control_counter;
+unsigned long rate_start;
 long Stream_start;
+// the text stream sends one line per STREAM_INTERVAL at most, 85 characters every 50 ms fit 19200 baud
+// without blocking the loop, the binary stream sends a frame for every reading
+const unsigned long STREAM_INTERVAL = 50;
+unsigned long stream_sent;
 int data_stream_flag;
+int binary_stream_flag;
+uint16_t frame_sequence;
 double temp_counter;
 
 void setup() {
@@ -60,18 +97,24 @@ void setup() {
   prev_output_amplitude = 0;
   input_phase = 0;
   input_amplitude = 0;
-  serial_bytes_inputBuffer = 0;
+  command_length = 0;
   user_input = "";
-  lock_in_responce = "";
+  control_interval = 50;
+  loop_counter = 0;
+  control_counter = 0;
+  rate_start = millis();
   command = "";
   setpoint_amplitude = 1.0;
   frequency_controller_flag = 0;
   amplitude_controller_flag = 0;
   data_stream_flag = 0;
+  binary_stream_flag = 0;
+  frame_sequence = 0;
   exponential_term = 0.00003;
   linear_term = 0.001;
   linear_term_amplitude = 20;
   Stream_start = 0;
+  stream_sent = 0;
   output_frequency_shear = 375;
   output_amplitude_shear = 1.0;
   prev_output_frequency_shear = 0;
@@ -90,11 +133,12 @@ void setup() {
 void loop() {
   // put your main code here, to run repeatedly:
 
-  /* check user input*/
-  serial_bytes_inputBuffer = Serial.available();
-  user_input = "";
-  while (serial_bytes_inputBuffer != 0) {
-    user_input = Serial.readStringUntil(';');
+  unsigned long now = millis();
+  loop_counter++;
+
+  /* check user input, without waiting for the rest of a command*/
+  while (readCommand()) {
+    user_input = String(command_buffer);
     //Serial.print("user command: ");  // for debugging
     //Serial.println(user_input);
 
@@ -117,7 +161,10 @@ void loop() {
       Serial.println("sEf (X);  | This command enables or disables the shear frequency controller (x = 1 enables the controller and x = 2 disables the controller)");
       Serial.println("Ea (X);   | This command enables or disables the normal amplitude controller (x = 1 enables the controller and x = 2 disables the controller)");
       Serial.println("sEa (X);  | This command enables or disables the shear amplitude controller (x = 1 enables the controller and x = 2 disables the controller)");
-      Serial.println("Ed (X);   | This command enables or disables the data stream (x = 1 enables the stream and x = 2 disables the stream)");
+      Serial.println("Ed (X);   | This command enables or disables the data stream (x = 1 enables the stream and x = 2 disables the stream), one line per 50 ms at most");
+      Serial.println("Eb (X);   | This command enables or disables the binary data stream (x = 1 enables the stream and x = 2 disables the stream), 42 byte frames, see sendFrame");
+      Serial.println("SCi (X);  | This command sets the time in ms the lock-ins get to settle between a controller step and the next reading");
+      Serial.println("Rl;       | This command returns the loop and controller steps per second since the last Rl");
       Serial.println("SCe (X);  | This command sets the exponential term for the normal frequency controller");
       Serial.println("sSCe (X); | This command sets the exponential term for the shear frequency controller");
       Serial.println("SCl (X);  | This command sets the linear term for the normal frequency controller");
@@ -284,6 +331,7 @@ void loop() {
         if(user_input.substring(3).toInt() == 1){
           //Serial.println("data stream enabled");
           data_stream_flag = 1;
+          binary_stream_flag = 0;
           Stream_start = millis();
           }
         else if(user_input.substring(3).toInt() == 2){
@@ -300,6 +348,42 @@ void loop() {
         Serial.println("x not recognised");
       }
     }
+    else if (user_input.substring(0, 2).compareTo("Eb") == 0) { //------------------------------------------------------------Eb command--------------------------------------------------
+      if (user_input.length() > 3 && user_input.substring(3).toInt() != 0) {
+        if(user_input.substring(3).toInt() == 1){
+          binary_stream_flag = 1;
+          data_stream_flag = 0;
+          Stream_start = millis();
+          }
+        else if(user_input.substring(3).toInt() == 2){
+          binary_stream_flag = 0;
+          }
+        else {
+          Serial.println("x not recognised");
+          }
+      }
+      else {
+        Serial.println("x not recognised");
+      }
+    }
+    else if (user_input.substring(0, 3).compareTo("SCi") == 0) { //------------------------------------------------------------SCi command--------------------------------------------------
+      if (user_input.length() > 4 && user_input.substring(4).toInt() > 0) {
+        control_interval = user_input.substring(4).toInt();
+      }
+      else {
+        Serial.println("x not recognised");
+      }
+    }
+    else if (user_input.substring(0, 2).compareTo("Rl") == 0) { //------------------------------------------------------------Rl command--------------------------------------------------
+      double seconds = (now - rate_start) / 1000.0;
+      Serial.print("loop rate = ");
+      Serial.println(loop_counter / seconds, 1);
+      Serial.print("control rate = ");
+      Serial.println(control_counter / seconds, 1);
+      loop_counter = 0;
+      control_counter = 0;
+      rate_start = now;
+    }
     else if (user_input.substring(0, 3).compareTo("SCe") == 0) { //------------------------------------------------------------SCe command--------------------------------------------------
       if (user_input.length() > 4 ) {
         exponential_term = user_input.substring(4).toDouble();
@@ -490,81 +574,33 @@ void loop() {
       Serial.println("Command not recognised");
     }
 
-    serial_bytes_inputBuffer = Serial.available();
   } // end of while loop
 
 
   /*request update from lock-in */
-  // update input_frequency/amplitude normal mode
-  
-  Serial1.print("outp ? 3\n");
-  //Serial1.print("*IDN?\n");
-  delay(1);
-  if(Serial1.available() != 0){
-    lock_in_responce = Serial1.readStringUntil('\r');
-    if(lock_in_responce.toDouble() != 0.0){
-      input_amplitude = lock_in_responce.toDouble();
-      //printDouble_S0(input_amplitude,1000000);
-    } 
-    else{
-      input_amplitude = lock_in_responce.toDouble();
-      //Serial.println("Failed to get amplitude from lock-in");
-      } 
-    }
-    
-  Serial1.print("outp ? 4\n");
-  delay(1);
-  if(Serial1.available() != 0.0){
-    lock_in_responce = Serial1.readStringUntil('\r');
-    if(lock_in_responce.toDouble() != 0.0){
-      input_phase = lock_in_responce.toDouble();
-      //Serial.print("p");
-      //printDouble_S0(input_phase,1000000);
-    } 
-    else{
-      input_phase = lock_in_responce.toDouble();
-      //Serial.print("p");
-      //printDouble_S0(input_phase,1000000);
-      //Serial.println("Failed to get phase from lock-in");
-      } 
-    } 
-
-// update input_frequency/amplitude shear mode
-  
-  Serial2.print("outp ? 3\n");
-  //Serial1.print("*IDN?\n");
-  delay(1);
-  if(Serial2.available() != 0){
-    lock_in_responce = Serial2.readStringUntil('\r');
-    if(lock_in_responce.toDouble() != 0.0){
-      input_amplitude_shear = lock_in_responce.toDouble();
-      //printDouble_S0(input_amplitude,1000000);
-    } 
-    else{
-      input_amplitude_shear = lock_in_responce.toDouble();
-      //Serial.println("Failed to get amplitude from lock-in");
-      } 
+  // both lock-ins are queried at once, a mode is read again control_interval after its last reading
+  pollLockIn(lockin_normal, now);
+  pollLockIn(lockin_shear, now);
+
+  // a controller steps once per fresh reading, by the correction of the phase (or amplitude) error it measured,
+  // so more readings lock faster: every reading is queried control_interval after the step of the one before
+  bool step_normal = lockin_normal.fresh;
+  bool step_shear = lockin_shear.fresh;
+  if(step_normal){
+    lockin_normal.fresh = false;
+    input_amplitude = lockin_normal.amplitude;
+    input_phase = lockin_normal.phase;
+    control_counter++;
+    }
+  if(step_shear){
+    lockin_shear.fresh = false;
+    input_amplitude_shear = lockin_shear.amplitude;
+    input_phase_shear = lockin_shear.phase;
     }
-    
-  Serial2.print("outp ? 4\n");
-  delay(1);
-  if(Serial2.available() != 0.0){
-    lock_in_responce = Serial2.readStringUntil('\r');
-    if(lock_in_responce.toDouble() != 0.0){
-      input_phase_shear = lock_in_responce.toDouble();
-      //Serial.print("p");
-      //printDouble_S0(input_phase,1000000);
-    } 
-    else{
-      input_phase_shear = lock_in_responce.toDouble();
-      //Serial.print("p");
-      //printDouble_S0(input_phase,1000000);
-      //Serial.println("Failed to get phase from lock-in");
-      } 
-    } 
+
   /* run frequency and or amplitude controller based on the control variables/flags*/
   // if normal frequency controller flag = 1 run frequency controller. else dont run.
-  if(frequency_controller_flag == 1){
+  if(step_normal && frequency_controller_flag == 1){
     double correction = 0.0;
     if(input_phase >= 0.0){
       correction = (((input_phase*input_phase) * exponential_term)+ input_phase*linear_term);
@@ -583,7 +619,7 @@ void loop() {
     output_frequency = output_frequency + correction;  
   }
   // if normal amplitude controller flag = 1 run amplitude controller. else dont run.
-  if(amplitude_controller_flag == 1){
+  if(step_normal && amplitude_controller_flag == 1){
     double setpoint_voltage = (19.7392088022 * pow(output_frequency,2) * setpoint_amplitude/1000000000) / 9.80665;
     setpoint_voltage = setpoint_voltage/4.545454545454546;
     setpoint_voltage = setpoint_voltage/2.83286119;
@@ -594,7 +630,7 @@ void loop() {
     }
 
   // if shear frequency controller flag = 1 run frequency controller. else dont run.
-  if(frequency_controller_flag_shear == 1){
+  if(step_shear && frequency_controller_flag_shear == 1){
     double correction = 0.0;
     if(input_phase_shear >= 0.0){
       correction = (((input_phase_shear*input_phase_shear) * exponential_term_shear)+ input_phase_shear*linear_term_shear);
@@ -613,7 +649,7 @@ void loop() {
     output_frequency_shear = output_frequency_shear + correction;  
   }
   // if shear amplitude controller flag = 1 run amplitude controller. else dont run.
-  if(amplitude_controller_flag_shear == 1){
+  if(step_shear && amplitude_controller_flag_shear == 1){
     double setpoint_voltage_shear = (19.7392088022 * pow(output_frequency_shear,2) * setpoint_amplitude_shear/1000000000) / 9.80665;
     setpoint_voltage_shear = setpoint_voltage_shear/4.545454545454546;
     setpoint_voltage_shear = setpoint_voltage_shear/2.83286119;
@@ -623,7 +659,8 @@ void loop() {
     
     }
 
-  if(data_stream_flag == 1){
+  if((step_normal || step_shear) && data_stream_flag == 1 && now - stream_sent >= STREAM_INTERVAL){
+    stream_sent = now;
     
     printDouble_S0(output_frequency,100000);
     Serial.print(',');
@@ -659,6 +696,9 @@ void loop() {
     Serial.print("\nt");
     
     }
+  if((step_normal || step_shear) && binary_stream_flag == 1){
+    sendFrame();
+    }
 
   /* Update the frequency and amplitude by sending a message to the DDS and amplifier*/
   // if normal frequency or amplitude did not change then don't send a message.
@@ -715,10 +755,124 @@ void loop() {
     prev_output_amplitude_shear = output_amplitude_shear;
     
     }
-    delay(95);
   
 }
 
+/* collects the bytes of the user input, returns true once command_buffer holds a complete command (without the ';')*/
+bool readCommand(){
+  while (Serial.available() != 0) {
+    char c = Serial.read();
+    if (c == ';') {
+      command_buffer[command_length] = '\0';
+      command_length = 0;
+      return true;
+    }
+    // line endings of a terminal are not part of a command
+    if (c != '\n' && c != '\r' && command_length < COMMAND_BUFFER_SIZE - 1) {
+      command_buffer[command_length++] = c;
+    }
+  }
+  return false;
+}
+
+/* sends a SNAP query when the lock-in is due and collects the reply "R,theta\r" as it arrives*/
+void pollLockIn(LockIn &lockin, unsigned long now){
+  if (!lockin.waiting) {
+    if (now - lockin.replied < control_interval) {
+      return;
+    }
+    lockin.port->print("SNAP ? 3,4\n");
+    lockin.waiting = true;
+    lockin.sent = now;
+    lockin.reply_length = 0;
+    return;
+  }
+
+  while (lockin.port->available() != 0) {
+    char c = lockin.port->read();
+    if (c != '\r') {
+      if (lockin.reply_length < LOCKIN_BUFFER_SIZE - 1) {
+        lockin.reply[lockin.reply_length++] = c;
+      }
+      continue;
+    }
+    lockin.reply[lockin.reply_length] = '\0';
+    char *end;
+    double amplitude = strtod(lockin.reply, &end);
+    if (end != lockin.reply && *end == ',') {
+      lockin.amplitude = amplitude;
+      lockin.phase = strtod(end + 1, NULL);
+      lockin.fresh = true;
+    }
+    lockin.waiting = false;
+    lockin.replied = now;
+    return;
+  }
+
+  if (now - lockin.sent > LOCKIN_TIMEOUT) {
+    // no (complete) reply, e.g. the lock-in is off, ask again
+    lockin.waiting = false;
+    lockin.replied = now - control_interval;
+  }
+}
+
+/* binary data stream frame, little-endian, 42 bytes:
+   0  uint16  sync word 0xA55A (0xA5 never occurs in the ASCII replies)
+   2  uint16  sequence counter, wraps at 65536
+   4  uint32  millis()
+   8  int32   normal frequency in 10 uHz
+   12 float32 normal amplitude, normal phase, normal input amplitude
+   24 int32   shear frequency in 10 uHz
+   28 float32 shear amplitude, shear phase, shear input amplitude
+   40 uint16  CRC-16/CCITT-FALSE of bytes 2 to 39 */
+const uint16_t FRAME_SYNC = 0xA55A;
+const int FRAME_SIZE = 42;
+
+void putFrameBytes(uint8_t* frame, int offset, uint32_t value, int size){
+  for (int i = 0; i < size; i++) {
+    frame[offset + i] = (value >> (8 * i)) & 0xFF;
+  }
+}
+
+void putFrameFloat(uint8_t* frame, int offset, double val){
+  float value = val;
+  uint32_t bits;
+  memcpy(&bits, &value, 4);
+  putFrameBytes(frame, offset, bits, 4);
+}
+
+uint16_t crc16(const uint8_t* data, int len){
+  uint16_t crc = 0xFFFF;
+  for (int i = 0; i < len; i++) {
+    crc ^= (uint16_t)data[i] << 8;
+    for (int bit = 0; bit < 8; bit++) {
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+    }
+  }
+  return crc;
+}
+
+void sendFrame(){
+  uint8_t frame[FRAME_SIZE];
+  putFrameBytes(frame, 0, FRAME_SYNC, 2);
+  putFrameBytes(frame, 2, frame_sequence, 2);
+  putFrameBytes(frame, 4, millis(), 4);
+  putFrameBytes(frame, 8, (uint32_t)(int32_t)lround(output_frequency * 100000.0), 4);
+  putFrameFloat(frame, 12, output_amplitude);
+  putFrameFloat(frame, 16, input_phase);
+  putFrameFloat(frame, 20, input_amplitude);
+  putFrameBytes(frame, 24, (uint32_t)(int32_t)lround(output_frequency_shear * 100000.0), 4);
+  putFrameFloat(frame, 28, output_amplitude_shear);
+  putFrameFloat(frame, 32, input_phase_shear);
+  putFrameFloat(frame, 36, input_amplitude_shear);
+  putFrameBytes(frame, 40, crc16(frame + 2, FRAME_SIZE - 4), 2);
+  // a full link drops the frame instead of stalling the loop, the host sees the gap in the sequence
+  if (Serial.availableForWrite() >= FRAME_SIZE) {
+    Serial.write(frame, FRAME_SIZE);
+  }
+  frame_sequence++;
+}
+
 void printDouble_S0( double val, unsigned int precision){
 // prints val with number of decimal places determine by precision
 // NOTE: precision is 1 followed by the number of zeros for the desired number of decimial places
@@ -0,0 +1,521 @@
+"""
+Integration of the SFA Controller (`SFA_Controller.ino`)
+
+The microcontroller polls both lock-ins without blocking, a mode is read again `control_interval` ms
+after its last reading (50 ms, `setControlInterval`), and every reading steps a frequency controller
+(phase to zero) and an amplitude controller of that mode in hardware, so the resonance can be tracked
+without the host polling a PLL. A step corrects the error the reading measured, so a shorter control
+interval reads and locks faster with the same terms and presets. With the data stream enabled (`Ed 1;`)
+it writes one line per `STREAM_INTERVAL` at most, on a reading, of
+
+    frequency, amplitude, phase, inputAmplitude, frequencyShear, amplitudeShear, phaseShear, inputAmplitudeShear
+
+which a background reader decodes into a `RingBuffer` of `STREAM_DTYPE` samples with host timestamps.
+Replies to queries arrive on the same port, between stream lines, and are handed to the caller.
+
+The binary stream (`Eb 1;`, `stream(binary=True)`) sends the same values as fixed size frames of
+`FRAME_DTYPE` with a sync word, a sequence counter, the `millis()` of the board and a CRC: 42 bytes
+instead of about 85 characters, one frame per reading, decoded with `np.frombuffer` instead of parsed as text. Gaps
+in the sequence counter count as dropped frames.
+
+Firmware limitations the client can not fix:
+- Setters do not reply, a rejected value only prints `x not recognised` (see `errors`).
+- Values between -1 and 0 are streamed without their sign (`printDouble_S0` prints `int(val)`), the
+  binary stream has no such problem.
+
+Example:
+    sfa = SFAController(port="COM5")
+    sfa.setFrequency(791.3)
+    sfa.frequencyPreset(1)
+    sfa.enableFrequencyController(True)
+    sfa.stream(True)
+    samples = sfa.next(20)
+    print(samples["frequency"].mean())
+    sfa.close()
+"""
+
+import queue
+import re
+import threading
+import serial
+import clock
+import numpy as np
+
+from Device_Registry import DeviceRegistry, defaultRegistry
+from tracker import RingBuffer
+from metrics import getMetrics
+from profiler import traced
+
+
+MODES: dict[str, str] = {"normal": "", "shear": "s"}
+"""Mode to command prefix, the shear commands are the normal ones with a leading `s`."""
+
+FREQUENCY_PRESETS: dict[int, str] = {
+    1: "open air",
+    2: "20 cSt",
+    3: "500 cSt",
+    4: "10 000 cSt",
+    5: "30 000 cSt",
+}
+"""Presets of the frequency controller terms (`SCp`), by medium."""
+
+AMPLITUDE_PRESETS: dict[int, float] = {1: 50, 2: 100, 3: 200, 4: 500, 5: 1000}
+"""Presets of the amplitude controller linear term (`SCAp`), 1 most conservative to 5 most aggressive."""
+
+STREAM_INTERVAL: float = 0.05
+"""Shortest time in s between two lines of the text stream, the most 19200 baud carries without blocking the loop."""
+
+STREAM_FIELDS: list[str] = [
+    "frequency",
+    "amplitude",
+    "phase",
+    "inputAmplitude",
+    "frequencyShear",
+    "amplitudeShear",
+    "phaseShear",
+    "inputAmplitudeShear",
+]
+"""Columns of a stream line: output frequency (Hz), output amplitude (V), lock-in phase (deg) and R (V) per mode."""
+
+STREAM_DTYPE = np.dtype([("time", "f8")] + [(name, "f8") for name in STREAM_FIELDS] + [("deviceTime", "f8")])
+"""Stream sample: host time since epoch (s) when the line arrived, the `STREAM_FIELDS`, and the board's time (s, binary stream only, NaN otherwise)."""
+
+FRAME_DTYPE = np.dtype(
+    [
+        ("sync", "<u2"),
+        ("sequence", "<u2"),
+        ("millis", "<u4"),
+        ("frequency", "<i4"),
+        ("amplitude", "<f4"),
+        ("phase", "<f4"),
+        ("inputAmplitude", "<f4"),
+        ("frequencyShear", "<i4"),
+        ("amplitudeShear", "<f4"),
+        ("phaseShear", "<f4"),
+        ("inputAmplitudeShear", "<f4"),
+        ("crc", "<u2"),
+    ]
+)
+"""Frame of the binary stream (`sendFrame` in the firmware), frequencies in 10 µHz, CRC over `sequence` to `inputAmplitudeShear`."""
+
+FRAME_SYNC: bytes = (0xA55A).to_bytes(2, "little")
+FREQUENCY_SCALE: float = 1e-5
+"""Hz per count of the frame frequencies."""
+
+
+def __crcTable() -> np.ndarray:
+    table = np.zeros(256, dtype=np.uint16)
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021 if crc & 0x8000 else crc << 1) & 0xFFFF
+        table[byte] = crc
+    return table
+
+
+CRC_TABLE: np.ndarray = __crcTable()
+
+
+def crc16(rows: np.ndarray) -> np.ndarray:
+    """CRC-16/CCITT-FALSE of every row of a 2D uint8 array, one pass per column for all rows."""
+    crc = np.full(len(rows), 0xFFFF, dtype=np.uint16)
+    for column in rows.T:
+        crc = (crc << np.uint16(8)) ^ CRC_TABLE[(crc >> np.uint16(8)) ^ column]
+    return crc
+
+
+ERROR_REPLIES: list[str] = ["x not recognised", "Command not recognised"]
+
+
+class StreamDecoder:
+    def __init__(self) -> None:
+        """
+        Splits the bytes from the controller into stream samples and replies
+
+        Binary frames are taken out first: a sync word followed by a frame with a valid CRC. The rest
+        is text, where stream lines end in `\\n` followed by a `t`, so a line after a stream line
+        starts with that `t`. Bytes are fed as they arrive, a partial frame or line is kept for the
+        next `feed`.
+        """
+        self._bytes = bytearray()
+        self._buffer = bytearray()
+        self._afterStream = False
+        self._sequence: int | None = None
+        self.dropped = 0
+        """Stream lines that could not be decoded and frames missing from the sequence counter."""
+        self.corrupt = 0
+        """Frames skipped for a wrong CRC, also missing from the sequence counter."""
+
+    def feed(self, data: bytes, time: float) -> tuple[np.ndarray, list[str]]:
+        """
+        Decodes all complete lines in `data` and the bytes fed before
+
+        :param data: Bytes read from the port.
+        :type data: bytes
+
+        :param time: Host time the bytes arrived, given to all samples decoded from them.
+        :type time: float
+
+        :returns: Samples as `STREAM_DTYPE` array, replies without line ending.
+        :rtype: tuple[np.ndarray, list[str]]
+        """
+        self._bytes += data
+        frames = self._frames()
+        samples = self._decodeFrames(frames, time)
+
+        end = self._buffer.rfind(b"\n")
+        if end < 0:
+            return samples, []
+        lines = bytes(self._buffer[:end]).split(b"\n")
+        del self._buffer[: end + 1]
+
+        rows: list[bytes] = []
+        replies: list[str] = []
+        for line in lines:
+            # the firmware replies in ASCII, anything before a non-ASCII byte is left of a damaged frame
+            line = re.split(rb"[\x80-\xff]", line)[-1].strip(b"\r")
+            if self._afterStream and line.startswith(b"t"):
+                line = line[1:]
+            self._afterStream = line.count(b",") == len(STREAM_FIELDS) - 1
+            if self._afterStream:
+                rows.append(line)
+            elif len(line) > 0:
+                replies.append(line.decode(errors="replace"))
+
+        if len(samples) > 0:
+            return np.concatenate([samples, self._decode(rows, time)]), replies
+        return self._decode(rows, time), replies
+
+    def _frames(self) -> list[np.ndarray]:
+        """Moves the frames out of the fed bytes and the text between them to the line buffer."""
+        frames: list[np.ndarray] = []
+        size = FRAME_DTYPE.itemsize
+        # the frames are views of this copy, the fed bytes get trimmed below
+        data = bytes(self._bytes)
+        i = 0
+        while True:
+            j = data.find(FRAME_SYNC, i)
+            if j < 0:
+                # a trailing first sync byte may be the start of the next frame
+                end = len(data) - 1 if data.endswith(FRAME_SYNC[:1]) else len(data)
+                self._buffer += data[i:end]
+                i = max(end, i)
+                break
+            self._buffer += data[i:j]
+            n = (len(data) - j) // size
+            if n == 0:
+                i = j
+                break
+
+            # frames follow each other while streaming, check all of them at once
+            view = np.frombuffer(data, dtype=FRAME_DTYPE, count=n, offset=j)
+            raw = np.frombuffer(data, dtype=np.uint8, count=n * size, offset=j).reshape(n, size)
+            synced = np.cumprod(view["sync"] == 0xA55A).astype(bool)
+            valid = synced & (crc16(raw[:, 2:-2]) == view["crc"])
+            count = int(np.argmin(valid)) if not np.all(valid) else n
+            if count == 0:
+                # damaged frame, when it was cut short the next one starts at a sync word inside it
+                self.corrupt += 1
+                k = data.find(FRAME_SYNC, j + 1, j + size + 1)
+                i = k if k >= 0 else j + size
+                continue
+            frames.append(view[:count])
+            i = j + count * size
+        del self._bytes[:i]
+        return frames
+
+    def _decodeFrames(self, frames: list[np.ndarray], time: float) -> np.ndarray:
+        if len(frames) == 0:
+            return np.zeros(0, dtype=STREAM_DTYPE)
+        frames = np.concatenate(frames)
+
+        # the counter wraps at 2^16, every step beyond 1 is a lost frame
+        sequence = frames["sequence"].astype(np.int64)
+        previous = np.concatenate([[sequence[0] - 1 if self._sequence is None else self._sequence], sequence[:-1]])
+        self.dropped += int(np.sum((sequence - previous - 1) % 65536))
+        self._sequence = int(sequence[-1])
+
+        samples = np.zeros(len(frames), dtype=STREAM_DTYPE)
+        samples["time"] = time
+        for name in STREAM_FIELDS:
+            samples[name] = frames[name]
+        samples["frequency"] *= FREQUENCY_SCALE
+        samples["frequencyShear"] *= FREQUENCY_SCALE
+        samples["deviceTime"] = frames["millis"] / 1000
+        return samples
+
+    def _decode(self, rows: list[bytes], time: float) -> np.ndarray:
+        samples = np.zeros(len(rows), dtype=STREAM_DTYPE)
+        if len(rows) == 0:
+            return samples
+        try:
+            # one conversion for all lines of the chunk
+            values = np.array(b",".join(rows).split(b","), dtype=float).reshape(len(rows), -1)
+        except ValueError:
+            values = np.full((len(rows), len(STREAM_FIELDS)), np.nan)
+            for i, row in enumerate(rows):
+                try:
+                    values[i] = np.array(row.split(b","), dtype=float)
+                except ValueError:
+                    pass
+        valid = np.all(np.isfinite(values), axis=1)
+        self.dropped += int(np.count_nonzero(~valid))
+
+        samples = samples[valid]
+        samples["time"] = time
+        samples["deviceTime"] = np.nan
+        for i, name in enumerate(STREAM_FIELDS):
+            samples[name] = values[valid, i]
+        return samples
+
+
+class SFAController:
+    def __init__(
+        self,
+        SN: str = "",
+        port: str = "",
+        registry: DeviceRegistry | None = None,
+        capacity: int = 4096,
+        timeout: float = 1.0,
+        bootDelay: float = 2.0,
+    ) -> None:
+        """
+        :param SN: Serial number of the microcontroller's USB-serial port.
+        :type SN: str
+
+        :param port: Port to use, looked up from `SN` in the device registry if empty. default: `""`
+        :type port: str
+
+        :param registry: Registry to look up `SN` in. default: shared registry
+        :type registry: DeviceRegistry | None
+
+        :param capacity: Number of stream samples kept. default: `4096`
+        :type capacity: int
+
+        :param timeout: Longest wait for the reply to a query, in s. default: `1.0`
+        :type timeout: float
+
+        :param bootDelay: Wait after opening the port, the board resets when the port opens. default: `2.0`
+        :type bootDelay: float
+        """
+        if port == "":
+            if SN == "":
+                raise ValueError("The SFA Controller needs a serial number or a port!")
+            port = (registry or defaultRegistry()).resolve(sn=SN)
+        self.SN = SN
+        self.ser = serial.Serial(port, baudrate=19200, timeout=0.05)
+        self.timeout = timeout
+        clock.sleep(bootDelay)
+
+        self.decoder = StreamDecoder()
+        self.buffer = RingBuffer(capacity, STREAM_DTYPE)
+        self.replies: queue.Queue[str] = queue.Queue()
+        self.errors: list[str] = []
+        """Error replies of the firmware, e.g. to a setter with a value it rejected."""
+        self.streaming = False
+        self.binary = False
+
+        self._writeLock = threading.Lock()
+        self._published = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._read, name="SFAController", daemon=True)
+        self._thread.start()
+
+    def _read(self) -> None:
+        """Reader thread, the only one reading the port."""
+        while not self._stop.is_set():
+            try:
+                data = self.ser.read(max(1, self.ser.in_waiting))
+            except serial.SerialException as e:
+                print(f"SFA Controller reader stopped: {e!r}")
+                break
+            if len(data) == 0:
+                continue
+            dropped = self.decoder.dropped
+            samples, replies = self.decoder.feed(data, clock.now())
+            if self.decoder.dropped > dropped:
+                getMetrics().count("nanReads", self.decoder.dropped - dropped)
+            for reply in replies:
+                if reply in ERROR_REPLIES:
+                    self.errors.append(reply)
+                    print(f"SFA Controller: {reply}")
+                else:
+                    self.replies.put(reply)
+            if len(samples) > 0:
+                self.buffer.extend(samples)
+                with self._published:
+                    self._published.notify_all()
+        with self._published:
+            self._published.notify_all()
+
+    @traced("sfa", tags=lambda self, cmd, *a, **k: {"device": "SFA", "command": cmd})
+    def _write(self, cmd: str) -> None:
+        with self._writeLock:
+            self.ser.write(f"{cmd};".encode())
+
+    def _reply(self, timeout: float | None = None) -> str | None:
+        try:
+            return self.replies.get(timeout=self.timeout if timeout is None else timeout)
+        except queue.Empty:
+            return None
+
+    def _query(self, cmd: str, prefix: str) -> float:
+        """Writes `cmd` and returns the value of the reply `prefix = value`, NaN without one."""
+        while not self.replies.empty():
+            self.replies.get_nowait()
+        self._write(cmd)
+
+        deadline = clock.monotonic() + self.timeout
+        while (remaining := deadline - clock.monotonic()) > 0:
+            reply = self._reply(remaining)
+            if reply is None:
+                break
+            if reply.startswith(prefix):
+                try:
+                    return float(reply.split("=")[-1])
+                except ValueError:
+                    break
+        print(f"SFA Controller: no reply to '{cmd}'")
+        getMetrics().checkNan(np.nan)
+        return np.nan
+
+    @staticmethod
+    def _prefix(mode: str) -> str:
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode '{mode}'!")
+        return MODES[mode]
+
+    def _setNonZero(self, cmd: str, value: float, mode: str) -> None:
+        # the firmware takes 0 for a parse error
+        if value == 0:
+            raise ValueError(f"'{cmd}' does not accept 0!")
+        self._write(f"{self._prefix(mode)}{cmd} {value}")
+
+    def _enable(self, cmd: str, enable: bool, mode: str) -> None:
+        self._write(f"{self._prefix(mode)}{cmd} {1 if enable else 2}")
+
+    def setFrequency(self, frequency: float, mode: str = "normal") -> None:
+        """Sets the output frequency in Hz, overwritten while the frequency controller is engaged."""
+        self._setNonZero("Sf", frequency, mode)
+
+    def readFrequency(self, mode: str = "normal") -> float:
+        return self._query(f"{self._prefix(mode)}Rf", f"{mode} frequency")
+
+    def setAmplitude(self, amplitude: float, mode: str = "normal") -> None:
+        """Sets the sine out amplitude in V, overwritten while the amplitude controller is engaged."""
+        self._setNonZero("Sa", amplitude, mode)
+
+    def readAmplitude(self, mode: str = "normal") -> float:
+        return self._query(f"{self._prefix(mode)}Ra", f"{mode} amplitude =")
+
+    def setAmplitudeSetpoint(self, setpoint: float, mode: str = "normal") -> None:
+        """Sets the setpoint of the amplitude controller."""
+        self._setNonZero("Ssa", setpoint, mode)
+
+    def readAmplitudeSetpoint(self, mode: str = "normal") -> float:
+        return self._query(f"{self._prefix(mode)}Rsa", f"{mode} amplitude setpoint")
+
+    def enableFrequencyController(self, enable: bool = True, mode: str = "normal") -> None:
+        self._enable("Ef", enable, mode)
+
+    def enableAmplitudeController(self, enable: bool = True, mode: str = "normal") -> None:
+        self._enable("Ea", enable, mode)
+
+    def stream(self, enable: bool = True, binary: bool = False) -> None:
+        """
+        Enables or disables the data stream of both modes, see `next`
+
+        :param enable: Start or stop the stream. default: `True`
+        :type enable: bool
+
+        :param binary: Stream binary frames instead of text lines, enabling one stops the other. default: `False`
+        :type binary: bool
+        """
+        if enable:
+            self._write("Eb 1" if binary else "Ed 1")
+        else:
+            self._write("Eb 2" if self.binary else "Ed 2")
+        self.streaming = enable
+        self.binary = binary if enable else self.binary
+
+    def setExponentialTerm(self, term: float, mode: str = "normal") -> None:
+        """Sets the quadratic term of the frequency controller, `Δf = ±term θ² + linear θ` per reading."""
+        self._write(f"{self._prefix(mode)}SCe {term}")
+
+    def setLinearTerm(self, term: float, mode: str = "normal") -> None:
+        """Sets the linear term of the frequency controller."""
+        self._write(f"{self._prefix(mode)}SCl {term}")
+
+    def frequencyPreset(self, preset: int, mode: str = "normal") -> str | None:
+        """Sets both frequency controller terms for a medium of `FREQUENCY_PRESETS`, returns the confirmation."""
+        if preset not in FREQUENCY_PRESETS:
+            raise ValueError(f"Unknown frequency preset {preset}!")
+        self._write(f"{self._prefix(mode)}SCp {preset}")
+        return self._reply()
+
+    def setAmplitudeLinearTerm(self, term: float, mode: str = "normal") -> None:
+        """Sets the linear term of the amplitude controller."""
+        self._write(f"{self._prefix(mode)}SCAl {term}")
+
+    def amplitudePreset(self, preset: int, mode: str = "normal") -> str | None:
+        """Sets the amplitude controller linear term of `AMPLITUDE_PRESETS`, returns the confirmation."""
+        if preset not in AMPLITUDE_PRESETS:
+            raise ValueError(f"Unknown amplitude preset {preset}!")
+        self._write(f"{self._prefix(mode)}SCAp {preset}")
+        return self._reply()
+
+    def setControlInterval(self, interval: int) -> None:
+        """Sets the time in ms from a lock-in reading to the next query of that lock-in, the settle time of a controller step."""
+        if int(interval) <= 0:
+            raise ValueError("The control interval must be at least 1 ms!")
+        self._write(f"SCi {int(interval)}")
+
+    def readLoopRate(self) -> tuple[float, float]:
+        """Loop iterations and normal mode controller steps per second since the last call, NaN without reply."""
+        loopRate = self._query("Rl", "loop rate")
+        reply = self._reply() if np.isfinite(loopRate) else None
+        if reply is None or not reply.startswith("control rate"):
+            return loopRate, np.nan
+        return loopRate, float(reply.split("=")[-1])
+
+    def help(self) -> list[str]:
+        """Command list of the firmware."""
+        self._write("Help")
+        lines = []
+        while (reply := self._reply(0.5 if len(lines) > 0 else None)) is not None:
+            lines.append(reply)
+        return lines
+
+    def latest(self) -> np.void | None:
+        """Newest stream sample, `None` before the first one."""
+        return self.buffer.latest()
+
+    def snapshot(self, since: int = 0) -> np.ndarray:
+        """Stream samples from index `since` on still in the ring buffer, see `RingBuffer.snapshot`."""
+        return self.buffer.snapshot(since)
+
+    def next(self, n: int = 1, timeout: float | None = None) -> np.ndarray:
+        """
+        Waits for `n` new stream samples
+
+        Returns the samples, fewer than `n` if the timeout passed or the reader stopped.
+        """
+        since = self.buffer.count
+        with self._published:
+            self._published.wait_for(
+                lambda: self.buffer.count - since >= n or not self._thread.is_alive(), timeout=timeout
+            )
+        return self.buffer.snapshot(since)[:n]
+
+    def close(self) -> None:
+        if self.streaming:
+            self.stream(False)
+        self._stop.set()
+        self._thread.join(1.0)
+        self.ser.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
@@ -0,0 +1,72 @@
+"""
+Buffered line transport shared by the serial instrument drivers
+"""
+
+import serial
+
+
+class SerialTransport:
+    """
+    Reads whole replies from a serial port instead of single bytes.
+
+    Incoming data is read in bulk (everything in `in_waiting`) into one reusable bytearray and
+    decoded once per line. Replies end in `terminator`; the `\\n` of `\\n\\r` or `\\r\\n` style
+    terminators is stripped here, so drivers only ever see the bare reply.
+    """
+
+    def __init__(self, ser: serial.Serial, terminator: bytes = b"\r") -> None:
+        self.ser = ser
+        self.terminator = terminator
+        self._buffer = bytearray()
+
+    def _fill(self) -> bool:
+        """Reads everything available, blocks for at least one byte. Returns `False` on timeout."""
+        chunk = self.ser.read(max(1, self.ser.in_waiting))
+        if len(chunk) == 0:
+            return False
+        self._buffer += chunk
+        return True
+
+    def write(self, data: str) -> None:
+        self.ser.write(data.encode())
+
+    def readLine(self) -> str:
+        """
+        Read one reply
+
+        Returns the reply without terminator, or whatever arrived before the port timed out.
+        """
+        start = 0
+        while True:
+            idx = self._buffer.find(self.terminator, start)
+            if idx >= 0:
+                line = self._buffer[:idx]
+                del self._buffer[: idx + len(self.terminator)]
+                return line.decode(errors="replace").strip("\r\n")
+
+            start = max(0, len(self._buffer) - len(self.terminator) + 1)
+            if not self._fill():
+                line = self._buffer.decode(errors="replace").strip("\r\n")
+                self._buffer.clear()
+                return line
+
+    def readExact(self, size: int) -> bytes:
+        """
+        Read exactly `size` raw bytes, for binary transfers.
+
+        Returns fewer bytes if the port timed out.
+        """
+        while len(self._buffer) < size:
+            if not self._fill():
+                break
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def reset_input_buffer(self) -> None:
+        """Drops stale input, both buffered here and in the OS."""
+        self._buffer.clear()
+        self.ser.reset_input_buffer()
+
+    def close(self) -> None:
+        self.ser.close()
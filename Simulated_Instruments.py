@@ -0,0 +1,642 @@
+"""
+Simulated instruments for running measurements without the setup
+
+A `ForkModel` describes the tuning fork as two driven, damped modes (normal and shear) with a
+cross-coupling between them, a surface the fork approaches with the Z-stage, and the output filters
+of both lock-ins. The simulated instruments talk to it at the protocol level: `SimulatedSR830`
+answers the SR830 serial commands, `SimulatedRigolDG` the SCPI commands of the function generator,
+`SimulatedE625` the GCS calls of the piezo controller and `SimulatedMitutoyo` the height gauge
+commands. The drivers themselves are unchanged, so all measurement functions run against them.
+
+The model follows the installed clock (see `clock.py`): with a `VirtualClock` the fork settles during
+the virtual waits and a long measurement finishes in seconds. Instrument latency advances the clock
+as well, without counting as a sleep.
+
+Example:
+    clock.setClock(clock.VirtualClock())
+    fork, ctrlNormal, ctrlShear, freqGen, zStage, hDev = simulatedSetup()
+    PLL1D(ctrlNormal, freqGen, 789.5, 794.5)
+"""
+
+import logging
+import re
+import threading
+import time
+import clock
+import numpy as np
+
+from LockIn_Amplifier import (
+    SR830,
+    STATE_COMMANDS,
+    SENSITIVITIES,
+    TIME_CONSTANTS,
+    SAMPLE_RATES,
+    BUFFER_SIZE,
+)
+from Piezo_Controller import E625
+from Height_Gauge import mitutoyo
+from rigol_dg1022 import RigolDG
+
+
+class OscillatorMode:
+    def __init__(
+        self,
+        fRes: float,
+        Q: float,
+        peakAmplitude: float,
+        lockInPhase: float = 0.0,
+    ) -> None:
+        """
+        One driven, damped mode of the fork.
+
+        :param fRes: Resonance frequency in Hz.
+        :type fRes: float
+
+        :param Q: Quality factor.
+        :type Q: float
+
+        :param peakAmplitude: Lock-in amplitude R at resonance for a drive of 1 V, in V.
+        :type peakAmplitude: float
+
+        :param lockInPhase: Phase offset of the lock-in reading at resonance, in deg. default: `0.0`
+        :type lockInPhase: float
+        """
+        self.fRes = fRes
+        self.Q = Q
+        self.peakAmplitude = peakAmplitude
+        self.lockInPhase = lockInPhase
+
+        # drive
+        self.frequency = fRes
+        self.drive = 1.0
+        self.output = True
+
+        # lock-in output filter
+        self.timeConstant = 0.1
+        self.order = 2
+
+        # complex envelope of the fork motion and of the lock-in filter stages
+        self.envelope = 0j
+        self.filtered = [0j, 0j, 0j, 0j]
+
+
+class ForkModel:
+    def __init__(
+        self,
+        normal: OscillatorMode | None = None,
+        shear: OscillatorMode | None = None,
+        crossShift: tuple[float, float] = (0.2, 0.1),
+        noise: float = 1e-6,
+        zContact: float = 80.0,
+        mmPerVolt: float = 1e-3,
+        squeezeRange: float = 1e-3,
+        seed: int | None = 0,
+    ) -> None:
+        """
+        Two coupled modes of a tuning fork above a surface.
+
+        :param normal: Normal mode, driven by channel 1 and read by the normal lock-in. default: 791.3 Hz, Q 800
+        :type normal: OscillatorMode | None
+
+        :param shear: Shear mode, driven by channel 2 and read by the shear lock-in. default: 455.1 Hz, Q 600
+        :type shear: OscillatorMode | None
+
+        :param crossShift: Resonance shift in Hz of (normal, shear) when the other mode moves at its full resonance amplitude. default: `(0.2, 0.1)`
+        :type crossShift: tuple[float, float]
+
+        :param noise: Standard deviation of the noise on X and Y of the lock-ins, in V. default: `1e-6`
+        :type noise: float
+
+        :param zContact: Z-stage voltage at which the fork touches the surface. default: `80.0` V
+        :type zContact: float
+
+        :param mmPerVolt: Z-stage travel per volt, in mm. default: `1e-3`
+        :type mmPerVolt: float
+
+        :param squeezeRange: Distance to the surface at which the damping has doubled, in mm. default: `1e-3`
+        :type squeezeRange: float
+
+        :param seed: Seed of the noise generator. default: `0`
+        :type seed: int | None
+        """
+        self.modes: dict[str, OscillatorMode] = {
+            "normal": normal if normal is not None else OscillatorMode(791.3, 800, 0.01),
+            "shear": shear if shear is not None else OscillatorMode(455.1, 600, 0.005),
+        }
+        self.crossShift = {"normal": crossShift[0], "shear": crossShift[1]}
+        self.noise = noise
+        self.zContact = zContact
+        self.mmPerVolt = mmPerVolt
+        self.squeezeRange = squeezeRange
+        self.rng = np.random.default_rng(seed)
+
+        self.zVoltage = 0.0
+        self.lock = threading.RLock()
+        self.computeTime = 0.0
+        self.lastUpdate = self.now()
+        for name in self.modes:
+            self.modes[name].envelope = self.steadyState(name)
+            self.modes[name].filtered = 4 * [self.modes[name].envelope]
+
+    @staticmethod
+    def now() -> float:
+        return clock.monotonic()
+
+    def other(self, name: str) -> str:
+        return "shear" if name == "normal" else "normal"
+
+    def distance(self) -> float:
+        """Distance between fork and surface in mm, negative in contact."""
+        return (self.zContact - self.zVoltage) * self.mmPerVolt
+
+    def resonance(self, name: str) -> tuple[float, float]:
+        """Current resonance frequency and Q of a mode, including coupling and the surface."""
+        mode = self.modes[name]
+        other = self.modes[self.other(name)]
+        motion = abs(other.envelope) / (other.peakAmplitude * max(other.drive, 1e-12))
+        fRes = mode.fRes + self.crossShift[name] * min(motion, 1.0) ** 2
+
+        d = self.distance()
+        if d <= 0:
+            return fRes, 0.5
+        Q = mode.Q / (1 + self.squeezeRange / d)
+        return fRes, Q
+
+    def steadyState(self, name: str) -> complex:
+        """Lock-in reading X + iY the mode settles to at the current drive."""
+        mode = self.modes[name]
+        if not mode.output:
+            return 0j
+        fRes, Q = self.resonance(name)
+        ratio = mode.frequency / fRes
+        response = 1 / (1 - ratio**2 + 1j * ratio / Q)
+        # 90 deg rotation puts the phase at 0 on resonance, positive below it; the peak drops with Q
+        return (
+            1j
+            * mode.peakAmplitude
+            * mode.drive
+            * response
+            / mode.Q
+            * np.exp(1j * np.deg2rad(mode.lockInPhase))
+        )
+
+    def ringdown(self, name: str) -> float:
+        fRes, Q = self.resonance(name)
+        return Q / (np.pi * fRes)
+
+    def update(self) -> None:
+        """Advances the fork motion and the lock-in filters to the current time."""
+        with self.lock:
+            now = self.now()
+            elapsed = now - self.lastUpdate
+            self.lastUpdate = now
+            if elapsed <= 0:
+                return
+
+            tPre = time.perf_counter()
+            self._integrate(elapsed)
+            self.computeTime += time.perf_counter() - tPre
+
+    def _integrate(self, elapsed: float) -> None:
+        # the targets are recomputed every step, as the modes shift each other's resonance while they ring up
+        settled = all(
+            elapsed > 30 * (self.ringdown(name) + mode.order * mode.timeConstant)
+            for name, mode in self.modes.items()
+        )
+        if settled:
+            for _ in range(3):
+                for name, mode in self.modes.items():
+                    mode.envelope = self.steadyState(name)
+            for mode in self.modes.values():
+                mode.filtered = 4 * [mode.envelope]
+            return
+
+        tMin = min(min(self.ringdown(name), mode.timeConstant) for name, mode in self.modes.items())
+        steps = int(min(2000, np.ceil(elapsed / (tMin / 4))))
+        h = elapsed / steps
+        for _ in range(steps):
+            targets = {name: self.steadyState(name) for name in self.modes}
+            for name, mode in self.modes.items():
+                aRing = 1 - np.exp(-h / self.ringdown(name))
+                aFilter = 1 - np.exp(-h / mode.timeConstant)
+                mode.envelope += (targets[name] - mode.envelope) * aRing
+                mode.filtered[0] += (mode.envelope - mode.filtered[0]) * aFilter
+                for i in range(1, mode.order):
+                    mode.filtered[i] += (mode.filtered[i - 1] - mode.filtered[i]) * aFilter
+
+    def reading(self, name: str) -> complex:
+        """Noisy lock-in output X + iY of a mode."""
+        self.update()
+        mode = self.modes[name]
+        noise = self.noise * (self.rng.standard_normal() + 1j * self.rng.standard_normal())
+        return mode.filtered[mode.order - 1] + noise
+
+    def setDrive(
+        self,
+        name: str,
+        frequency: float | None = None,
+        drive: float | None = None,
+        output: bool | None = None,
+    ) -> None:
+        self.update()
+        with self.lock:
+            mode = self.modes[name]
+            if frequency is not None:
+                mode.frequency = frequency
+            if drive is not None:
+                mode.drive = drive
+            if output is not None:
+                mode.output = output
+
+    def setZ(self, voltage: float) -> None:
+        self.update()
+        with self.lock:
+            self.zVoltage = voltage
+
+    def trueResonance(
+        self, name: str, otherFrequency: float | None = None, zVoltage: float | None = None
+    ) -> float:
+        """
+        Ground truth resonance frequency of a mode
+
+        The frequency a mode locks to when driven at it, with the other mode in steady state at
+        `otherFrequency` and the Z-stage at `zVoltage`, the current drive / position when `None`.
+        """
+        mode, other = self.modes[name], self.modes[self.other(name)]
+        with self.lock:
+            saved = (mode.frequency, mode.envelope, other.frequency, other.envelope, self.zVoltage)
+            try:
+                if otherFrequency is not None:
+                    other.frequency = otherFrequency
+                if zVoltage is not None:
+                    self.zVoltage = zVoltage
+                # the mode's own motion shifts the other mode, which shifts it back: iterate to the fixed point
+                for _ in range(5):
+                    mode.frequency = self.resonance(name)[0]
+                    for _ in range(3):
+                        mode.envelope = self.steadyState(name)
+                        other.envelope = self.steadyState(self.other(name))
+                return float(self.resonance(name)[0])
+            finally:
+                mode.frequency, mode.envelope, other.frequency, other.envelope, self.zVoltage = saved
+
+    def trueReading(self, name: str, fNormal: float, fShear: float) -> complex:
+        """Ground truth steady state lock-in reading of a mode with both modes driven at the given frequencies."""
+        with self.lock:
+            saved = {n: (m.frequency, m.envelope) for n, m in self.modes.items()}
+            try:
+                self.modes["normal"].frequency = fNormal
+                self.modes["shear"].frequency = fShear
+                for _ in range(3):
+                    for n, m in self.modes.items():
+                        m.envelope = self.steadyState(n)
+                return complex(self.modes[name].envelope)
+            finally:
+                for n, m in self.modes.items():
+                    m.frequency, m.envelope = saved[n]
+
+    def height(self) -> float:
+        """Height gauge reading in mm, zero at contact and positive beyond."""
+        return -self.distance() + self.rng.normal(0, 1e-5)
+
+
+class _LockInLink:
+    """Serial link to a simulated SR830, answers its commands from the fork model."""
+
+    def __init__(self, fork: ForkModel, mode: str, latency: float) -> None:
+        self.fork = fork
+        self.mode = mode
+        self.latency = latency
+        self.replies: list[str] = []
+        self.binary = b""
+
+        self.commands = 0
+        self.sensitivity = 22
+        self.slope = 1
+        self.reserve = 1
+        self.sineAmplitude = 1.0
+        self.esr = 0
+        self.lias = 0
+
+        self.sampleRate = 13
+        self.bufferStart: float | None = None
+        self.bufferPoints = 0
+
+        self._setTimeConstant(8)
+        self._setSlope(1)
+
+    def _setTimeConstant(self, index: int) -> None:
+        self.timeConstant = index
+        self.fork.modes[self.mode].timeConstant = TIME_CONSTANTS[index]
+
+    def _setSlope(self, index: int) -> None:
+        self.slope = index
+        self.fork.modes[self.mode].order = index + 1
+
+    def _output(self) -> dict[int, float]:
+        z = self.fork.reading(self.mode)
+        if abs(z) > SENSITIVITIES[self.sensitivity]:
+            self.lias |= 1 << 2
+        aux = [0.0, 0.0, 0.0, 0.0]
+        values = {
+            1: z.real,
+            2: z.imag,
+            3: abs(z),
+            4: float(np.rad2deg(np.angle(z))),
+            9: self.fork.modes[self.mode].frequency,
+            10: abs(z),
+            11: float(np.rad2deg(np.angle(z))),
+        }
+        for i, a in enumerate(aux):
+            values[5 + i] = a
+        # a clipped output reads full scale
+        scale = SENSITIVITIES[self.sensitivity]
+        for i in [1, 2, 3, 10]:
+            values[i] = float(np.clip(values[i], -1.09 * scale, 1.09 * scale))
+        return values
+
+    def _points(self) -> int:
+        if self.bufferStart is None:
+            return self.bufferPoints
+        elapsed = self.fork.now() - self.bufferStart
+        return min(BUFFER_SIZE, self.bufferPoints + int(elapsed * SAMPLE_RATES[self.sampleRate]))
+
+    def _execute(self, command: str) -> None:
+        command = command.strip()
+        if command == "":
+            return
+        name, _, argument = command.partition(" ")
+        name = name.upper()
+        args = [a.strip() for a in argument.split(",") if a.strip() != ""]
+
+        if name == "OUTP?":
+            self.replies.append(f"{self._output()[int(args[0])]:.6e}")
+        elif name == "SNAP?":
+            out = self._output()
+            self.replies.append(",".join(f"{out[int(a)]:.6e}" for a in args))
+        elif name == "FREQ?":
+            self.replies.append(f"{self.fork.modes[self.mode].frequency:.4f}")
+        elif name == "FREQ":
+            self.fork.setDrive(self.mode, frequency=float(args[0]))
+        elif name == "SLVL?":
+            self.replies.append(f"{self.sineAmplitude:.3f}")
+        elif name == "SLVL":
+            self.sineAmplitude = float(args[0])
+            self.fork.setDrive(self.mode, drive=self.sineAmplitude)
+        elif name in ["SENS?", "OFLT?", "OFSL?", "RMOD?"]:
+            value = {
+                "SENS?": self.sensitivity,
+                "OFLT?": self.timeConstant,
+                "OFSL?": self.slope,
+                "RMOD?": self.reserve,
+            }[name]
+            self.replies.append(str(value))
+        elif name == "SENS":
+            self.sensitivity = int(args[0])
+        elif name == "OFLT":
+            self._setTimeConstant(int(args[0]))
+        elif name == "OFSL":
+            self._setSlope(int(args[0]))
+        elif name == "RMOD":
+            self.reserve = int(args[0])
+        elif name == "*ESR?":
+            self.replies.append(str(self.esr))
+            self.esr = 0
+        elif name == "LIAS?":
+            self._output()
+            self.replies.append(str(self.lias))
+            self.lias = 0
+        elif name == "OUTX?":
+            self.replies.append("0")
+        elif name == "*IDN?":
+            self.replies.append("Stanford_Research_Systems,SR830,s/n00000,ver1.07")
+        elif name == "SRAT":
+            self.sampleRate = int(args[0])
+        elif name == "STRT":
+            if self.bufferStart is None:
+                self.bufferStart = self.fork.now()
+        elif name == "PAUS":
+            self.bufferPoints = self._points()
+            self.bufferStart = None
+        elif name == "REST":
+            self.bufferPoints = 0
+            self.bufferStart = None
+        elif name == "SPTS?":
+            self.replies.append(str(self._points()))
+        elif name in ["TRCB?", "TRCL?"]:
+            channel, start, count = (int(a) for a in args)
+            values = np.empty(count, dtype=np.float32)
+            for i in range(count):
+                out = self._output()
+                values[i] = out[3] if channel == 1 else out[4]
+            if name == "TRCB?":
+                self.binary += values.astype("<f4").tobytes()
+            else:
+                exponent = np.where(values != 0, np.floor(np.log2(np.abs(values) + 1e-30)) - 14, 0)
+                mantissa = np.round(values / np.exp2(exponent)).astype("<i2")
+                words = np.empty(count, dtype=[("m", "<i2"), ("e", "<i2")])
+                words["m"] = mantissa
+                words["e"] = (exponent + 124).astype("<i2")
+                self.binary += words.tobytes()
+        elif name in ["DDEF", "SEND", "TSTR", "OUTX", "LOCL", "FAST"]:
+            pass
+        else:
+            self.esr |= 1 << 5
+
+    def write(self, data: str) -> None:
+        self.commands += 1
+        clock.getClock().advance(self.latency)
+        for command in data.replace("\n", "").replace("\r", "").split(";"):
+            self._execute(command)
+
+    def readLine(self) -> str:
+        if len(self.replies) == 0:
+            return ""
+        return self.replies.pop(0)
+
+    def readExact(self, size: int) -> bytes:
+        data, self.binary = self.binary[:size], self.binary[size:]
+        return data
+
+    def reset_input_buffer(self) -> None:
+        self.replies.clear()
+        self.binary = b""
+
+    def close(self) -> None:
+        pass
+
+
+class SimulatedSR830(SR830):
+    def __init__(
+        self,
+        fork: ForkModel,
+        mode: str = "normal",
+        latency: float = 0.0,
+        readDrops: int = 3,
+        sentinel: bool | None = None,
+    ) -> None:
+        """
+        SR830 reading one mode of a `ForkModel`.
+
+        :param mode: `"normal"` or `"shear"`.
+        :type mode: str
+
+        :param latency: Delay per command, to mimic the serial round-trip, in s. default: `0.0`
+        :type latency: float
+        """
+        self.SN = f"simulated-{mode}"
+        self.transport = _LockInLink(fork, mode, latency)
+        self.ser = self.transport
+        self.readDrops = readDrops
+        self.sentinel = sentinel
+
+        self.queries = 0
+        self.retries = 0
+
+        self.state = {name: None for name in STATE_COMMANDS}
+
+
+class _PIDevice:
+    """GCS calls used by `E625`, moving the fork model."""
+
+    def __init__(self, fork: ForkModel, latency: float) -> None:
+        self.fork = fork
+        self.latency = latency
+        self.voltage = 0.0
+        self.commands = 0
+
+    def SVO(self, axis, closed) -> None:
+        self.commands += 1
+        clock.getClock().advance(self.latency)
+
+    def SVA(self, axis, voltage) -> None:
+        self.commands += 1
+        clock.getClock().advance(self.latency)
+        self.voltage = float(voltage)
+        self.fork.setZ(self.voltage)
+
+    def SVR(self, axis, voltage) -> None:
+        self.SVA(axis, self.voltage + float(voltage))
+
+    def qVOL(self, axis) -> dict[str, float]:
+        self.commands += 1
+        clock.getClock().advance(self.latency)
+        return {axis: self.voltage}
+
+    def _cleanup(self) -> None:
+        pass
+
+
+class SimulatedE625(E625):
+    def __init__(self, fork: ForkModel, latency: float = 0.0) -> None:
+        self.pidevice = _PIDevice(fork, latency)
+        self.stopMutex = threading.Lock()
+        self._stop = True
+        self.target = "A"
+
+
+class _GaugeLink:
+    """Serial link to a simulated Mitutoyo gauge."""
+
+    def __init__(self, fork: ForkModel, latency: float) -> None:
+        self.fork = fork
+        self.latency = latency
+        self.replies: list[str] = []
+        self.commands = 0
+
+    def write(self, data: str) -> None:
+        self.commands += 1
+        clock.getClock().advance(self.latency)
+        command = data.strip()
+        # every reply starts with a status byte, "0" for ok
+        if command == "1":
+            self.replies.append(f"01A{self.fork.height():+010.5f}")
+        elif command == "V":
+            self.replies.append("0Simulated Mitutoyo")
+
+    def readLine(self) -> str:
+        return self.replies.pop(0) if len(self.replies) > 0 else ""
+
+    def close(self) -> None:
+        pass
+
+
+class SimulatedMitutoyo(mitutoyo):
+    def __init__(self, fork: ForkModel, latency: float = 0.0) -> None:
+        self.transport = _GaugeLink(fork, latency)
+        self.ser = self.transport
+
+
+class SimulatedRigolDG(RigolDG):
+    def __init__(self, fork: ForkModel, latency: float = 0.0) -> None:
+        """Two channel function generator, channel 1 drives the normal and channel 2 the shear mode."""
+        self.fork = fork
+        self.latency = latency
+        self.verbose = False
+        self.logger = logging.getLogger("rigol_dg1022")
+        self.inst = self
+        self.channels = {
+            1: {"FREQ": fork.modes["normal"].frequency, "VOLT": 1.0, "FUNC": "SIN", "OUTP": True},
+            2: {"FREQ": fork.modes["shear"].frequency, "VOLT": 1.0, "FUNC": "SIN", "OUTP": True},
+        }
+        self.commands = 0
+
+    def _apply(self, channel: int) -> None:
+        settings = self.channels[channel]
+        self.fork.setDrive(
+            "normal" if channel == 1 else "shear",
+            frequency=settings["FREQ"],
+            drive=settings["VOLT"],
+            output=settings["OUTP"],
+        )
+
+    def _send_command(self, command, check_errors=False, delay=0.0, max_retries=3):
+        self.commands += 1
+        clock.getClock().advance(self.latency)
+        match = re.match(r":SOUR(\d):(FREQ|VOLT|FUNC) (\S+)", command)
+        if match:
+            channel, key, value = int(match[1]), match[2], match[3]
+            self.channels[channel][key] = value if key == "FUNC" else float(value)
+            self._apply(channel)
+            return
+        match = re.match(r":OUTP(\d) (ON|OFF)", command)
+        if match:
+            self.channels[int(match[1])]["OUTP"] = match[2] == "ON"
+            self._apply(int(match[1]))
+
+    def _query(self, query, max_retries=3, retry_delay=0.5):
+        self.commands += 1
+        clock.getClock().advance(self.latency)
+        match = re.match(r":SOUR(\d):(FREQ|VOLT|FUNC)\?", query)
+        if match:
+            return str(self.channels[int(match[1])][match[2]])
+        match = re.match(r":OUTP(\d)\?", query)
+        if match:
+            return "ON" if self.channels[int(match[1])]["OUTP"] else "OFF"
+        if query == "*IDN?":
+            return "Rigol Technologies,DG1062Z,SIMULATED,00.00"
+        return ""
+
+    def close(self):
+        self.inst = None
+
+
+def simulatedSetup(
+    latency: float = 0.0, **kwargs
+) -> tuple[ForkModel, SimulatedSR830, SimulatedSR830, SimulatedRigolDG, SimulatedE625, SimulatedMitutoyo]:
+    """
+    Complete simulated setup, as used in `main.py`.
+
+    `kwargs` go to `ForkModel`, `latency` is the delay per instrument command in s.
+
+    :returns: (fork, ctrlNormal, ctrlShear, freqGen, zStage, hDev)
+    """
+    fork = ForkModel(**kwargs)
+    return (
+        fork,
+        SimulatedSR830(fork, "normal", latency),
+        SimulatedSR830(fork, "shear", latency),
+        SimulatedRigolDG(fork, latency),
+        SimulatedE625(fork, latency),
+        SimulatedMitutoyo(fork, latency),
+    )
@@ -0,0 +1,427 @@
+"""
+Automatic gain tuning of the SFA Controller (`SFA_Controller.py`)
+
+The firmware steps a mode once per lock-in reading (see `SFAController.setControlInterval`) with
+
+    frequency += ±exponential θ² + linear θ          (θ in deg, limited to ±0.5 Hz)
+    amplitude += amplitudeLinear (setpoint - R)
+
+The loop is modelled and tuned per reading, the terms hold for the control interval they were tuned at.
+
+`autotune` identifies the loop of one mode from the stream: with the frequency controller off it steps
+the drive by `step` and back, and fits the phase readings to a first-order lag per reading
+
+    θ[k] = a θ[k-1] + (1 - a) K (f0 - f[k-1])
+
+with `a` the pole of the fork and lock-in between two readings, `K` the phase slope at resonance in
+deg/Hz and f0 the resonance. With the linear term the closed loop has the eigenvalues of
+[[1, -linear], [(1 - a) K, a - (1 - a) K linear]], their product is always `a`: below the critically
+damped
+
+    linear = (1 - √a)² / ((1 - a) K)
+
+one eigenvalue is slower than √a, above it they are complex with modulus √a, so larger terms only
+change the shape of the response. `gains` steps the model from the critical term up and keeps the
+fastest one whose overshoot stays within the lock tolerance. Far from resonance the phase flattens
+(θ = atan(2 Δf / γ)), the exponential term is fitted so the correction stays the same fraction of the
+frequency error up to `phaseRange`. The amplitude controller gets the critical term with the gain
+R / drive at resonance instead of K.
+
+The tuned gains are checked with a step of the locked loop and kept per sample, medium and mode in a
+`GainStore`, `loadGains` applies them again.
+
+Example:
+    sfa = SFAController(port="COM5")
+    sfa.setFrequency(791.3)
+    sfa.frequencyPreset(1)
+    sfa.enableFrequencyController(True)  # lock before tuning
+    clock.sleep(5)
+    tuned = autotune(sfa, "normal", sample="fork 3", medium="20 cSt")
+    ...
+    loadGains(sfa, "fork 3", "20 cSt", "normal")
+"""
+
+import json
+import os
+import clock
+import numpy as np
+
+from SFA_Controller import SFAController
+
+
+GAINS_FILE: str = os.path.join(os.path.expanduser("~"), ".tuning_fork_gains.json")
+
+GAIN_KEYS: list[str] = ["exponential", "linear", "amplitudeLinear"]
+"""Gains `autotune` sets: the `SCe`, `SCl` and `SCAl` terms of a mode."""
+
+
+class GainStore:
+    def __init__(self, path: str | os.PathLike = GAINS_FILE) -> None:
+        """
+        Tuned controller gains per sample, medium and mode, kept on disk
+
+        :param path: JSON file with the gains, `""` keeps them in memory only. default: `GAINS_FILE`
+        :type path: str | os.PathLike
+        """
+        self.path = path
+        self.cache: dict[str, dict[str, float]] = {}
+
+        if self.path != "" and os.path.exists(self.path):
+            try:
+                with open(self.path) as file:
+                    self.cache = dict(json.load(file))
+            except (OSError, ValueError):
+                self.cache = {}
+
+    @staticmethod
+    def key(sample: str, medium: str, mode: str = "normal") -> str:
+        return f"{sample}/{medium}/{mode}"
+
+    def get(self, sample: str, medium: str, mode: str = "normal") -> dict[str, float] | None:
+        """Stored result of `autotune`, `None` if this sample was not tuned in this medium."""
+        return self.cache.get(self.key(sample, medium, mode))
+
+    def put(self, sample: str, medium: str, mode: str, tuned: dict[str, float]) -> None:
+        self.cache[self.key(sample, medium, mode)] = {key: float(value) for key, value in tuned.items()}
+        self.save()
+
+    def save(self) -> None:
+        if self.path == "":
+            return
+        try:
+            with open(self.path, "w") as file:
+                json.dump(self.cache, file, indent=2)
+        except OSError as e:
+            print(f"Could not save controller gains '{self.path}': {e}")
+
+    def forget(self, key: str | None = None) -> None:
+        """Drops the gains of one key, or all of them for `None`."""
+        if key is None:
+            self.cache.clear()
+        else:
+            self.cache.pop(key, None)
+        self.save()
+
+
+_defaultStore: GainStore | None = None
+
+
+def defaultStore() -> GainStore:
+    """Gain store shared by `autotune` and `loadGains` when they are not given one."""
+    global _defaultStore
+    if _defaultStore is None:
+        _defaultStore = GainStore()
+    return _defaultStore
+
+
+def __fields(mode: str) -> tuple[str, str, str, str]:
+    """Stream fields (frequency, amplitude, phase, inputAmplitude) of a mode."""
+    suffix = {"normal": "", "shear": "Shear"}.get(mode)
+    if suffix is None:
+        raise ValueError(f"Unknown mode '{mode}'!")
+    return tuple(f"{name}{suffix}" for name in ["frequency", "amplitude", "phase", "inputAmplitude"])
+
+
+def readings(samples: np.ndarray, mode: str = "normal") -> np.ndarray:
+    """
+    Stream samples that carry a new lock-in reading of `mode`
+
+    The binary stream sends a sample for a reading of either mode, the other mode repeats its last
+    reading. A sample is kept when its phase or R differs from the sample before. The text stream sends
+    one line per `STREAM_INTERVAL` at most and misses readings at shorter control intervals.
+    """
+    if len(samples) == 0:
+        return samples
+    _, _, phase, inputAmplitude = __fields(mode)
+    changed = (np.diff(samples[phase]) != 0) | (np.diff(samples[inputAmplitude]) != 0)
+    return samples[np.concatenate([[True], changed])]
+
+
+def __record(sfa: SFAController, mode: str, n: int, timeout: float) -> np.ndarray:
+    """Waits for `n` new readings of `mode` in the stream, fewer if the timeout passed first."""
+    since = sfa.buffer.count
+    deadline = clock.monotonic() + timeout
+    fresh = readings(sfa.snapshot(since), mode)
+    while len(fresh) < n and (remaining := deadline - clock.monotonic()) > 0:
+        if len(sfa.next(n - len(fresh), timeout=remaining)) == 0:
+            break
+        fresh = readings(sfa.snapshot(since), mode)
+    return fresh[:n]
+
+
+def identify(
+    samples: np.ndarray | list[np.ndarray],
+    mode: str = "normal",
+    phaseRange: float = 45.0,
+    signless: bool = False,
+) -> dict[str, float]:
+    """
+    Fits the loop model of `mode` to stream samples of a frequency step
+
+    The frequency of a sample is the one set after its reading, so a reading belongs to the frequency of
+    the sample before it. Give separately recorded stretches as a list of segments: the drive changed
+    between them, so no reading is paired with the last one of the segment before.
+
+    :param samples: Stream samples or a list of segments of them, `readings` of one mode are used.
+    :type samples: np.ndarray | list[np.ndarray]
+
+    :param mode: Mode to identify, `"normal"` or `"shear"`. default: `"normal"`
+    :type mode: str
+
+    :param phaseRange: Readings with a larger |θ| in deg are left out, the model is linear in θ. default: `45.0`
+    :type phaseRange: float
+
+    :param signless: Leave out θ in [0, 1) deg, the text stream drops the sign of values between -1 and 0. default: `False`
+    :type signless: bool
+
+    :raises RuntimeError: Too few usable readings, or the fit is not a stable lag towards the resonance.
+
+    :returns: pole `a` per reading, phaseSlope `K` (deg/Hz), fRes (Hz), linewidth (FWHM in Hz) and amplitudeGain (R per V of drive at resonance).
+    :rtype: dict[str, float]
+    """
+    frequency, amplitude, phase, inputAmplitude = __fields(mode)
+    segments = [readings(segment, mode) for segment in (samples if isinstance(samples, list) else [samples])]
+
+    # row k needs reading k-1 and the frequency set after it, both from the same segment
+    X, y = [], []
+    for data in segments:
+        theta = data[phase]
+        usable = np.abs(theta) <= phaseRange
+        if signless:
+            usable &= ~((theta >= 0) & (theta < 1))
+        rows = usable[1:] & usable[:-1]
+        X.append(np.column_stack([theta[:-1][rows], np.ones(np.count_nonzero(rows)), -data[frequency][:-1][rows]]))
+        y.append(theta[1:][rows])
+    X, y = np.concatenate(X), np.concatenate(y)
+    if len(y) < 6:
+        raise RuntimeError(f"Only {len(y)} usable readings, lock the mode before tuning!")
+    (a, b, c), *_ = np.linalg.lstsq(X, y, rcond=None)
+    if not (0 <= a < 1) or c <= 0:
+        raise RuntimeError(f"Identification failed (pole {a:.3g}, gain {c:.3g}), use a larger step or more readings!")
+
+    K = c / (1 - a)
+    # R = A0 cos θ for the driven oscillator, near resonance
+    data = np.concatenate(segments)
+    near = np.abs(data[phase]) <= 10
+    ratio = data[inputAmplitude][near] / (data[amplitude][near] * np.cos(np.deg2rad(data[phase][near])))
+    return {
+        "pole": float(a),
+        "phaseSlope": float(K),
+        "fRes": float(b / c),
+        "linewidth": float(360 / (np.pi * K)),
+        "amplitudeGain": float(np.median(ratio)) if len(ratio) > 0 else np.nan,
+    }
+
+
+def __settled(theta: np.ndarray, tolerance: float) -> tuple[int, float]:
+    """Readings until |θ| stays within `tolerance` and the overshoot in deg past the side of the largest |θ|."""
+    if len(theta) == 0:
+        return 0, np.nan
+    outside = np.flatnonzero(np.abs(theta) > tolerance)
+    settled = int(outside[-1]) + 1 if len(outside) > 0 else 0
+    # the first readings can be from before the step
+    side = np.sign(theta[np.argmax(np.abs(theta))])
+    return settled, float(max(0.0, np.max(-side * theta)))
+
+
+def __exponential(linear: float, fraction: float, linewidth: float, phaseRange: float) -> float:
+    """Exponential term with which the correction stays `fraction` of the frequency error up to `phaseRange`."""
+    # least squares of linear θ + exponential θ² = fraction Δf(θ), with Δf = γ / 2 tan θ
+    theta = np.linspace(0, phaseRange, 61)[1:]
+    remainder = fraction * linewidth / 2 * np.tan(np.deg2rad(theta)) - linear * theta
+    return max(float(np.sum(theta**2 * remainder) / np.sum(theta**4)), 0.0)
+
+
+def __stepResponse(
+    model: dict[str, float], exponential: float, linear: float, offset: float, n: int = 400
+) -> np.ndarray:
+    """Phase readings in deg of the model after the drive jumped `offset` Hz above the resonance."""
+    a, linewidth = model["pole"], model["linewidth"]
+    theta, detuning = 0.0, offset
+    history = np.empty(n)
+    for k in range(n):
+        theta = a * theta + (1 - a) * np.rad2deg(np.arctan(-2 * detuning / linewidth))
+        history[k] = theta
+        correction = (exponential if theta >= 0 else -exponential) * theta**2 + linear * theta
+        detuning += float(np.clip(correction, -0.5, 0.5))
+    return history
+
+
+def gains(model: dict[str, float], phaseRange: float = 60.0, tolerance: float = 1.0) -> dict[str, float]:
+    """
+    Fastest non-ringing controller terms for a loop model of `identify`
+
+    Starts from the critically damped linear term and tries up to 4 times larger ones, with the
+    exponential term fitted to each. The model is stepped by the detuning of 5 deg and of `phaseRange`,
+    the terms whose overshoot stays within `tolerance` in both and that settle in the fewest readings win.
+
+    :param model: Result of `identify`.
+    :type model: dict[str, float]
+
+    :param phaseRange: Phase in deg up to which the exponential term follows the flattening of the phase. default: `60.0`
+    :type phaseRange: float
+
+    :param tolerance: Phase error in deg within which the loop counts as settled and overshoot does not count as ringing. default: `1.0`
+    :type tolerance: float
+
+    :returns: exponential and linear term of the frequency controller, amplitudeLinear of the amplitude controller (NaN without amplitudeGain).
+    :rtype: dict[str, float]
+    """
+    a, K, linewidth = model["pole"], model["phaseSlope"], model["linewidth"]
+    critical = (1 - np.sqrt(a)) ** 2 / ((1 - a) * K)
+    offsets = linewidth / 2 * np.tan(np.deg2rad([5.0, phaseRange]))
+
+    best: tuple[int, float, float] | None = None
+    for linear in critical * np.geomspace(1, 4, 25):
+        # fraction of the frequency error corrected per reading near resonance
+        exponential = __exponential(linear, min(linear * K, 1.0), linewidth, phaseRange)
+        responses = [__settled(__stepResponse(model, exponential, linear, offset), tolerance) for offset in offsets]
+        if any(overshoot > tolerance for _, overshoot in responses):
+            continue
+        settled = max(settled for settled, _ in responses)
+        if best is None or settled < best[0]:
+            best = (settled, exponential, linear)
+    if best is None:
+        # even critical damping overshoots by the exponential term, drop it
+        best = (0, 0.0, critical)
+
+    amplitudeGain = model.get("amplitudeGain", np.nan)
+    amplitudeLinear = (1 - np.sqrt(a)) ** 2 / ((1 - a) * amplitudeGain) if amplitudeGain > 0 else np.nan
+    return {"exponential": best[1], "linear": float(best[2]), "amplitudeLinear": float(amplitudeLinear)}
+
+
+def applyGains(sfa: SFAController, tuned: dict[str, float], mode: str = "normal") -> None:
+    """Sets the `GAIN_KEYS` of `tuned` on the controller, NaN values are left as they are."""
+    setters = {
+        "exponential": sfa.setExponentialTerm,
+        "linear": sfa.setLinearTerm,
+        "amplitudeLinear": sfa.setAmplitudeLinearTerm,
+    }
+    for key in GAIN_KEYS:
+        if np.isfinite(tuned.get(key, np.nan)):
+            setters[key](tuned[key], mode)
+
+
+def loadGains(
+    sfa: SFAController, sample: str, medium: str, mode: str = "normal", store: GainStore | None = None
+) -> dict[str, float] | None:
+    """Applies the stored gains of `sample` in `medium`, returns them or `None` if it was not tuned yet."""
+    tuned = (store or defaultStore()).get(sample, medium, mode)
+    if tuned is None:
+        print(f"No tuned gains for {GainStore.key(sample, medium, mode)}, use a preset or autotune.")
+        return None
+    applyGains(sfa, tuned, mode)
+    return tuned
+
+
+def settling(samples: np.ndarray, mode: str = "normal", tolerance: float = 1.0) -> tuple[int, float]:
+    """
+    Lock response of `mode` in stream samples that start with a step
+
+    Returns the number of readings until |θ| stays within `tolerance` deg (the number of readings if
+    it does not) and the overshoot: the largest phase in deg on the other side of the step, the side of
+    the largest |θ|.
+    """
+    return __settled(readings(samples, mode)[__fields(mode)[2]], tolerance)
+
+
+def autotune(
+    sfa: SFAController,
+    mode: str = "normal",
+    sample: str = "",
+    medium: str = "",
+    step: float = 0.1,
+    n: int = 30,
+    timeout: float = 30.0,
+    phaseRange: float = 60.0,
+    tolerance: float = 1.0,
+    binary: bool = True,
+    validate: bool = True,
+    store: GainStore | None = None,
+) -> dict[str, float]:
+    """
+    Tunes the frequency and amplitude controller of one mode
+
+    Start with the mode locked (or the drive near the resonance). The frequency controller of the mode
+    is switched off, the drive stepped by `step` for `n` readings and back for `n` readings, the loop
+    identified (`identify`) and the gains (`gains`) set. With `validate` the controller is switched on
+    again and the drive stepped by `step` from the identified resonance to record the lock response
+    (`2 n` readings).
+    The stream is left running.
+
+    :param sfa: SFA Controller to tune.
+    :type sfa: SFAController
+
+    :param mode: `"normal"` or `"shear"`. default: `"normal"`
+    :type mode: str
+
+    :param sample: Sample (fork) name to store the gains under, nothing is stored without sample and medium. default: `""`
+    :type sample: str
+
+    :param medium: Medium name to store the gains under, e.g. `"20 cSt"`. default: `""`
+    :type medium: str
+
+    :param step: Frequency step in Hz, a few tenths of the linewidth. default: `0.1`
+    :type step: float
+
+    :param n: Readings per step. default: `30`
+    :type n: int
+
+    :param timeout: Longest wait for the readings of one step, in s. default: `30.0`
+    :type timeout: float
+
+    :param phaseRange: Phase range of the exponential term in deg, see `gains`. default: `60.0`
+    :type phaseRange: float
+
+    :param tolerance: Phase error in deg within which the lock response counts as settled. default: `1.0`
+    :type tolerance: float
+
+    :param binary: Record from the binary stream, the text stream (`Ed`) loses the sign of phases between -1 and 0 deg and misses readings at control intervals below `STREAM_INTERVAL`. default: `True`
+    :type binary: bool
+
+    :param validate: Record the lock response with the tuned gains. default: `True`
+    :type validate: bool
+
+    :param store: Store for the gains. default: shared store
+    :type store: GainStore | None
+
+    :returns: The gains of `gains`, the model of `identify` and with `validate` settlingReadings and overshoot (deg) of `settling`.
+    :rtype: dict[str, float]
+    """
+    if not sfa.streaming or sfa.binary != binary:
+        sfa.stream(True, binary=binary)
+
+    sfa.enableFrequencyController(False, mode)
+    start = sfa.readFrequency(mode)
+    if not np.isfinite(start):
+        raise RuntimeError("Could not read the frequency of the controller!")
+    # the first readings after switching off can still be of the controller
+    __record(sfa, mode, 2, timeout)
+
+    sfa.setFrequency(start + step, mode)
+    stepped = __record(sfa, mode, n, timeout)
+    sfa.setFrequency(start, mode)
+    back = __record(sfa, mode, n, timeout)
+
+    model = identify([stepped, back], mode, min(phaseRange, 45.0), signless=not binary)
+    tuned = gains(model, phaseRange, tolerance)
+    applyGains(sfa, tuned, mode)
+    tuned.update(model)
+
+    if validate:
+        sfa.setFrequency(model["fRes"] + step, mode)
+        sfa.enableFrequencyController(True, mode)
+        response = __record(sfa, mode, 2 * n, 2 * timeout)
+        tuned["settlingReadings"], tuned["overshoot"] = settling(response, mode, tolerance)
+    else:
+        sfa.setFrequency(model["fRes"], mode)
+        sfa.enableFrequencyController(True, mode)
+
+    print(
+        f"Tuned {mode} mode: exponential {tuned['exponential']:.3g}, linear {tuned['linear']:.3g}, "
+        f"amplitude linear {tuned['amplitudeLinear']:.3g} "
+        f"(pole {model['pole']:.3f}, linewidth {model['linewidth']:.3g} Hz)"
+    )
+    if sample != "" and medium != "":
+        (store or defaultStore()).put(sample, medium, mode, tuned)
+    return tuned
@@ -0,0 +1,87 @@
+"""
+Host benchmark of the SFA Controller firmware loop
+
+Compiles `SFA_Controller.ino` with g++ against the stand-in Arduino core in `benchmarks/firmware` and
+runs it for a number of virtual seconds against two simulated SR830 lock-ins (see `harness.cpp`), once
+for the working tree and once for the firmware of `--baseline` (a git revision). Per firmware the
+report holds loop iterations, lock-in readings, frequency controller steps and stream lines per second,
+and the time until each mode's drive got within 0.01 Hz of its resonance.
+
+Like the Arduino builder, the .ino gets `#include <Arduino.h>` and prototypes of its functions before
+the first function.
+
+`--baseline` has no default: `HEAD` only differs from the working tree while the firmware has
+uncommitted changes, to compare a committed change give the revision before it, e.g. `<commit>^`.
+
+Usage: python benchmarks/bench_firmware.py --baseline <revision> [--seconds 20] [--commands "Sf 790.8;...;Ed 1;"]
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIRMWARE = os.path.join(ROOT, "benchmarks", "firmware")
+COMMANDS = "Sf 790.8;sSf 454.6;Ef 1;sEf 1;Ed 1;"
+
+FUNCTION = re.compile(r"^([A-Za-z_][\w\s\*&]*?[\s\*&])(\w+)\s*\(([^;{}()]*)\)\s*\{", re.MULTILINE)
+
+
+def arduinoSource(ino: str) -> str:
+    """The .ino as the Arduino builder compiles it: core header first, prototypes before the first function."""
+    functions = [m for m in FUNCTION.finditer(ino) if m.group(1).split()[0] not in ("else", "return", "struct")]
+    if not functions:
+        return "#include <Arduino.h>\n" + ino
+    prototypes = "".join(f"{m.group(1).strip()} {m.group(2)}({m.group(3).strip()});\n" for m in functions)
+    first = functions[0].start()
+    return "#include <Arduino.h>\n" + ino[:first] + prototypes + ino[first:]
+
+
+def build(ino: str, directory: str, name: str) -> str:
+    source = os.path.join(directory, f"{name}.cpp")
+    with open(source, "w") as file:
+        file.write(arduinoSource(ino))
+    binary = os.path.join(directory, name)
+    subprocess.run(
+        ["g++", "-std=c++17", "-O2", "-w", "-I", FIRMWARE, source, os.path.join(FIRMWARE, "harness.cpp"), "-o", binary],
+        check=True,
+    )
+    return binary
+
+
+def run(binary: str, seconds: float, commands: str) -> dict[str, float]:
+    output = subprocess.run([binary, str(seconds), commands], check=True, capture_output=True, text=True).stdout
+    return {key: float(value) for key, value in (pair.split("=") for pair in output.split())}
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--baseline", required=True, help="git revision of the firmware to compare against")
+    parser.add_argument("--seconds", type=float, default=20.0, help="virtual run time")
+    parser.add_argument("--commands", default=COMMANDS, help="commands sent to the controller at the start")
+    args = parser.parse_args(argv)
+
+    with open(os.path.join(ROOT, "SFA_Controller.ino")) as file:
+        current = file.read()
+    baseline = subprocess.run(
+        ["git", "show", f"{args.baseline}:SFA_Controller.ino"], cwd=ROOT, check=True, capture_output=True, text=True
+    ).stdout
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = {
+            args.baseline: run(build(baseline, directory, "baseline"), args.seconds, args.commands),
+            "current": run(build(current, directory, "current"), args.seconds, args.commands),
+        }
+
+    keys = list(results["current"])
+    print(f"{'':<16}" + "".join(f"{name:>14}" for name in results))
+    for key in keys:
+        print(f"{key:<16}" + "".join(f"{result[key]:>14.2f}" for result in results.values()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,295 @@
+"""
+End-to-end benchmark of the measurement routines against the simulated setup
+
+Every routine runs on a fresh `simulatedSetup` under a `VirtualClock`, so a run takes seconds and is
+reproducible. Per routine the report holds:
+
+- instrument time: virtual seconds, split into dwell (sleeps) and instrument latency
+- compute time: wall time of the routine itself, without the time spent in the fork model
+- serial round-trips per instrument
+- accuracy: error of the found resonances against the ground truth of the model
+
+and the same numbers per unit (resonance found, grid point or calibration). The report is written as
+JSON; with `--baseline` it is compared against an earlier report and the exit code is 1 when a routine
+got slower (instrument time or round-trips) or less accurate than `--tolerance` allows.
+
+Usage: python benchmarks/bench_measurements.py [--report report.json] [--baseline baseline.json] [--only PLL1D ...]
+       [--solver secant] [--coarse adaptive] [--continuation] [--precision 0.005] [--method nested] [--no-interleave]
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import numpy as np  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import clock  # noqa: E402
+from Simulated_Instruments import simulatedSetup  # noqa: E402
+from PLL import PLL1D, PLL2D, PLL2x1D  # noqa: E402
+from measurements import frequencyDependence, frequencySweep2D, viscosity1D  # noqa: E402
+from calibration import calibrateAir  # noqa: E402
+from continuation import Continuation  # noqa: E402
+
+SEED = 0
+LATENCY = 0.015
+"""Round-trip time per instrument command in s, about an SR830 query at 9600 baud."""
+
+METRICS_LOWER_IS_BETTER = ["instrumentSecondsPerUnit", "roundTripsPerUnit", "maxError"]
+
+
+def casePLL1D(setup, workDir: str, options: dict) -> tuple[int, list[float]]:
+    fork, ctrlNormal, _, freqGen, _, _ = setup
+    fRes, _, _ = PLL1D(ctrlNormal, freqGen, 789.5, 794.5, **options)
+    return 1, [fRes - fork.trueResonance("normal")]
+
+
+def casePLL2D(setup, workDir: str, options: dict) -> tuple[int, list[float]]:
+    fork, ctrlNormal, ctrlShear, freqGen, _, _ = setup
+    optNormal, optShear = PLL2D(ctrlNormal, ctrlShear, freqGen, **options)
+    return 2, [
+        optNormal[0] - fork.trueResonance("normal"),
+        optShear[0] - fork.trueResonance("shear"),
+    ]
+
+
+def casePLL2x1D(setup, workDir: str, options: dict) -> tuple[int, list[float]]:
+    fork, ctrlNormal, ctrlShear, freqGen, _, _ = setup
+    optNormal, optShear = PLL2x1D(ctrlNormal, ctrlShear, freqGen, **options)
+    return 2, [
+        optNormal[0] - fork.trueResonance("normal"),
+        optShear[0] - fork.trueResonance("shear"),
+    ]
+
+
+def caseFrequencyDependence(setup, workDir: str, options: dict) -> tuple[int, list[float]]:
+    fork, ctrlNormal, ctrlShear, freqGen, _, _ = setup
+    freqsShear = np.linspace(453.0, 457.0, 9)
+    resonance = frequencyDependence(
+        ctrlNormal,
+        ctrlShear,
+        freqGen,
+        789.5,
+        794.5,
+        freqsShear,
+        filePath=os.path.join(workDir, "frequencyDependence"),
+        **options,
+    )
+    truth = [fork.trueResonance("normal", otherFrequency=f) for f in freqsShear]
+    return len(freqsShear), list(np.subtract(resonance, truth))
+
+
+def caseFrequencySweep2D(setup, workDir: str, options: dict) -> tuple[int, list[float]]:
+    """Accuracy is the amplitude error relative to the peak amplitude of each mode."""
+    fork, ctrlNormal, ctrlShear, freqGen, _, _ = setup
+    freqsNormal = np.linspace(790.0, 793.0, 4)
+    freqsShear = np.linspace(454.0, 456.0, 4)
+    fileName = os.path.join(workDir, "frequencySweep2D")
+    frequencySweep2D(fileName, ctrlNormal, ctrlShear, freqGen, freqsNormal, freqsShear)
+
+    errors = []
+    for name, fileStem in [("normal", "NormalAmp"), ("shear", "ShearAmp")]:
+        measured = np.loadtxt(os.path.join(fileName, f"{fileStem}.csv"), delimiter=",", ndmin=2)
+        peak = fork.modes[name].peakAmplitude * fork.modes[name].drive
+        for i, fNormal in enumerate(freqsNormal):
+            for j, fShear in enumerate(freqsShear):
+                truth = abs(fork.trueReading(name, fNormal, fShear))
+                errors.append((measured[i, j] - truth) / peak)
+    return len(freqsNormal) * len(freqsShear), errors
+
+
+def caseViscosity1D(setup, workDir: str, options: dict) -> tuple[int, list[float]]:
+    fork, ctrlNormal, _, freqGen, zStage, hDev = setup
+    rows = viscosity1D(
+        ctrlNormal,
+        freqGen,
+        zStage,
+        hDev,
+        fork.modes["normal"].fRes,
+        start_V=70.0,
+        end_V=85.0,
+        filePath=os.path.join(workDir, "viscosity1D"),
+        **options,
+    )
+    measured = [row for row in rows if np.isfinite(row.get("phase(deg)", np.nan))]
+    errors = [
+        row["f_res(Hz)"] - fork.trueResonance("normal", zVoltage=row["z_voltage_cmd"])
+        for row in measured
+    ]
+    return len(measured), errors
+
+
+def caseCalibrateAir(setup, workDir: str, options: dict) -> tuple[int, list[float]]:
+    fork, ctrlNormal, ctrlShear, freqGen, _, _ = setup
+    normal, shear = calibrateAir(ctrlNormal, ctrlShear, freqGen, **options)
+    return 1, [
+        normal[0] - fork.trueResonance("normal", otherFrequency=shear[0]),
+        shear[0] - fork.trueResonance("shear", otherFrequency=normal[0]),
+    ]
+
+
+CASES = {
+    "PLL1D": casePLL1D,
+    "PLL2D": casePLL2D,
+    "PLL2x1D": casePLL2x1D,
+    "frequencyDependence": caseFrequencyDependence,
+    "frequencySweep2D": caseFrequencySweep2D,
+    "viscosity1D": caseViscosity1D,
+    "calibrateAir": caseCalibrateAir,
+}
+
+
+def runCase(name: str, seed: int = SEED, latency: float = LATENCY, options: dict | None = None) -> dict:
+    """
+    Runs one routine, `options` are passed on to it (ignored by `frequencySweep2D`)
+
+    `continuation=True` in `options` gives the routine a fresh `Continuation`.
+    """
+    options = dict(options or {})
+    if options.pop("continuation", False):
+        options["continuation"] = Continuation()
+    with clock.useClock(clock.VirtualClock(start=0.0)) as clk, tempfile.TemporaryDirectory() as workDir:
+        setup = simulatedSetup(latency=latency, seed=seed)
+        fork, ctrlNormal, ctrlShear, freqGen, zStage, hDev = setup
+
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w")
+        try:
+            tPre = time.perf_counter()
+            units, errors = CASES[name](setup, workDir, options)
+            wall = time.perf_counter() - tPre
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+        roundTrips = {
+            "lockInNormal": ctrlNormal.transport.commands,
+            "lockInShear": ctrlShear.transport.commands,
+            "freqGen": freqGen.commands,
+            "zStage": zStage.pidevice.commands,
+            "height": hDev.transport.commands,
+        }
+        total = sum(roundTrips.values())
+        errors = np.abs(np.asarray(errors, dtype=float))
+        return {
+            "units": units,
+            "instrumentSeconds": clk.monotonic(),
+            "dwellSeconds": clk.slept,
+            "latencySeconds": clk.monotonic() - clk.slept,
+            "computeSeconds": wall - fork.computeTime,
+            "roundTrips": roundTrips,
+            "roundTripsTotal": total,
+            "instrumentSecondsPerUnit": clk.monotonic() / max(units, 1),
+            "roundTripsPerUnit": total / max(units, 1),
+            "computeSecondsPerUnit": (wall - fork.computeTime) / max(units, 1),
+            "maxError": float(np.nanmax(errors)) if errors.size > 0 else None,
+            "meanError": float(np.nanmean(errors)) if errors.size > 0 else None,
+        }
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Prints the change against the baseline, returns the regressions."""
+    regressions = []
+    for name, result in report["cases"].items():
+        if name not in baseline["cases"]:
+            continue
+        base = baseline["cases"][name]
+        for metric in METRICS_LOWER_IS_BETTER:
+            new, old = result.get(metric), base.get(metric)
+            if new is None or old is None:
+                continue
+            change = (new - old) / old if old != 0 else (0.0 if new == 0 else np.inf)
+            flag = ""
+            if change > tolerance:
+                flag = "  REGRESSION"
+                regressions.append(f"{name}.{metric}")
+            print(f"{name:>20} {metric:>25}: {old:12.6g} -> {new:12.6g} ({100 * change:+7.1f}%){flag}")
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--report", default=os.path.join(os.path.dirname(__file__), "report.json"))
+    parser.add_argument("--baseline", default=None)
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed relative regression")
+    parser.add_argument("--only", nargs="*", default=list(CASES), choices=list(CASES))
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--latency", type=float, default=LATENCY)
+    parser.add_argument("--solver", default=None, choices=["proportional", "secant"], help="PLL phase solver")
+    parser.add_argument(
+        "--coarse", default=None, choices=["argmax", "fit", "adaptive"], help="PLL initial guess search"
+    )
+    parser.add_argument(
+        "--continuation", action="store_true", help="continue the resonance along frequencyDependence and viscosity1D"
+    )
+    parser.add_argument(
+        "--precision", type=float, default=None, help="stop the PLL once the resonance is known to this std in Hz"
+    )
+    parser.add_argument("--method", default=None, choices=["nested", "joint"], help="PLL2D solver")
+    parser.add_argument(
+        "--interleave",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="run both modes in the same dwells in PLL2x1D and calibrateAir",
+    )
+    args = parser.parse_args(argv)
+    options = {
+        key: value
+        for key, value in [
+            ("solver", args.solver),
+            ("coarse", args.coarse),
+            ("precision", args.precision),
+            ("method", args.method),
+            ("interleave", args.interleave),
+        ]
+        if value is not None
+    }
+    if args.continuation:
+        options["continuation"] = True
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "seed": args.seed,
+            "latency": args.latency,
+            "options": options,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "cases": {},
+    }
+    for name in args.only:
+        result = runCase(name, args.seed, args.latency, options)
+        report["cases"][name] = result
+        print(
+            f"{name:>20}: {result['instrumentSeconds']:9.1f} s instrument "
+            f"({result['dwellSeconds']:.1f} s dwell), {result['roundTripsTotal']:6d} round-trips, "
+            f"{result['computeSeconds']:6.3f} s compute, {result['units']} units, "
+            f"max error {result['maxError']:.4g}"
+        )
+
+    with open(args.report, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Report written to {args.report}")
+
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(report, baseline, args.tolerance)
+        if len(regressions) > 0:
+            print(f"Regressions: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""
+Micro-benchmark of reply reading: byte-by-byte versus SerialTransport
+
+A fake SR830 runs on the master side of a pseudo terminal and answers every query with a fixed
+reply. Both read paths query it over the slave side, CPU and wall time per reply are reported.
+
+Usage: python benchmarks/bench_serial.py [replies]
+"""
+
+import os
+import sys
+import threading
+import time
+import tty
+
+import serial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Serial_Transport import SerialTransport  # noqa: E402
+
+REPLY = b"-1.234567e-03,1.234567e-03,1.745623e-03,-4.500123e+01\r"
+
+
+def fakeDevice(master: int, stop: threading.Event) -> None:
+    """Answers every `\\n\\r` terminated command with `REPLY`."""
+    pending = b""
+    while not stop.is_set():
+        try:
+            data = os.read(master, 1024)
+        except OSError:
+            return
+        pending += data
+        while b"\n\r" in pending:
+            _, pending = pending.split(b"\n\r", 1)
+            os.write(master, REPLY)
+
+
+def legacyReadLine(ser: serial.Serial) -> str:
+    """The previous reading scheme, one `read()` and string concatenation per byte."""
+    kar = ser.read().decode()
+    feedback = kar
+    while kar != "\r":
+        kar = ser.read().decode()
+        feedback = feedback + kar
+    return feedback.strip()
+
+
+def run(name: str, ser: serial.Serial, readLine, replies: int) -> dict[str, float]:
+    for _ in range(10):
+        ser.write(b"SNAP? 1,2,3,4\n\r")
+        readLine()
+
+    cpu0 = time.process_time()
+    wall0 = time.perf_counter()
+    for _ in range(replies):
+        ser.write(b"SNAP? 1,2,3,4\n\r")
+        reply = readLine()
+    cpu = time.process_time() - cpu0
+    wall = time.perf_counter() - wall0
+    assert reply == REPLY.decode().strip(), reply
+
+    result = {
+        "cpu_us_per_reply": 1e6 * cpu / replies,
+        "latency_us_per_reply": 1e6 * wall / replies,
+    }
+    print(
+        f"{name:>10}: CPU {result['cpu_us_per_reply']:8.1f} µs/reply, "
+        f"latency {result['latency_us_per_reply']:8.1f} µs/reply"
+    )
+    return result
+
+
+def main(replies: int = 2000) -> dict[str, dict[str, float]]:
+    master, slave = os.openpty()
+    tty.setraw(master)
+    tty.setraw(slave)
+    stop = threading.Event()
+    device = threading.Thread(target=fakeDevice, args=(master, stop), daemon=True)
+    device.start()
+
+    ser = serial.Serial(os.ttyname(slave), baudrate=9600, timeout=2)
+    transport = SerialTransport(ser, terminator=b"\r")
+
+    results = {
+        "legacy": run("legacy", ser, lambda: legacyReadLine(ser), replies),
+        "transport": run("transport", ser, transport.readLine, replies),
+    }
+    print(
+        f"CPU reduction: {results['legacy']['cpu_us_per_reply'] / results['transport']['cpu_us_per_reply']:.1f}x, "
+        f"latency reduction: {results['legacy']['latency_us_per_reply'] / results['transport']['latency_us_per_reply']:.1f}x"
+    )
+
+    stop.set()
+    ser.close()
+    os.close(master)
+    os.close(slave)
+    return results
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,162 @@
+// Host stand-in for the parts of the Arduino core SFA_Controller.ino uses, for benchmarks/bench_firmware.py
+//
+// Time is virtual: millis() reads harness::now, delay() and a blocking serial call advance it. A port
+// moves its bytes at the baud rate, the transmit buffer holds SERIAL_TX_BUFFER bytes and print()
+// blocks while it is full, like the AVR core.
+
+#pragma once
+
+#include <cmath>
+#include <cstdint>
+#include <cstdlib>
+#include <cstring>
+#include <deque>
+#include <functional>
+#include <string>
+#include <utility>
+
+using std::abs;
+
+#define DEC 10
+
+typedef uint8_t byte;
+typedef bool boolean;
+
+namespace harness {
+extern uint64_t now;  // virtual time in µs
+}
+
+unsigned long millis();
+unsigned long micros();
+void delay(unsigned long ms);
+
+class String {
+ public:
+  String(const char *text = "") : s(text) {}
+  String(const std::string &text) : s(text) {}
+  unsigned int length() const { return s.size(); }
+  String substring(unsigned int from) const { return from >= s.size() ? String() : String(s.substr(from)); }
+  String substring(unsigned int from, unsigned int to) const {
+    if (from >= s.size()) return String();
+    return String(s.substr(from, std::min<size_t>(to, s.size()) - from));
+  }
+  int compareTo(const String &other) const { return s.compare(other.s); }
+  double toDouble() const { return std::atof(s.c_str()); }
+  long toInt() const { return std::atol(s.c_str()); }
+  const char *c_str() const { return s.c_str(); }
+  bool operator==(const String &other) const { return s == other.s; }
+  String &operator+=(const String &other) {
+    s += other.s;
+    return *this;
+  }
+  String &operator+=(char c) {
+    s += c;
+    return *this;
+  }
+
+ private:
+  std::string s;
+};
+
+const int SERIAL_TX_BUFFER = 64;
+
+class HardwareSerial {
+ public:
+  // the far end of the port: called with every byte the firmware sends and the µs it arrives
+  std::function<void(char, uint64_t)> device;
+
+  void begin(unsigned long baudRate) {
+    baud = baudRate;
+    byteTime = 10000000 / baud;
+  }
+  void setTimeout(unsigned long ms) { timeout = ms; }
+
+  // the device puts a byte on the line, it arrives at `at`
+  void receive(char c, uint64_t at) { rx.emplace_back(std::max(at, rxFree), c), rxFree = rx.back().first + byteTime; }
+  uint64_t lineFree() const { return rxFree; }
+
+  int available() {
+    int n = 0;
+    for (auto &entry : rx) {
+      if (entry.first > harness::now) break;
+      n++;
+    }
+    return n;
+  }
+  int read() {
+    if (available() == 0) return -1;
+    char c = rx.front().second;
+    rx.pop_front();
+    return (unsigned char)c;
+  }
+  String readStringUntil(char terminator) {
+    std::string text;
+    while (true) {
+      if (rx.empty() || rx.front().first > harness::now + timeout * 1000) {
+        harness::now += timeout * 1000;
+        return String(text);
+      }
+      harness::now = std::max(harness::now, rx.front().first);
+      char c = rx.front().second;
+      rx.pop_front();
+      if (c == terminator) return String(text);
+      text += c;
+    }
+  }
+  int availableForWrite() {
+    int queued = txFree > harness::now ? (txFree - harness::now + byteTime - 1) / byteTime : 0;
+    return std::max(0, SERIAL_TX_BUFFER - queued);
+  }
+
+  size_t write(uint8_t c) {
+    // wait for room in the transmit buffer
+    if (availableForWrite() == 0) harness::now = txFree - (SERIAL_TX_BUFFER - 1) * byteTime;
+    txFree = std::max(txFree, harness::now) + byteTime;
+    sent++;
+    if (device) device((char)c, txFree);
+    return 1;
+  }
+  size_t write(const uint8_t *data, size_t n) {
+    for (size_t i = 0; i < n; i++) write(data[i]);
+    return n;
+  }
+
+  size_t print(const char *text) { return write((const uint8_t *)text, std::strlen(text)); }
+  size_t print(const String &text) { return print(text.c_str()); }
+  size_t print(char c) { return write((uint8_t)c); }
+  size_t print(long value, int base = DEC) { return print(std::to_string(value).c_str()); }
+  size_t print(int value, int base = DEC) { return print((long)value, base); }
+  size_t print(unsigned long value, int base = DEC) { return print(std::to_string(value).c_str()); }
+  size_t print(unsigned int value, int base = DEC) { return print((unsigned long)value, base); }
+  size_t print(double value, int digits = 2) {
+    char text[48];
+    std::snprintf(text, sizeof(text), "%.*f", digits, value);
+    return print(text);
+  }
+  template <typename T>
+  size_t println(T value) {
+    return print(value) + print("\r\n");
+  }
+  template <typename T>
+  size_t println(T value, int format) {
+    return print(value, format) + print("\r\n");
+  }
+  size_t println() { return print("\r\n"); }
+
+  unsigned long sent = 0;  // bytes sent by the firmware
+
+ private:
+  unsigned long baud = 9600;
+  uint64_t byteTime = 1042;  // µs per byte, 10 bits
+  unsigned long timeout = 1000;
+  uint64_t txFree = 0;  // µs the last queued byte is on the line
+  uint64_t rxFree = 0;
+  std::deque<std::pair<uint64_t, char>> rx;
+};
+
+extern HardwareSerial Serial;
+extern HardwareSerial Serial1;
+extern HardwareSerial Serial2;
+
+void setup();
+void loop();
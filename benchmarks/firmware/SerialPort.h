@@ -0,0 +1,4 @@
+// Host stand-in for the SerialPort library, the firmware only uses the HardwareSerial ports of Arduino.h
+#pragma once
+
+#include "Arduino.h"
@@ -0,0 +1,129 @@
+// Runs SFA_Controller.ino against two simulated SR830 lock-ins in virtual time, see benchmarks/bench_firmware.py
+//
+// Each lock-in answers outp and SNAP queries 2 ms after the query arrived, with the response of a driven
+// oscillator (SR830 phase convention: positive below resonance) low-pass filtered by the lock-in time
+// constant. FREQ and SLVL commands take effect when they arrive. Every loop() costs LOOP_COST µs of CPU.
+//
+// usage: harness [seconds] [commands]
+// prints one line of key=value pairs
+
+#include <cstdio>
+#include <string>
+
+#include "Arduino.h"
+
+namespace harness {
+uint64_t now = 0;
+}
+
+unsigned long millis() { return harness::now / 1000; }
+unsigned long micros() { return harness::now; }
+void delay(unsigned long ms) { harness::now += ms * 1000; }
+
+HardwareSerial Serial;
+HardwareSerial Serial1;
+HardwareSerial Serial2;
+
+const uint64_t LOOP_COST = 50;      // µs of CPU per loop() besides the modelled serial and delay time
+const uint64_t REPLY_LATENCY = 2000;  // µs the lock-in takes to answer a query
+const double TOLERANCE = 0.01;      // Hz, a mode counts as locked once the drive is this close to the resonance
+
+struct LockInModel {
+  HardwareSerial *port;
+  double fRes;
+  double linewidth;         // FWHM in Hz
+  double amplitude;         // R at resonance for a 1 V drive
+  double timeConstant;      // s
+  double frequency = 0.0;   // drive
+  double level = 1.0;
+  double R = 0.0;           // filtered output
+  double theta = 0.0;
+  uint64_t updated = 0;     // µs of R and theta
+  std::string line;
+  unsigned long readings = 0;  // R replies, outp ? 3 or SNAP
+  unsigned long steps = 0;  // FREQ commands
+  double lockTime = -1.0;   // s of the first FREQ within TOLERANCE
+
+  void settle(uint64_t at) {
+    double D = fRes * fRes - frequency * frequency;
+    double gf = linewidth * frequency;
+    double targetR = frequency > 0 ? level * amplitude * gf / std::hypot(D, gf) : 0.0;
+    double targetTheta = frequency > 0 ? std::atan2(D, gf) * 180.0 / M_PI : 0.0;
+    double decay = std::exp(-(double)(at - updated) * 1e-6 / timeConstant);
+    R = targetR + (R - targetR) * decay;
+    theta = targetTheta + (theta - targetTheta) * decay;
+    updated = at;
+  }
+
+  void reply(const char *text, uint64_t at) {
+    for (const char *c = text; *c; c++) port->receive(*c, at);
+  }
+
+  void receive(char c, uint64_t at) {
+    if (c == '\r') return;
+    if (c != '\n') {
+      line += c;
+      return;
+    }
+    settle(at);
+    char text[64];
+    if (line.rfind("FREQ ", 0) == 0) {
+      frequency = std::atof(line.c_str() + 5);
+      steps++;
+      if (lockTime < 0 && std::abs(frequency - fRes) <= TOLERANCE) lockTime = at * 1e-6;
+    } else if (line.rfind("SLVL ", 0) == 0) {
+      level = std::atof(line.c_str() + 5);
+    } else if (line == "outp ? 3") {
+      std::snprintf(text, sizeof(text), "%.6e\r", R);
+      reply(text, at + REPLY_LATENCY);
+      readings++;
+    } else if (line == "outp ? 4") {
+      std::snprintf(text, sizeof(text), "%.3f\r", theta);
+      reply(text, at + REPLY_LATENCY);
+    } else if (line == "SNAP ? 3,4") {
+      std::snprintf(text, sizeof(text), "%.6e,%.3f\r", R, theta);
+      reply(text, at + REPLY_LATENCY);
+      readings++;
+    }
+    line.clear();
+  }
+};
+
+int main(int argc, char **argv) {
+  double seconds = argc > 1 ? std::atof(argv[1]) : 20.0;
+  std::string commands = argc > 2 ? argv[2] : "Sf 790.8;sSf 454.6;Ef 1;sEf 1;Ed 1;";
+
+  LockInModel normal{&Serial1, 791.3, 1.0, 0.01, 0.03};
+  LockInModel shear{&Serial2, 455.1, 0.76, 0.01, 0.03};
+  Serial1.device = [&](char c, uint64_t at) { normal.receive(c, at); };
+  Serial2.device = [&](char c, uint64_t at) { shear.receive(c, at); };
+
+  unsigned long lines = 0, frames = 0;
+  unsigned char previous = 0;
+  Serial.device = [&](char c, uint64_t) {
+    unsigned char b = (unsigned char)c;
+    if (b == 't' && previous == '\n') lines++;
+    if (b == 0xA5 && previous == 0x5A) frames++;  // sync word 0xA55A, little-endian
+    previous = b;
+  };
+
+  setup();
+  uint64_t start = harness::now;
+  for (char c : commands) Serial.receive(c, start);
+
+  unsigned long loops = 0;
+  uint64_t end = start + (uint64_t)(seconds * 1e6);
+  while (harness::now < end) {
+    loop();
+    harness::now += LOOP_COST;
+    loops++;
+  }
+
+  double elapsed = (harness::now - start) * 1e-6;
+  std::printf(
+      "loops=%.1f normal_readings=%.2f shear_readings=%.2f normal_steps=%.2f shear_steps=%.2f "
+      "stream=%.2f frames=%.2f normal_lock=%.2f shear_lock=%.2f\n",
+      loops / elapsed, normal.readings / elapsed, shear.readings / elapsed, normal.steps / elapsed,
+      shear.steps / elapsed, lines / elapsed, frames / elapsed, normal.lockTime, shear.lockTime);
+  return 0;
+}
@@ -1,5 +1,5 @@
 from scipy.optimize import curve_fit
-import time
+import clock
 import pandas as pd
 import numpy as np
 from rigol_dg1022 import RigolDG
@@ -8,8 +8,12 @@ from Piezo_Controller import E625
 from Height_Gauge import mitutoyo
 from LockIn_Amplifier import SR830
 import PLL
+from settle import Settler, dwell, snapRanged
+from profiler import span, traced
+from metrics import getMetrics
 
 
+@traced("calibration")
 def calibrateAirSingle(
     ctrl: SR830,
     freqGen: RigolDG,
@@ -73,13 +77,30 @@ def calibrateAirSingle(
     :param Kp: Kp value for PLL loop. default: `4 / \u03c0'
     :type Kp: float
 
+    :param solver: Phase solver of the PLL, `"proportional"` or `"secant"`. default: `"proportional"`
+    :type solver: str
+
+    :param coarse: Coarse search of the PLL, `"argmax"`, `"fit"` or `"adaptive"`. default: `"argmax"`
+    :type coarse: str
+
+    :param precision: Stop the PLL once its resonance estimator knows the resonance to this standard deviation in Hz. default: `None`
+    :type precision: float | None
+
     :param debugPrints: How much should be printed to console `['all', 'results', 'none']`, default: 'results'
     :type debugPrints: str
 
+    :param settle: Wait the predicted settle time after each step instead of `delay`, default: None
+    :type settle: Settler | None
+
+    :param autoRange: Step the lock-in sensitivity during the dense sweep to avoid clipping, costs a `LIAS?` query per reading, default: False
+    :type autoRange: bool
+
     :returns: [fRes, ampRes, phaRes]
     :rtype: list[float]
     """
     debugPrints: str = kwargs.get("debugPrints", "results")
+    settle: Settler | None = kwargs.get("settle", None)
+    autoRange: bool = kwargs.get("autoRange", False)
     g = 9.81
 
     if not freqGen.get_output_state(freqGenChannel):
@@ -96,7 +117,11 @@ def calibrateAirSingle(
         tolerance=kwargs.get("tolerance", (0.1 / 180) * np.pi),
         iterations=kwargs.get("iterations", 5),
         Kp=kwargs.get("Kp", 4 / np.pi),
+        solver=kwargs.get("solver", "proportional"),
+        coarse=kwargs.get("coarse", "argmax"),
+        precision=kwargs.get("precision", None),
         debugPrint=True if debugPrints.lower() in ["all"] else False,
+        settle=settle,
     )
 
     fResonance = optimalPLL[0]
@@ -110,9 +135,8 @@ def calibrateAirSingle(
 
     for i, f in enumerate(freqsDense):
         freqGen.set_frequency(freqGenChannel, f)
-        time.sleep(delay)
-        ampsDense[i] = ctrl.readAmplitude()
-        phasesDense[i] = ctrl.readPhase()
+        dwell(settle, delay, denseStep if i > 0 else denseHalfwidth)
+        ampsDense[i], phasesDense[i] = snapRanged(ctrl, settle, delay, autoRange)
         if debugPrints in ["all", "results"]:
             print(
                 f"[CAL] Dense sweep: f={f:.3f} Hz, A={ampsDense[i]:.6f}, φ={phasesDense[i]:.2f}"
@@ -128,15 +152,16 @@ def calibrateAirSingle(
         ω = 2 * np.pi * f
         return C / np.sqrt((omega0**2 - ω**2) ** 2 + (gamma_sys * ω) ** 2)
 
-    poptNormal, _ = curve_fit(
-        A_model,
-        freqsDense,
-        ampsMeters,
-        p0=[C0, gamma0, omega0],
-        bounds=([0, 0, 0], [np.inf, np.inf, np.inf]),
-        nan_policy="omit",
-        maxfev=fitMaxFev,
-    )
+    with span("curve_fit", "fit", mode="single"):
+        poptNormal, _ = curve_fit(
+            A_model,
+            freqsDense,
+            ampsMeters,
+            p0=[C0, gamma0, omega0],
+            bounds=([0, 0, 0], [np.inf, np.inf, np.inf]),
+            nan_policy="omit",
+            maxfev=fitMaxFev,
+        )
     C, gamma, omegaRes = poptNormal
     fRes = omegaRes / (2 * np.pi)
     if debugPrints in ["all", "results"]:
@@ -147,6 +172,45 @@ def calibrateAirSingle(
     return [fRes, C, gamma]
 
 
+def __crossTalk(
+    ctrlNormal: SR830,
+    ctrlShear: SR830,
+    freqGen: RigolDG,
+    fNormal: float,
+    fShear: float,
+    detune: float,
+    delay: float,
+    settle: list[Settler] | None,
+) -> tuple[float, float]:
+    """
+    Phase change of each mode at its resonance when the other mode is detuned by `detune`
+
+    A mode is only read after two dwells at its frequency, the first dwell after a tuning step of
+    its own has not settled with a fixed `delay`. Five dwells in total.
+
+    Returns (normal, shear) phase change in deg.
+    """
+    # shear at resonance with the normal mode detuned
+    freqGen.set_frequency(1, fNormal - detune)
+    freqGen.set_frequency(2, fShear)
+    dwell(settle, delay)
+    dwell(settle, delay, [0.0, 0.0])
+    phaseShearDetuned = ctrlShear.readPhase()
+
+    # both at resonance
+    freqGen.set_frequency(1, fNormal)
+    dwell(settle, delay, [detune, 0.0])
+    dwell(settle, delay, [0.0, 0.0])
+    phaseNormal, phaseShear = ctrlNormal.readPhase(), ctrlShear.readPhase()
+
+    # normal at resonance with the shear mode detuned
+    freqGen.set_frequency(2, fShear - detune)
+    dwell(settle, delay, [0.0, detune])
+    phaseNormalDetuned = ctrlNormal.readPhase()
+    return phaseNormalDetuned - phaseNormal, phaseShearDetuned - phaseShear
+
+
+@traced("calibration")
 def calibrateAir(
     ctrlNormal: SR830,
     ctrlShear: SR830,
@@ -211,13 +275,39 @@ def calibrateAir(
     :param Kp: Kp value for PLL loop. default: `4 / \u03c0'
     :type Kp: float
 
+    :param solver: Phase solver of the PLL, `"proportional"` or `"secant"`. default: `"proportional"`
+    :type solver: str
+
+    :param coarse: Coarse search of the PLL, `"argmax"`, `"fit"` or `"adaptive"`. default: `"argmax"`
+    :type coarse: str
+
+    :param precision: Stop the PLL once its resonance estimator knows the resonance to this standard deviation in Hz. default: `None`
+    :type precision: float | None
+
     :param debugPrints: How much should be printed to console `['all', 'results', 'none']`, default: 'results'
     :type debugPrints: str
 
+    :param settle: Wait the predicted settle time after each step instead of `delay`, as [Normal, Shear], default: None
+    :type settle: list[Settler] | None
+
+    :param autoRange: Step the lock-in sensitivity during the dense sweeps to avoid clipping, costs a `LIAS?` query per reading, default: False
+    :type autoRange: bool
+
+    :param interleave: Lock and sweep both modes in the same dwells when their cross-talk allows it, default: True
+    :type interleave: bool
+
+    :param crossTalk: Largest phase change in deg of one mode at resonance while the other is detuned by `denseHalfwidth` for interleaved dense sweeps, default: 1.0
+    :type crossTalk: float
+
     :returns: [[fResNormal, CNormal, γNormal],[fResShear, CShear, γShear]]
     :rtype: tuple[list[float], list[float]]
     """
     debugPrints: str = kwargs.get("debugPrints", "results")
+    settle: list[Settler] | None = kwargs.get("settle", None)
+    autoRange: bool = kwargs.get("autoRange", False)
+    interleave: bool = kwargs.get("interleave", True)
+    crossTalk: float = kwargs.get("crossTalk", 1.0)
+    settleNormal, settleShear = settle if settle is not None else (None, None)
     g = 9.81
 
     if not freqGen.get_output_state(1):
@@ -236,12 +326,31 @@ def calibrateAir(
         tolerance=kwargs.get("tolerance", (0.1 / 180) * np.pi),
         iterations=kwargs.get("iterations", 5),
         Kp=kwargs.get("Kp", 4 / np.pi),
+        solver=kwargs.get("solver", "proportional"),
+        coarse=kwargs.get("coarse", "argmax"),
+        precision=kwargs.get("precision", None),
+        interleave=interleave,
+        crossTalk=crossTalk,
         debugPrint=True if debugPrints.lower() in ["all"] else False,
+        settle=settle,
     )
 
     fNormal = optNormal[0]
     fShear = optShear[0]
 
+    if interleave:
+        shiftNormal, shiftShear = __crossTalk(
+            ctrlNormal, ctrlShear, freqGen, fNormal, fShear, denseHalfwidth, delay, settle
+        )
+        if debugPrints.lower() in ["all", "results"]:
+            print(
+                f"[CAL] Cross-talk: Normal {shiftNormal:.2f} deg, Shear {shiftShear:.2f} deg, limit {crossTalk:.2f} deg"
+            )
+        if not max(abs(shiftNormal), abs(shiftShear)) <= crossTalk:
+            getMetrics().count("crossTalk")
+            print("[CAL] Cross-talk between the modes too large, dense sweeps one after the other")
+            interleave = False
+
     numPts = int(round((2 * denseHalfwidth) / denseStep)) + 1
     freqsDenseNormal = np.linspace(
         fNormal - denseHalfwidth, fNormal + denseHalfwidth, numPts
@@ -255,25 +364,46 @@ def calibrateAir(
     ampsDenseShear = np.empty_like(freqsDenseShear)
     phasesDenseShear = np.empty_like(freqsDenseShear)
 
-    for i, f in enumerate(freqsDenseNormal):
-        freqGen.set_frequency(1, f)
-        time.sleep(delay)
-        ampsDenseNormal[i] = ctrlNormal.readAmplitude()
-        phasesDenseNormal[i] = ctrlNormal.readPhase()
-        if debugPrints.lower() in ["all"]:
-            print(
-                f"[CAL] Dense sweep: f={f:.3f} Hz, A={ampsDenseNormal[i]:.6f}, φ={phasesDenseNormal[i]:.2f}"
+    if interleave:
+        # both sweeps in step, each dwell serves a point of both modes
+        for i, (fN, fS) in enumerate(zip(freqsDenseNormal, freqsDenseShear)):
+            freqGen.set_frequency(1, fN)
+            freqGen.set_frequency(2, fS)
+            step = denseStep if i > 0 else denseHalfwidth
+            dwell(settle, delay, [step, step])
+            ampsDenseNormal[i], phasesDenseNormal[i] = snapRanged(
+                ctrlNormal, settleNormal, delay, autoRange
+            )
+            ampsDenseShear[i], phasesDenseShear[i] = snapRanged(
+                ctrlShear, settleShear, delay, autoRange
+            )
+            if debugPrints.lower() in ["all"]:
+                print(
+                    f"[CAL] Dense sweep: f={fN:.3f} Hz, A={ampsDenseNormal[i]:.6f}, φ={phasesDenseNormal[i]:.2f}; "
+                    f"f={fS:.3f} Hz, A={ampsDenseShear[i]:.6f}, φ={phasesDenseShear[i]:.2f}"
+                )
+    else:
+        for i, f in enumerate(freqsDenseNormal):
+            freqGen.set_frequency(1, f)
+            dwell(settleNormal, delay, denseStep if i > 0 else denseHalfwidth)
+            ampsDenseNormal[i], phasesDenseNormal[i] = snapRanged(
+                ctrlNormal, settleNormal, delay, autoRange
             )
+            if debugPrints.lower() in ["all"]:
+                print(
+                    f"[CAL] Dense sweep: f={f:.3f} Hz, A={ampsDenseNormal[i]:.6f}, φ={phasesDenseNormal[i]:.2f}"
+                )
 
-    for i, f in enumerate(freqsDenseShear):
-        freqGen.set_frequency(2, f)
-        time.sleep(delay)
-        ampsDenseShear[i] = ctrlShear.readAmplitude()
-        phasesDenseShear[i] = ctrlShear.readPhase()
-        if debugPrints.lower() in ["all"]:
-            print(
-                f"[CAL] Dense sweep: f={f:.3f} Hz, A={ampsDenseShear[i]:.6f}, φ={phasesDenseShear[i]:.2f}"
+        for i, f in enumerate(freqsDenseShear):
+            freqGen.set_frequency(2, f)
+            dwell(settleShear, delay, denseStep if i > 0 else denseHalfwidth)
+            ampsDenseShear[i], phasesDenseShear[i] = snapRanged(
+                ctrlShear, settleShear, delay, autoRange
             )
+            if debugPrints.lower() in ["all"]:
+                print(
+                    f"[CAL] Dense sweep: f={f:.3f} Hz, A={ampsDenseShear[i]:.6f}, φ={phasesDenseShear[i]:.2f}"
+                )
 
     # fit Lorentzian
     omega0Normal = 2 * np.pi * fNormal
@@ -290,15 +420,16 @@ def calibrateAir(
         ω = 2 * np.pi * f
         return C / np.sqrt((omega0**2 - ω**2) ** 2 + (gamma_sys * ω) ** 2)
 
-    poptNormal, _ = curve_fit(
-        A_model,
-        freqsDenseNormal,
-        ampsDenseNormalMeters,
-        p0=[C0Normal, gamma0Normal, omega0Normal],
-        bounds=([0, 0, 0], [np.inf, np.inf, np.inf]),
-        nan_policy="omit",
-        maxfev=fitMaxFev,
-    )
+    with span("curve_fit", "fit", mode="normal"):
+        poptNormal, _ = curve_fit(
+            A_model,
+            freqsDenseNormal,
+            ampsDenseNormalMeters,
+            p0=[C0Normal, gamma0Normal, omega0Normal],
+            bounds=([0, 0, 0], [np.inf, np.inf, np.inf]),
+            nan_policy="omit",
+            maxfev=fitMaxFev,
+        )
     CNormal, gammaNormal, omega0Normal = poptNormal
     f0Normal = omega0Normal / (2 * np.pi)
     if debugPrints.lower() in ["all", "results"]:
@@ -308,15 +439,16 @@ def calibrateAir(
 
     ctrlNormal.setFrequency(round(f0Normal, 6))
 
-    poptShear, _ = curve_fit(
-        A_model,
-        freqsDenseShear,
-        ampsDenseShearMeters,
-        p0=[C0Shear, gamma0Shear, omega0Shear],
-        bounds=([0, 0, 0], [np.inf, np.inf, np.inf]),
-        nan_policy="omit",
-        maxfev=fitMaxFev,
-    )
+    with span("curve_fit", "fit", mode="shear"):
+        poptShear, _ = curve_fit(
+            A_model,
+            freqsDenseShear,
+            ampsDenseShearMeters,
+            p0=[C0Shear, gamma0Shear, omega0Shear],
+            bounds=([0, 0, 0], [np.inf, np.inf, np.inf]),
+            nan_policy="omit",
+            maxfev=fitMaxFev,
+        )
     CShear, gammaShear, omega0Shear = poptShear
     f0Shear = omega0Shear / (2 * np.pi)
     if debugPrints.lower() in ["all", "results"]:
@@ -329,6 +461,7 @@ def calibrateAir(
     return ([f0Normal, CNormal, gammaNormal], [f0Shear, CShear, gammaShear])
 
 
+@traced("calibration")
 def calibrateDistance(
     ctrlNormal: SR830,
     z_stage: E625,
@@ -352,7 +485,7 @@ def calibrateDistance(
     if debugPrint:
         print(f"\n[DIST] Moving Z-stage to {start_V} V for probe touch...")
     z_stage.absolute_voltage(start_V)
-    time.sleep(1)
+    clock.sleep(1)
 
     input("Adjust probe to surface and back off, then press Enter.")
 
@@ -368,7 +501,7 @@ def calibrateDistance(
 
     for i, voltage in enumerate(voltages):
         z_stage.absolute_voltage(voltage)
-        time.sleep(delay)
+        clock.sleep(delay)
 
         A = ctrlNormal.readAmplitude()
         h = height_dev.measurement()
@@ -401,7 +534,7 @@ def calibrateDistance(
 
     for i, voltage in enumerate(voltagesRetract):
         z_stage.absolute_voltage(voltage)
-        time.sleep(delay)
+        clock.sleep(delay)
         A = ctrlNormal.readAmplitude()
         h = height_dev.measurement()
         if debugPrint:
@@ -420,6 +553,7 @@ def calibrateDistance(
     return df
 
 
+@traced("calibration")
 def calibrateC0AmplitudeSingle(
     ctrl: SR830,
     freqGen: RigolDG,
@@ -513,7 +647,7 @@ def calibrateC0AmplitudeSingle(
     
     for amp in amplitudes:
         ctrl.setAmplitude(amp)
-        time.sleep(delay)
+        clock.sleep(delay)
         fRes, C0, gamma = calibrateAirSingle(
             ctrl,
             freqGen,
@@ -532,6 +666,7 @@ def calibrateC0AmplitudeSingle(
     return results
 
 
+@traced("calibration")
 def calibrateMassSingle(
     ctrl: SR830,
     freqGen: RigolDG,
@@ -0,0 +1,127 @@
+"""
+Clock used for all waiting and time stamps of the measurements
+
+The measurement, PLL, calibration and settling code wait through `sleep` and take time stamps through
+`now` instead of calling `time` directly. By default these use the real clock. Installing a
+`VirtualClock` makes every wait return immediately while advancing the virtual time, so runs against
+the simulated instruments (see `Simulated_Instruments.py`), which read the same clock to model settling,
+take seconds instead of hours.
+
+Example:
+    with useClock(VirtualClock()) as clk:
+        frequencyDependence(...)
+        print(f"Instrument time: {clk.monotonic()} s")
+"""
+
+import threading
+import time
+
+from contextlib import contextmanager
+
+import profiler
+
+
+class Clock:
+    """The real clock."""
+
+    def __init__(self) -> None:
+        self.slept = 0.0
+        self.sleeps = 0
+
+    def time(self) -> float:
+        """Wall time in s since the epoch, for time stamps."""
+        return time.time()
+
+    def monotonic(self) -> float:
+        """Monotonic time in s, for durations."""
+        return time.monotonic()
+
+    def sleep(self, seconds: float) -> None:
+        if seconds <= 0:
+            return
+        self.slept += seconds
+        self.sleeps += 1
+        time.sleep(seconds)
+
+    def advance(self, seconds: float) -> None:
+        """Waits without counting it as a sleep, e.g. to mimic instrument latency."""
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+class VirtualClock(Clock):
+    def __init__(self, start: float | None = None) -> None:
+        """
+        Clock that only advances when something sleeps on it.
+
+        Sleeps of concurrent threads are added up, so the virtual time is an upper bound of the
+        instrument time in that case.
+
+        :param start: Wall time in s since the epoch the clock starts at, `None` for now. default: `None`
+        :type start: float | None
+        """
+        super().__init__()
+        self.start = time.time() if start is None else start
+        self.elapsed = 0.0
+        self.lock = threading.Lock()
+
+    def time(self) -> float:
+        return self.start + self.elapsed
+
+    def monotonic(self) -> float:
+        return self.elapsed
+
+    def sleep(self, seconds: float) -> None:
+        if seconds <= 0:
+            return
+        with self.lock:
+            self.elapsed += seconds
+            self.slept += seconds
+            self.sleeps += 1
+        # let other threads run as they would during a real wait
+        time.sleep(0)
+
+    def advance(self, seconds: float) -> None:
+        if seconds <= 0:
+            return
+        with self.lock:
+            self.elapsed += seconds
+
+
+_clock: Clock = Clock()
+
+
+def getClock() -> Clock:
+    return _clock
+
+
+def setClock(clk: Clock) -> Clock:
+    """Installs `clk` for all modules, returns the previous clock."""
+    global _clock
+    previous = _clock
+    _clock = clk
+    return previous
+
+
+@contextmanager
+def useClock(clk: Clock):
+    """Installs `clk` for the duration of a `with` block."""
+    previous = setClock(clk)
+    try:
+        yield clk
+    finally:
+        setClock(previous)
+
+
+def sleep(seconds: float) -> None:
+    with profiler.span("sleep", "sleep", seconds=seconds):
+        _clock.sleep(seconds)
+
+
+def now() -> float:
+    """Wall time in s since the epoch of the installed clock."""
+    return _clock.time()
+
+
+def monotonic() -> float:
+    return _clock.monotonic()
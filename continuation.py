@@ -0,0 +1,118 @@
+"""
+Resonance continuation along a sweep
+
+Consecutive points of a sweep (the other mode's frequency, the Z-stage voltage) move the resonance only
+a little. `Continuation` extrapolates the resonances found so far along the sweep axis and starts
+`PLL1D` at the prediction, without a coarse sweep and with a narrow bracket. Only when the lock is
+lost (the result leaves the bracket or the phase is not near zero) does it fall back to the full
+coarse search and start the extrapolation over.
+
+Example:
+    track = Continuation(halfwidth=0.1)
+    for fShear in freqsShear:
+        freqGen.set_frequency(2, fShear)
+        fRes, _, _ = track.lock(fShear, ctrlNormal, freqGen, 789.5, 794.5, freqGenChannel=1)
+"""
+
+import numpy as np
+
+from LockIn_Amplifier import SR830
+from rigol_dg1022 import RigolDG
+from PLL import PLL1D, LINEAR_PHASE
+from metrics import getMetrics
+
+
+class Continuation:
+    def __init__(self, halfwidth: float = 0.1, order: int = 1, errorScale: float = 4.0) -> None:
+        """
+        :param halfwidth: Smallest half width of the bracket around the prediction, in Hz. default: `0.1`
+        :type halfwidth: float
+
+        :param order: Order of the polynomial extrapolation through the last `order + 1` resonances. default: `1`
+        :type order: int
+
+        :param errorScale: The bracket is widened to this multiple of the last prediction error. default: `4.0`
+        :type errorScale: float
+        """
+        self.halfwidth = halfwidth
+        self.order = order
+        self.errorScale = errorScale
+        self.reset()
+
+    def reset(self) -> None:
+        """Forgets the resonances found so far, the next lock is a full search."""
+        self.history: list[tuple[float, float]] = []
+        self.error = 0.0
+
+    def add(self, x: float, fRes: float) -> None:
+        """Adds the resonance `fRes` found at the sweep position `x`."""
+        self.history.append((float(x), float(fRes)))
+        del self.history[: -(self.order + 1)]
+
+    def predict(self, x: float) -> float | None:
+        """Extrapolated resonance at the sweep position `x`, `None` without history."""
+        if len(self.history) == 0:
+            return None
+        xs, fs = (np.array(column)[::-1] for column in zip(*self.history))
+        # repeated positions carry no slope, extrapolate through the newest resonance of each position
+        xs, index = np.unique(xs, return_index=True)
+        fs = fs[index]
+        order = min(self.order, len(xs) - 1)
+        if order == 0:
+            return float(self.history[-1][1])
+        x0 = self.history[-1][0]
+        return float(np.polyval(np.polyfit(xs - x0, fs, order), x - x0))
+
+    def bracket(self, x: float) -> tuple[float, float] | None:
+        """Frequency range around the prediction at `x`, `None` without history."""
+        prediction = self.predict(x)
+        if prediction is None:
+            return None
+        halfwidth = max(self.halfwidth, self.errorScale * self.error)
+        return prediction - halfwidth, prediction + halfwidth
+
+    def lock(
+        self,
+        x: float,
+        ctrl: SR830,
+        freqGen: RigolDG,
+        freqMin: float,
+        freqMax: float,
+        **kwargs,
+    ) -> list[float]:
+        """
+        Lock onto the resonance at the sweep position `x`
+
+        Starts `PLL1D` at the prediction, limited to the bracket around it. The lock counts as lost
+        when the result leaves the bracket or its phase exceeds `LINEAR_PHASE`, then `PLL1D` searches
+        `freqMin` to `freqMax` with its coarse sweep. Further keyword arguments go to `PLL1D`.
+
+        :returns: [fRes, ampRes, phaRes]
+        :rtype: list[float]
+        """
+        metrics = getMetrics()
+        bracket = self.bracket(x)
+        if bracket is not None:
+            lo, hi = bracket
+            prediction = (lo + hi) / 2
+            opt = PLL1D(
+                ctrl,
+                freqGen,
+                lo,
+                hi,
+                **{**kwargs, "points": 2, "guess": prediction},
+            )
+            fRes, _, phaseDeg = opt
+            if np.isfinite(fRes) and lo <= fRes <= hi and abs(phaseDeg) <= LINEAR_PHASE:
+                self.error = abs(fRes - prediction)
+                self.add(x, fRes)
+                return opt
+
+            metrics.count("continuationLost")
+            if kwargs.get("debugPrint", False):
+                print(f"Lost lock at {x}: {fRes:.4f} Hz, {phaseDeg:.2f} deg, full search")
+
+        opt = PLL1D(ctrl, freqGen, freqMin, freqMax, **kwargs)
+        self.reset()
+        self.add(x, opt[0])
+        return opt
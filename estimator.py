@@ -0,0 +1,164 @@
+"""
+Recursive resonance estimator
+
+Fuses every amplitude and phase reading into an estimate of the resonance frequency f0, the linewidth
+γ and the amplitude at resonance A0, with an extended Kalman filter on the driven oscillator
+
+    Z(f) = A0 iγf / (f0² - f² + iγf)
+
+which is `AnalysisFunctions.A` with the phase convention of the PLL: 0 deg at resonance, positive
+below it, and γ the full width at half maximum in Hz. The posterior standard deviation of f0 tells
+when the resonance is known well enough, instead of a fixed phase threshold per reading.
+
+Example:
+    estimator = ResonanceEstimator(791.3, 1.0, 0.01)
+    estimator.update(791.4, R, theta)
+    if estimator.fResStd < 1e-3:
+        ...
+"""
+
+import numpy as np
+
+
+class ResonanceEstimator:
+    def __init__(
+        self,
+        fRes: float,
+        linewidth: float,
+        amplitude: float,
+        std: tuple[float, float, float] | None = None,
+        phaseNoise: float = 0.5,
+        amplitudeNoise: float = 0.05,
+        drift: float = 0.0,
+        relinearise: int = 3,
+        gate: float = 9.0,
+    ) -> None:
+        """
+        :param fRes: Initial guess of the resonance frequency in Hz.
+        :type fRes: float
+
+        :param linewidth: Initial guess of the linewidth γ (FWHM) in Hz.
+        :type linewidth: float
+
+        :param amplitude: Initial guess of the amplitude at resonance in V.
+        :type amplitude: float
+
+        :param std: Standard deviation of the initial guesses (fRes, linewidth, amplitude). default: `(linewidth, linewidth / 2, amplitude)`
+        :type std: tuple[float, float, float] | None
+
+        :param phaseNoise: Standard deviation of a phase reading in deg. default: `0.5`
+        :type phaseNoise: float
+
+        :param amplitudeNoise: Standard deviation of an amplitude reading relative to the amplitude at resonance. default: `0.05`
+        :type amplitudeNoise: float
+
+        :param drift: Standard deviation of the change of the resonance between two readings in Hz, for a moving resonance. default: `0.0`
+        :type drift: float
+
+        :param relinearise: Extra linearisations of the model per update (iterated Kalman filter). default: `3`
+        :type relinearise: int
+
+        :param gate: Largest normalised innovation squared of the last reading for the estimate to count as known, readings that disagree with the prediction (e.g. not settled) by more are a sign of a wrong model. default: `9.0`
+        :type gate: float
+        """
+        if std is None:
+            std = (linewidth, linewidth / 2, amplitude)
+        self.x = np.array([fRes, linewidth, amplitude], dtype=float)
+        self.P = np.diag(np.square(std)).astype(float)
+        self.phaseNoise = phaseNoise
+        self.amplitudeNoise = amplitudeNoise
+        self.drift = drift
+        self.relinearise = relinearise
+        self.gate = gate
+        self.consistency = np.inf
+        """Normalised innovation squared of the last reading, χ² distributed while the model holds."""
+        self.updates = 0
+
+    @property
+    def fRes(self) -> float:
+        return float(self.x[0])
+
+    @property
+    def linewidth(self) -> float:
+        return float(self.x[1])
+
+    @property
+    def amplitude(self) -> float:
+        return float(self.x[2])
+
+    @property
+    def std(self) -> np.ndarray:
+        """Posterior standard deviation of (fRes, linewidth, amplitude)."""
+        return np.sqrt(np.diag(self.P))
+
+    @property
+    def fResStd(self) -> float:
+        return float(np.sqrt(self.P[0, 0]))
+
+    def model(self, f: float, x: np.ndarray | None = None) -> tuple[float, float]:
+        """Amplitude in V and phase in rad at the drive frequency `f`."""
+        f0, gamma, A0 = self.x if x is None else x
+        D = f0**2 - f**2
+        return A0 * gamma * f / np.hypot(D, gamma * f), np.arctan2(D, gamma * f)
+
+    def jacobian(self, f: float, x: np.ndarray | None = None) -> np.ndarray:
+        """Derivatives of (amplitude, phase in rad) to (f0, γ, A0)."""
+        f0, gamma, A0 = self.x if x is None else x
+        D = f0**2 - f**2
+        S2 = D**2 + (gamma * f) ** 2
+        S = np.sqrt(S2)
+        return np.array(
+            [
+                [-A0 * gamma * f * D * 2 * f0 / (S2 * S), A0 * f * D**2 / (S2 * S), gamma * f / S],
+                [gamma * f * 2 * f0 / S2, -D * f / S2, 0.0],
+            ]
+        )
+
+    def update(self, f: float, amplitude: float, phaseDeg: float = np.nan) -> "ResonanceEstimator":
+        """
+        Updates the estimate with a reading at the drive frequency `f`
+
+        A NaN amplitude or phase is left out, so amplitude only readings (`SR830.readAmplitude`) count too.
+        """
+        self.P[0, 0] += self.drift**2
+
+        measured = np.array([amplitude, np.deg2rad(phaseDeg)], dtype=float)
+        valid = np.isfinite(measured)
+        if not np.any(valid):
+            return self
+
+        noise = np.array([self.amplitudeNoise * max(self.x[2], 1e-12), np.deg2rad(self.phaseNoise)])[valid]
+        R = np.diag(np.square(noise))
+
+        # iterated update: a reading at the predicted resonance has no phase derivative to the linewidth,
+        # relinearising at the updated state lets the linewidth uncertainty reach the resonance
+        x = self.x.copy()
+        for iteration in range(self.relinearise + 1):
+            predicted = np.array(self.model(f, x))
+            innovation = (measured - predicted)[valid]
+            if valid[1]:
+                # phase difference wrapped to ±π
+                innovation[-1] = np.angle(np.exp(1j * innovation[-1]))
+            H = self.jacobian(f, x)[valid]
+            S = H @ self.P @ H.T + R
+            if iteration == 0:
+                self.consistency = float(innovation @ np.linalg.solve(S, innovation))
+            K = self.P @ H.T @ np.linalg.inv(S)
+            x = self.x + K @ (innovation - H @ (self.x - x))
+            # the linewidth and amplitude stay physical
+            x[1] = max(x[1], 1e-6)
+            x[2] = max(x[2], 1e-12)
+
+        self.x = x
+        # Joseph form keeps P symmetric and positive
+        I_KH = np.eye(3) - K @ H
+        self.P = I_KH @ self.P @ I_KH.T + K @ R @ K.T
+        self.updates += 1
+        return self
+
+    def known(self, precision: float) -> bool:
+        """
+        If the resonance frequency is known to `precision` Hz (one standard deviation) and the last
+        reading agreed with the prediction within `gate`
+        """
+        return self.updates > 0 and self.fResStd <= precision and self.consistency <= self.gate
@@ -5,14 +5,25 @@ from Piezo_Controller import E625
 from Height_Gauge import mitutoyo
 from measurements import frequencyDependence
 from LockIn_Amplifier import SR830
+from Device_Registry import DeviceRegistry
+from settle import Settler
+from continuation import Continuation
+from metrics import RunMetrics, setMetrics
 
 
 def main() -> None:
-    ctrlNormal: SR830 = SR830(SN="A9JSTXTQA")
-    ctrlShear: SR830 = SR830(SN="A9TQAG5OA")
+    ports = DeviceRegistry().resolveAll(
+        {
+            "normal": {"sn": "A9JSTXTQA"},
+            "shear": {"sn": "A9TQAG5OA"},
+            "height": {"pid": 0x4001, "vid": 0x0FE7},
+        }
+    )
+    ctrlNormal: SR830 = SR830(SN="A9JSTXTQA", port=ports["normal"])
+    ctrlShear: SR830 = SR830(SN="A9TQAG5OA", port=ports["shear"])
     freqGen: RigolDG = RigolDG()
     zStage = E625()
-    hDev = mitutoyo()
+    hDev = mitutoyo(port=ports["height"])
 
     freqGen.set_waveform(1, "SIN")
     freqGen.set_waveform(2, "SIN")
@@ -32,6 +43,24 @@ def main() -> None:
 
     resolution = 0.01
 
+    # Live progress of the run in metrics.json and on http://127.0.0.1:8000/metrics (if the port is free)
+    metrics = RunMetrics(path="metrics.json")
+    setMetrics(metrics)
+    metrics.serve(8000)
+
+    # Wait the predicted settle time of the locked mode instead of a fixed delay per step: fill in the
+    # [fRes, C, γ] of an earlier calibrateAirSingle of that mode, None keeps the fixed delay
+    airCalibration = None
+    settle = None
+    if airCalibration is not None:
+        fRes, _, gamma = airCalibration
+        settle = Settler.fromCalibration(ctrlNormal if findNorm else ctrlShear, fRes, gamma, poll=True)
+
+    # Start each lock at the resonance extrapolated from the previous ones instead of a full coarse
+    # sweep, False searches every point on its own
+    continueResonance = False
+    continuation = Continuation() if continueResonance else None
+
     if findNorm:
         freqs = np.linspace(
             fShearMin,
@@ -46,6 +75,8 @@ def main() -> None:
             790,
             810,
             freqs,
+            settle=settle,
+            continuation=continuation,
         )
     else:
         freqs = np.linspace(
@@ -55,7 +86,15 @@ def main() -> None:
             endpoint=True,
         )
         frequencyDependence(
-            ctrlNormal, ctrlShear, freqGen, fShearMin, fShearMax, freqs, findNorm=False
+            ctrlNormal,
+            ctrlShear,
+            freqGen,
+            fShearMin,
+            fShearMax,
+            freqs,
+            findNorm=False,
+            settle=settle,
+            continuation=continuation,
         )
     
     freqGen.set_output(1, False)
@@ -67,6 +106,7 @@ def main() -> None:
 
     hDev.close()
     zStage.close()
+    metrics.close()
     
 
 if __name__ == "__main__":
@@ -2,16 +2,23 @@
 Independent measurement functions
 """
 
+import asyncio
 import os
 import time
+import clock
 from datetime import timedelta
 import numpy as np
 
-from LockIn_Amplifier import SR830
+from LockIn_Amplifier import SR830, AsyncSR830
 from Piezo_Controller import E625
 from Height_Gauge import mitutoyo
 from rigol_dg1022 import RigolDG
 from PLL import PLL1D, PLL2D, PLL2x1D
+from continuation import Continuation
+from tracker import ResonanceTracker
+from settle import Settler, dwell, snapRanged
+from metrics import getMetrics
+from profiler import traced
 from plots import linePlot, heatmapPlot
 from typing import overload
 
@@ -36,6 +43,44 @@ def __folderAvailable(path: os.PathLike, name: str, n=0) -> str:
             return os.path.join(path, name + f"_{n}")
 
 
+def __lock(
+    continuation: Continuation | None,
+    x: float,
+    ctrl: SR830,
+    freqGen: RigolDG,
+    freqMin: float,
+    freqMax: float,
+    **kwargs,
+) -> list[float]:
+    """`PLL1D`, continued from the earlier points of the sweep when a `Continuation` is given."""
+    if continuation is None:
+        return PLL1D(ctrl, freqGen, freqMin, freqMax, **kwargs)
+    return continuation.lock(x, ctrl, freqGen, freqMin, freqMax, **kwargs)
+
+
+def __trackerPoint(
+    tracker: ResonanceTracker, samples: int, timeout: float, precision: float | None = None
+) -> tuple[float, float, float]:
+    """
+    Mean of the next `samples` locked tracker samples, the newest sample with a NaN phase when not locked
+
+    With a `precision` and an estimator on the tracker, the estimate once it knows the resonance to
+    `precision` Hz instead.
+    """
+    if precision is not None and tracker.estimator is not None:
+        fRes, A, P = tracker.estimate(precision, timeout=timeout)
+        if np.isfinite(fRes):
+            return fRes, A, P
+    locked = tracker.next(samples, timeout=timeout)
+    if len(locked) > 0:
+        fRes, A, P = tracker.mean(locked)
+        return fRes, A, P
+    latest = tracker.latest()
+    if latest is None:
+        return np.nan, np.nan, np.nan
+    return float(latest["frequency"]), float(latest["amplitude"]), np.nan
+
+
 @overload
 def viscosity1D(
     ctrl: SR830,
@@ -64,6 +109,7 @@ def viscosity1D(
 ): ...
 
 
+@traced("measurement")
 def viscosity1D(
     ctrl: SR830,
     freqGen: RigolDG,
@@ -80,6 +126,14 @@ def viscosity1D(
     min_amp=0.0003,
     **kwargs,
 ):
+    settle: Settler | None = kwargs.pop("settle", None)
+    solver: str = kwargs.pop("solver", "proportional")
+    coarse: str = kwargs.pop("coarse", "argmax")
+    continuation: Continuation | None = kwargs.pop("continuation", None)
+    tracker: ResonanceTracker | None = kwargs.pop("tracker", None)
+    trackerSamples: int = kwargs.pop("trackerSamples", 3)
+    precision: float | None = kwargs.pop("precision", None)
+
     if "filePath" in kwargs:
         filePath: str = kwargs.pop("filePath")
         if not os.path.exists(filePath):
@@ -97,6 +151,8 @@ def viscosity1D(
     # APPROACH SWEEP
     z_values = np.arange(start_V, end_V + step_V, step_V)
     contact_idx = None
+    metrics = getMetrics()
+    metrics.start("viscosity1D", len(z_values))
 
     rows = len(z_values) * [{}]
 
@@ -106,10 +162,15 @@ def viscosity1D(
     )
     file.flush()
 
+    # with a tracker the fork stays locked while the stage moves, every point samples it
+    if tracker is not None:
+        tracker.start(current_f)
+    trackerTimeout = (trackerSamples + pll_maxiter) * (tracker.delay if tracker is not None else 0.0)
+
     for idx, zV in enumerate(z_values):
         print(f"\n[MEAS] Approach Z={zV:.1f} V")
         zStage.absolute_voltage(zV)
-        time.sleep(0.5)
+        clock.sleep(0.5)
         zV_read = zStage.request_voltage()
 
         # 1) Always measure height first to detect contact
@@ -130,10 +191,17 @@ def viscosity1D(
             contact_idx = idx
             if contact_idx + 1 <= len(rows):
                 rows = rows[: contact_idx + 1]
+            metrics.point()
+            metrics.setTotal(2 * (contact_idx + 1))
+            if tracker is not None:
+                tracker.stop()
             break
 
         # 2) Then measure amplitude and decide if too small
-        A = ctrl.readAmplitude()
+        if tracker is not None:
+            current_f, A, P = __trackerPoint(tracker, trackerSamples, trackerTimeout, precision)
+        else:
+            A = ctrl.readAmplitude()
 
         if np.isfinite(A) and A < min_amp:
             print(
@@ -149,18 +217,26 @@ def viscosity1D(
                 "amplitude(V)": A,
                 "phase(deg)": np.nan,
             }
+            metrics.point()
             continue
 
-        current_f, A, P = PLL1D(
-            ctrl,
-            freqGen,
-            current_f - 1,
-            current_f + 1,
-            tolerance=pll_tol,
-            iterations=pll_maxiter,
-            Kp=Kp,
-            delay=pll_delay,
-        )
+        if tracker is None:
+            current_f, A, P = __lock(
+                continuation,
+                zV,
+                ctrl,
+                freqGen,
+                current_f - 1,
+                current_f + 1,
+                tolerance=pll_tol,
+                iterations=pll_maxiter,
+                Kp=Kp,
+                delay=pll_delay,
+                settle=settle,
+                solver=solver,
+                coarse=coarse,
+                precision=precision,
+            )
 
         print(f"[MEAS] h={h:.3f} mm, A={A:.6f}, phase={P:.2f}")
         file.write(f"{zV},{zV_read},{h},{current_f},{A},{P}\n")
@@ -173,6 +249,7 @@ def viscosity1D(
             "amplitude(V)": A,
             "phase(deg)": P,
         }
+        metrics.point()
 
     # RETRACT SWEEP (back to start_V)
     if contact_idx is not None:
@@ -180,7 +257,7 @@ def viscosity1D(
         for idx, zV in enumerate(z_values[: contact_idx + 1][::-1]):
             print(f"\n[MEAS] Retract Z={zV:.1f} V")
             zStage.absolute_voltage(zV)
-            time.sleep(0.5)
+            clock.sleep(0.5)
             zV_read = zStage.request_voltage()
 
             # height first
@@ -198,11 +275,17 @@ def viscosity1D(
                     "amplitude(V)": np.nan,
                     "phase(deg)": np.nan,
                 }
-
-                break
+                metrics.point()
+                # still in contact, keep retracting
+                continue
 
             # amplitude next
-            A = ctrl.readAmplitude()
+            if tracker is not None:
+                if not tracker.running:
+                    tracker.start(current_f)
+                current_f, A, P = __trackerPoint(tracker, trackerSamples, trackerTimeout, precision)
+            else:
+                A = ctrl.readAmplitude()
 
             if np.isfinite(A) and A < min_amp:
                 print(
@@ -218,21 +301,27 @@ def viscosity1D(
                     "amplitude(V)": A,
                     "phase(deg)": np.nan,
                 }
+                metrics.point()
                 continue
 
             # PLL + full readout
-            current_f, _, _ = PLL1D(
-                ctrl,
-                freqGen,
-                current_f - 1,
-                current_f + 1,
-                tolerance=pll_tol,
-                iterations=pll_maxiter,
-                Kp=1 / (4 * np.pi),
-                delay=pll_delay,
-            )
-
-            P = ctrl.readPhase()
+            if tracker is None:
+                current_f, _, P = __lock(
+                    continuation,
+                    zV,
+                    ctrl,
+                    freqGen,
+                    current_f - 1,
+                    current_f + 1,
+                    tolerance=pll_tol,
+                    iterations=pll_maxiter,
+                    Kp=1 / (4 * np.pi),
+                    delay=pll_delay,
+                    settle=settle,
+                    solver=solver,
+                    coarse=coarse,
+                    precision=precision,
+                )
 
             print(f"[MEAS] h={h:.3f} mm, A={A:.6f}, phase={P:.2f}")
             file.write(f"{zV},{zV_read},{h},{current_f},{A},{P}\n")
@@ -245,8 +334,12 @@ def viscosity1D(
                 "amplitude(V)": A,
                 "phase(deg)": P,
             }
+            metrics.point()
         rows += rows2
 
+    if tracker is not None:
+        tracker.stop()
+
     # finally reset Z-stage home
     zStage.absolute_voltage(start_V)
     print(f"[MEAS] Z-stage reset to {start_V} V")
@@ -292,6 +385,7 @@ def viscosity1D(
     return rows
 
 
+@traced("measurement")
 def frequencyDependence(
     ctrlNorm: SR830,
     ctrlShea: SR830,
@@ -306,8 +400,17 @@ def frequencyDependence(
     Finds resonane frequency while sweeping through the other's frequencies.
 
     Defaults to checking normal resonance on each shear frequency.
+
+    Pass a `Settler` for the resonance mode as `settle` to wait the predicted settle time instead of `delay`.
+    Pass `solver="secant"` to lock each resonance with the secant phase solver of `PLL1D`, and
+    `coarse="fit"` or `coarse="adaptive"` for its model-based initial guess.
+    Pass `precision` in Hz to stop each lock once its resonance estimator is that certain.
+    Pass a `Continuation` as `continuation` to start each lock from the resonances found so far
+    instead of a coarse sweep over `freqResMin` to `freqResMax`.
     """
     delay = kwargs.pop("delay", 1.0)
+    settle: Settler | None = kwargs.pop("settle", None)
+    continuation: Continuation | None = kwargs.pop("continuation", None)
 
     if "filePath" in kwargs:
         filePath: str = kwargs.pop("filePath")
@@ -336,26 +439,35 @@ def frequencyDependence(
         yLabel = "Shear Resonance Frequency (Hz)"
 
     resonance = len(freqsSweep) * [0.0]
+    metrics = getMetrics()
+    metrics.start("frequencyDependence", len(freqsSweep))
 
     file = open(file=os.path.join(filePath, "freqDepen.csv"), mode="a")
     file.write("Time since Epoch (s), Sweep Frequency (Hz),Resonance Frequency (Hz)\n")
     for idx, fre in enumerate(freqsSweep):
         freqGen.set_frequency(channelX, fre)
-        time.sleep(delay)
-        res, _, _ = PLL1D(
-            ctrl=ctrlNorm,
-            freqGen=freqGen,
-            freqMin=freqResMin,
-            freqMax=freqResMax,
+        dwell(settle, delay, fre - freqsSweep[idx - 1] if idx > 0 else np.inf)
+        res, _, _ = __lock(
+            continuation,
+            fre,
+            ctrlNorm,
+            freqGen,
+            freqResMin,
+            freqResMax,
             tolerance=kwargs.get("tolerance", 0.001),
             iterations=kwargs.get("iterations", 11),
             freqGenChannel=channelY,
             Kp=kwargs.get("Kp", 1 / np.pi),
             delay=delay,
+            settle=settle,
+            solver=kwargs.get("solver", "proportional"),
+            coarse=kwargs.get("coarse", "argmax"),
+            precision=kwargs.get("precision", None),
         )
         resonance[idx] = res
-        file.write(f"{time.time()},{fre},{res}\n")
+        file.write(f"{clock.now()},{fre},{res}\n")
         file.flush()
+        metrics.point()
     file.close()
     linePlot(
         os.path.join(filePath, "freqDepen.png"),
@@ -369,67 +481,10 @@ def frequencyDependence(
     return resonance
 
 
-def frequencySweep2D(
-    fileName: str | os.PathLike,
-    ctrlNormal: SR830,
-    ctrlShear: SR830,
-    freqGen: RigolDG,
-    freqsNormal,
-    freqsShear,
-    delay: float = 2.0,
-    sysDelay: float = 0.777,
-) -> None:
-    os.makedirs(fileName)
-
-    lenNormal = len(freqsNormal)
-    lenShear = len(freqsShear)
-
-    open(file=os.path.join(fileName, "NormalAmp.csv"), mode="x").close()
-    open(file=os.path.join(fileName, "ShearAmp.csv"), mode="x").close()
-    open(file=os.path.join(fileName, "NormalPha.csv"), mode="x").close()
-    open(file=os.path.join(fileName, "ShearPha.csv"), mode="x").close()
-
-    normAmpFile = open(file=os.path.join(fileName, "NormalAmp.csv"), mode="a")
-    sheaAmpFile = open(file=os.path.join(fileName, "ShearAmp.csv"), mode="a")
-    normPhaFile = open(file=os.path.join(fileName, "NormalPha.csv"), mode="a")
-    sheaPhaFile = open(file=os.path.join(fileName, "ShearPha.csv"), mode="a")
-
-    print(
-        f"\nExpected loop time: {timedelta(seconds=lenNormal * lenShear * (delay + sysDelay))}\n"
-    )
-    tPre = time.time()
-    for i, fNormal in enumerate(freqsNormal):
-        print("Normal: " + str(fNormal) + " (Hz)")
-        listNormalAmp = lenShear * [0.0]
-        listNormalPha = lenShear * [0.0]
-        listShearAmp = lenShear * [0.0]
-        listShearPha = lenShear * [0.0]
-
-        freqGen.set_frequency(1, fNormal)
-        for j, fShear in enumerate(freqsShear):
-            freqGen.set_frequency(2, fShear)
-            time.sleep(delay)
-            listNormalAmp[j] = ctrlNormal.readAmplitude()
-            listNormalPha[j] = ctrlNormal.readPhase()
-            listShearAmp[j] = ctrlShear.readAmplitude()
-            listShearPha[j] = ctrlShear.readPhase()
-
-        normAmpFile.write(str(listNormalAmp)[1:-1] + "\n")
-        sheaAmpFile.write(str(listShearAmp)[1:-1] + "\n")
-        normPhaFile.write(str(listNormalPha)[1:-1] + "\n")
-        sheaPhaFile.write(str(listShearPha)[1:-1] + "\n")
-        normAmpFile.flush()
-        sheaAmpFile.flush()
-        normPhaFile.flush()
-        sheaPhaFile.flush()
-
-    print(f"\nFinished after: {timedelta(seconds=time.time() - tPre)}\n")
-
-    normAmpFile.close()
-    sheaAmpFile.close()
-    normPhaFile.close()
-    sheaPhaFile.close()
-
+def __sweep2DPlots(fileName: str | os.PathLike, freqsNormal, freqsShear) -> None:
+    """
+    Heatmaps of the amplitude and phase files written by `frequencySweep2D`.
+    """
     normalAmplitudes = np.genfromtxt(
         os.path.join(fileName, "NormalAmp.csv"), delimiter=","
     )
@@ -497,5 +552,173 @@ def frequencySweep2D(
         title="Normalised Phases",
     )
 
+
+@traced("measurement")
+def frequencySweep2D(
+    fileName: str | os.PathLike,
+    ctrlNormal: SR830,
+    ctrlShear: SR830,
+    freqGen: RigolDG,
+    freqsNormal,
+    freqsShear,
+    delay: float = 2.0,
+    sysDelay: float = 0.777,
+    settle: list[Settler | None] | None = None,
+    autoRange: bool = False,
+) -> None:
+    """
+    Measures amplitude and phase of both modes on a grid of normal and shear frequencies.
+
+    Pass a `Settler` per mode as `settle` ([Normal, Shear]) to wait the predicted settle time instead of `delay`.
+    With `autoRange` the lock-in sensitivities follow the amplitude, so the resonance does not clip,
+    at the cost of a `LIAS?` query per reading. default: False
+    """
+    settleNormal, settleShear = settle if settle is not None else (None, None)
+    os.makedirs(fileName)
+
+    lenNormal = len(freqsNormal)
+    lenShear = len(freqsShear)
+
+    open(file=os.path.join(fileName, "NormalAmp.csv"), mode="x").close()
+    open(file=os.path.join(fileName, "ShearAmp.csv"), mode="x").close()
+    open(file=os.path.join(fileName, "NormalPha.csv"), mode="x").close()
+    open(file=os.path.join(fileName, "ShearPha.csv"), mode="x").close()
+
+    normAmpFile = open(file=os.path.join(fileName, "NormalAmp.csv"), mode="a")
+    sheaAmpFile = open(file=os.path.join(fileName, "ShearAmp.csv"), mode="a")
+    normPhaFile = open(file=os.path.join(fileName, "NormalPha.csv"), mode="a")
+    sheaPhaFile = open(file=os.path.join(fileName, "ShearPha.csv"), mode="a")
+
+    print(
+        f"\nExpected loop time: {timedelta(seconds=lenNormal * lenShear * (delay + sysDelay))}\n"
+    )
+    tPre = clock.now()
+    metrics = getMetrics()
+    metrics.start("frequencySweep2D", lenNormal * lenShear)
+    fSetNormal, fSetShear = np.inf, np.inf
+    for i, fNormal in enumerate(freqsNormal):
+        print("Normal: " + str(fNormal) + " (Hz)")
+        listNormalAmp = lenShear * [0.0]
+        listNormalPha = lenShear * [0.0]
+        listShearAmp = lenShear * [0.0]
+        listShearPha = lenShear * [0.0]
+
+        freqGen.set_frequency(1, fNormal)
+        if autoRange:
+            # the cached sensitivities are stale once the front panel was touched
+            ctrlNormal.checkExternalChanges()
+            ctrlShear.checkExternalChanges()
+        for j, fShear in enumerate(freqsShear):
+            freqGen.set_frequency(2, fShear)
+            dwell(settle, delay, [fNormal - fSetNormal, fShear - fSetShear])
+            fSetNormal, fSetShear = fNormal, fShear
+            normal = snapRanged(ctrlNormal, settleNormal, delay, autoRange)
+            shear = snapRanged(ctrlShear, settleShear, delay, autoRange)
+            listNormalAmp[j] = float(normal["R"])
+            listNormalPha[j] = float(normal["theta"])
+            listShearAmp[j] = float(shear["R"])
+            listShearPha[j] = float(shear["theta"])
+            metrics.point()
+
+        normAmpFile.write(str(listNormalAmp)[1:-1] + "\n")
+        sheaAmpFile.write(str(listShearAmp)[1:-1] + "\n")
+        normPhaFile.write(str(listNormalPha)[1:-1] + "\n")
+        sheaPhaFile.write(str(listShearPha)[1:-1] + "\n")
+        normAmpFile.flush()
+        sheaAmpFile.flush()
+        normPhaFile.flush()
+        sheaPhaFile.flush()
+
+    print(f"\nFinished after: {timedelta(seconds=clock.now() - tPre)}\n")
+
+    normAmpFile.close()
+    sheaAmpFile.close()
+    normPhaFile.close()
+    sheaPhaFile.close()
+
+    __sweep2DPlots(fileName, freqsNormal, freqsShear)
+
     ctrlNormal.ser.close()
     ctrlShear.ser.close()
+
+
+@traced("measurement")
+async def frequencySweep2DAsync(
+    fileName: str | os.PathLike,
+    ctrlNormal: AsyncSR830,
+    ctrlShear: AsyncSR830,
+    freqGen: RigolDG,
+    freqsNormal,
+    freqsShear,
+    delay: float = 2.0,
+    sysDelay: float = 0.777,
+    settle: list[Settler | None] | None = None,
+    autoRange: bool = False,
+) -> None:
+    """
+    `frequencySweep2D` with both lock-ins read concurrently.
+
+    Per grid point the normal and shear lock-in are read at the same time, so the I/O time per point
+    is that of the slowest lock-in instead of the sum of both.
+    Run with `asyncio.run(frequencySweep2DAsync(...))`.
+    Closes both lock-ins at the end, like `frequencySweep2D`.
+    """
+    settleNormal, settleShear = settle if settle is not None else (None, None)
+    os.makedirs(fileName)
+
+    lenNormal = len(freqsNormal)
+    lenShear = len(freqsShear)
+
+    files = {
+        name: open(file=os.path.join(fileName, f"{name}.csv"), mode="x")
+        for name in ["NormalAmp", "ShearAmp", "NormalPha", "ShearPha"]
+    }
+
+    print(
+        f"\nExpected loop time: {timedelta(seconds=lenNormal * lenShear * (delay + sysDelay / 2))}\n"
+    )
+    tPre = clock.now()
+    metrics = getMetrics()
+    metrics.start("frequencySweep2DAsync", lenNormal * lenShear)
+    fSetNormal, fSetShear = np.inf, np.inf
+    for i, fNormal in enumerate(freqsNormal):
+        print("Normal: " + str(fNormal) + " (Hz)")
+        rows = {name: lenShear * [0.0] for name in files}
+
+        freqGen.set_frequency(1, fNormal)
+        if autoRange:
+            # the cached sensitivities are stale once the front panel was touched
+            await asyncio.gather(
+                ctrlNormal.run(ctrlNormal.ctrl.checkExternalChanges),
+                ctrlShear.run(ctrlShear.ctrl.checkExternalChanges),
+            )
+        for j, fShear in enumerate(freqsShear):
+            freqGen.set_frequency(2, fShear)
+            await asyncio.to_thread(
+                dwell, settle, delay, [fNormal - fSetNormal, fShear - fSetShear]
+            )
+            fSetNormal, fSetShear = fNormal, fShear
+
+            normal, shear = await asyncio.gather(
+                ctrlNormal.run(snapRanged, ctrlNormal.ctrl, settleNormal, delay, autoRange),
+                ctrlShear.run(snapRanged, ctrlShear.ctrl, settleShear, delay, autoRange),
+            )
+            rows["NormalAmp"][j] = float(normal["R"])
+            rows["NormalPha"][j] = float(normal["theta"])
+            rows["ShearAmp"][j] = float(shear["R"])
+            rows["ShearPha"][j] = float(shear["theta"])
+            metrics.point()
+
+        for name, file in files.items():
+            file.write(str(rows[name])[1:-1] + "\n")
+            file.flush()
+
+    print(f"\nFinished after: {timedelta(seconds=clock.now() - tPre)}\n")
+
+    for file in files.values():
+        file.close()
+
+    __sweep2DPlots(fileName, freqsNormal, freqsShear)
+
+    ctrlNormal.close()
+    ctrlShear.close()
@@ -0,0 +1,216 @@
+"""
+Live metrics of a running measurement
+
+The measurement loops report completed points, the PLL its iterations and unconverged runs, and the
+instrument reads their NaN results to the installed `RunMetrics`. From these it computes the rolling
+throughput (points per hour) and an ETA, and exposes everything through a JSON file that is rewritten
+during the run and, optionally, a local HTTP endpoint for a dashboard to scrape.
+
+Example:
+    setMetrics(RunMetrics(path="./Data/metrics.json"))
+    getMetrics().serve(8000)  # http://127.0.0.1:8000/metrics
+    frequencyDependence(...)
+"""
+
+import json
+import os
+import threading
+import time
+import numpy as np
+
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import clock
+
+
+COUNTERS: list[str] = [
+    "points",
+    "nanReads",
+    "pllRuns",
+    "pllIterations",
+    "pllNotConverged",
+]
+
+
+class RunMetrics:
+    def __init__(
+        self,
+        path: str | os.PathLike | None = None,
+        window: float = 1800.0,
+        writeInterval: float = 5.0,
+    ) -> None:
+        """
+        :param path: JSON file rewritten with the current metrics, `None` keeps them in memory only. default: `None`
+        :type path: str | os.PathLike | None
+
+        :param window: Time window of the rolling throughput, in s. default: `1800.0`
+        :type window: float
+
+        :param writeInterval: Minimum real time between two writes of the metrics file, in s. default: `5.0`
+        :type writeInterval: float
+        """
+        self.path = path
+        self.window = window
+        self.writeInterval = writeInterval
+        self.lock = threading.Lock()
+        self.server: ThreadingHTTPServer | None = None
+
+        self._lastWrite = -np.inf
+        self.start()
+
+    def start(self, run: str = "", total: int = 0) -> None:
+        """Starts a new run of `total` points, resets all counters."""
+        with self.lock:
+            self.run = run
+            self.total = total
+            self.counters: dict[str, int] = {name: 0 for name in COUNTERS}
+            self.tStart = clock.monotonic()
+            self.history: deque[tuple[float, int]] = deque([(self.tStart, 0)])
+        self.write(force=True)
+
+    def setTotal(self, total: int) -> None:
+        """Corrects the expected number of points, e.g. once a contact ends an approach early."""
+        with self.lock:
+            self.total = total
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def point(self, n: int = 1) -> None:
+        """Marks `n` points of the run as completed."""
+        with self.lock:
+            self.counters["points"] += n
+            now = clock.monotonic()
+            self.history.append((now, self.counters["points"]))
+            while len(self.history) > 2 and self.history[1][0] < now - self.window:
+                self.history.popleft()
+        self.write()
+
+    def checkNan(self, *values: float) -> None:
+        """Counts a NaN read if any of `values` is NaN."""
+        if any(v != v for v in values):
+            self.count("nanReads")
+
+    def pointsPerHour(self) -> float:
+        """Throughput over the last `window` seconds."""
+        with self.lock:
+            (t0, n0), (t1, n1) = self.history[0], self.history[-1]
+            now = clock.monotonic()
+        if now <= t0:
+            return 0.0
+        # include the time since the last point, so a stalled run shows a falling rate
+        return 3600 * (n1 - n0) / (max(now, t1) - t0)
+
+    def eta(self) -> float | None:
+        """Estimated remaining time in s, `None` while unknown."""
+        rate = self.pointsPerHour()
+        remaining = self.total - self.counters["points"]
+        if self.total <= 0 or rate <= 0:
+            return None
+        return 3600 * max(remaining, 0) / rate
+
+    def snapshot(self) -> dict:
+        elapsed = clock.monotonic() - self.tStart
+        eta = self.eta()
+        with self.lock:
+            counters = dict(self.counters)
+        pllRuns = max(counters["pllRuns"], 1)
+        return {
+            "run": self.run,
+            "time": clock.now(),
+            "elapsed": elapsed,
+            "total": self.total,
+            **counters,
+            "pointsPerHour": self.pointsPerHour(),
+            "eta": eta,
+            "etaTime": None if eta is None else clock.now() + eta,
+            "pllIterationsPerRun": counters["pllIterations"] / pllRuns,
+            "pllNotConvergedRate": counters["pllNotConverged"] / pllRuns,
+        }
+
+    def write(self, force: bool = False) -> None:
+        """Rewrites the metrics file, at most once per `writeInterval` unless `force`."""
+        if self.path is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._lastWrite < self.writeInterval:
+            return
+        self._lastWrite = now
+
+        tmp = f"{self.path}.tmp"
+        try:
+            with open(tmp, "w") as file:
+                json.dump(self.snapshot(), file, indent=2)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"Could not write metrics '{self.path}': {e}")
+
+    def prometheus(self) -> str:
+        """Metrics in the Prometheus text format."""
+        lines = []
+        for key, value in self.snapshot().items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines.append(f'tuning_fork_{key}{{run="{self.run}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int = 8000, host: str = "127.0.0.1") -> ThreadingHTTPServer | None:
+        """
+        Serves the metrics over HTTP in a background thread
+
+        `/metrics` gives the Prometheus text format, `/` the JSON snapshot.
+        When the port can not be bound (e.g. already in use) a warning is printed and the run continues
+        without serving, returns `None` then.
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.startswith("/metrics"):
+                    body = metrics.prometheus().encode()
+                    contentType = "text/plain; version=0.0.4"
+                elif self.path in ["/", "/json"]:
+                    body = json.dumps(metrics.snapshot()).encode()
+                    contentType = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", contentType)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args) -> None:
+                pass
+
+        try:
+            self.server = ThreadingHTTPServer((host, port), Handler)
+        except OSError as e:
+            print(f"Could not serve metrics on {host}:{port}: {e}")
+            return None
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server
+
+    def close(self) -> None:
+        self.write(force=True)
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+_metrics: RunMetrics = RunMetrics()
+
+
+def getMetrics() -> RunMetrics:
+    return _metrics
+
+
+def setMetrics(metrics: RunMetrics) -> RunMetrics:
+    """Installs `metrics` for all modules, returns the previous one."""
+    global _metrics
+    previous = _metrics
+    _metrics = metrics
+    return previous
@@ -9,8 +9,10 @@ import seaborn as sns
 from typing import overload
 from os import PathLike
 from datetime import datetime
+from profiler import traced
 
 
+@traced("plot")
 def heatmapPlot(
     fName: str,
     data: list[list[int | float]] | np.ndarray,
@@ -150,6 +152,7 @@ def linePlot(
 ) -> None: ...
 
 
+@traced("plot")
 def linePlot(
     fName: str | PathLike,
     x: list[int | float] | np.ndarray,
@@ -0,0 +1,229 @@
+"""
+Opt-in timeline profiler
+
+While tracing is enabled, instrument calls, sleeps, fits, plots and the PLL and measurement routines
+record spans with a category and tags (device, command). The spans export as Chrome trace-event JSON,
+to open in `chrome://tracing` or https://ui.perfetto.dev, and summarise per category. Spans nest: a
+`PLL1D` span contains its `lockin` and `sleep` spans, the summary gives both the total and the self
+time (without nested spans) per category.
+
+When tracing is off, a traced call costs a single check.
+
+Example:
+    with tracing("trace.json") as tracer:
+        frequencyDependence(...)
+    print(tracer.summaryTable())
+"""
+
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+
+from contextlib import contextmanager, nullcontext
+
+
+class Tracer:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.events: list[dict] = []
+        self.t0 = time.perf_counter()
+        self.pid = os.getpid()
+
+    @contextmanager
+    def span(self, name: str, cat: str, **tags):
+        tStart = time.perf_counter()
+        try:
+            yield
+        finally:
+            tEnd = time.perf_counter()
+            event = {
+                "name": name,
+                "cat": cat,
+                "ph": "X",
+                "ts": 1e6 * (tStart - self.t0),
+                "dur": 1e6 * (tEnd - tStart),
+                "pid": self.pid,
+                "tid": threading.get_ident(),
+                "args": {key: str(value) for key, value in tags.items()},
+            }
+            with self.lock:
+                self.events.append(event)
+
+    def export(self, path: str | os.PathLike) -> None:
+        """Writes the spans as Chrome trace-event JSON."""
+        with self.lock:
+            events = list(self.events)
+        threads = {event["tid"] for event in events}
+        names = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": self.pid,
+                "tid": tid,
+                "args": {"name": "main" if tid == threading.main_thread().ident else str(tid)},
+            }
+            for tid in threads
+        ]
+        with open(path, "w") as file:
+            json.dump({"traceEvents": names + events, "displayTimeUnit": "ms"}, file)
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        """
+        Time per category
+
+        Returns per category the number of spans, the total and the self time in s (total without
+        nested spans), and the self time as fraction of the traced wall time.
+        """
+        with self.lock:
+            events = sorted(self.events, key=lambda e: (e["tid"], e["ts"], -e["dur"]))
+
+        result: dict[str, dict[str, float]] = {}
+        selfTime: dict[int, float] = {}
+        stack: list[tuple[int, dict]] = []
+        for i, event in enumerate(events):
+            while len(stack) > 0 and (
+                stack[-1][1]["tid"] != event["tid"]
+                or stack[-1][1]["ts"] + stack[-1][1]["dur"] <= event["ts"]
+            ):
+                stack.pop()
+            selfTime[i] = event["dur"]
+            if len(stack) > 0:
+                selfTime[stack[-1][0]] -= event["dur"]
+            stack.append((i, event))
+
+        for i, event in enumerate(events):
+            entry = result.setdefault(event["cat"], {"count": 0, "total": 0.0, "self": 0.0})
+            entry["count"] += 1
+            entry["total"] += 1e-6 * event["dur"]
+            entry["self"] += 1e-6 * selfTime[i]
+
+        if len(events) > 0:
+            wall = 1e-6 * (
+                max(e["ts"] + e["dur"] for e in events) - min(e["ts"] for e in events)
+            )
+            for entry in result.values():
+                entry["fraction"] = entry["self"] / wall if wall > 0 else 0.0
+        return result
+
+    def summaryTable(self) -> str:
+        lines = [f"{'category':>12} {'spans':>8} {'total (s)':>11} {'self (s)':>11} {'self (%)':>9}"]
+        summary = self.summary()
+        for cat, entry in sorted(summary.items(), key=lambda item: -item[1]["self"]):
+            lines.append(
+                f"{cat:>12} {entry['count']:8d} {entry['total']:11.3f} "
+                f"{entry['self']:11.3f} {100 * entry['fraction']:9.1f}"
+            )
+        return "\n".join(lines)
+
+
+_tracer: Tracer | None = None
+_patched: list[tuple[type, str, object]] = []
+
+
+def getTracer() -> Tracer | None:
+    return _tracer
+
+
+def span(name: str, cat: str, **tags):
+    """Context manager recording a span, does nothing while tracing is off."""
+    if _tracer is None:
+        return nullcontext()
+    return _tracer.span(name, cat, **tags)
+
+
+def traced(cat: str, name: str | None = None, tags=None):
+    """
+    Decorator recording every call as a span while tracing is on
+
+    :param cat: Category of the span, e.g. `"lockin"` or `"plot"`.
+    :type cat: str
+
+    :param name: Span name. default: function name
+    :type name: str | None
+
+    :param tags: Function of the call arguments returning a dict of tags. default: `None`
+    :type tags: Callable | None
+
+    Coroutine functions are spanned until they return, not just until the coroutine is created.
+    """
+
+    def decorator(func):
+        spanName = name or func.__name__
+
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def asyncWrapper(*args, **kwargs):
+                if _tracer is None:
+                    return await func(*args, **kwargs)
+                with _tracer.span(spanName, cat, **(tags(*args, **kwargs) if tags else {})):
+                    return await func(*args, **kwargs)
+
+            return asyncWrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return func(*args, **kwargs)
+            with _tracer.span(spanName, cat, **(tags(*args, **kwargs) if tags else {})):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _patchRigol() -> None:
+    """Traces the SCPI commands of the function generator driver, which is not ours to decorate."""
+    try:
+        from rigol_dg1022 import RigolDG
+    except ImportError:
+        return
+
+    for cls in [RigolDG, *RigolDG.__subclasses__()]:
+        for method in ["_send_command", "_query"]:
+            original = cls.__dict__.get(method)
+            if original is None:
+                continue
+            _patched.append((cls, method, original))
+            setattr(
+                cls,
+                method,
+                traced("freqGen", tags=lambda self, command, *a, **k: {"device": "RigolDG", "command": command})(
+                    original
+                ),
+            )
+
+
+def enable() -> Tracer:
+    """Starts tracing with a new tracer."""
+    global _tracer
+    _tracer = Tracer()
+    if len(_patched) == 0:
+        _patchRigol()
+    return _tracer
+
+
+def disable() -> Tracer | None:
+    """Stops tracing, returns the tracer with the recorded spans."""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    while len(_patched) > 0:
+        cls, method, original = _patched.pop()
+        setattr(cls, method, original)
+    return tracer
+
+
+@contextmanager
+def tracing(path: str | os.PathLike | None = None):
+    """Traces a `with` block, exports the trace to `path` at the end if given."""
+    tracer = enable()
+    try:
+        yield tracer
+    finally:
+        disable()
+        if path is not None:
+            tracer.export(path)
@@ -0,0 +1,120 @@
+"""
+Dual-channel scheduler
+
+The PLL runs as a generator of steps: it yields `(frequency, step, read)`, meaning set its channel to
+`frequency`, wait for a frequency step of `step` Hz (see `settle.dwell`) and read its lock-in with
+`read(ctrl)`; the reading is sent back into the generator, and its return value is the result. A
+fourth element `(..., dwells)` waits that many fixed delays for a job without a `Settler`.
+
+`run` executes one such job. `runInterleaved` executes jobs on different channels and lock-ins in
+lockstep: every round sets all channels, waits a single dwell for all of them and reads all lock-ins,
+so the two modes of the fork share their dwells instead of taking turns.
+
+Stepping one mode moves the resonance of the other (the coupling `frequencyDependence` measures), so
+a job that finished before the others may no longer be locked when they are done. `PLL2x1D` re-reads
+such channels at the end, see `crossTalk` there.
+"""
+
+from collections.abc import Callable, Generator
+
+import numpy as np
+
+from LockIn_Amplifier import SR830
+from rigol_dg1022 import RigolDG
+from settle import Settler, dwell
+
+
+Step = tuple[float, float, Callable[[SR830], object]] | tuple[float, float, Callable[[SR830], object], float]
+"""(frequency in Hz, frequency step in Hz to settle from, read function of the lock-in[, delays to wait without a Settler, default 1])"""
+
+
+def readSnap(ctrl: SR830) -> np.record:
+    return ctrl.snap("R", "theta")
+
+
+def readAmplitude(ctrl: SR830) -> float:
+    return ctrl.readAmplitude()
+
+
+class Job:
+    def __init__(
+        self,
+        steps: Generator[Step, object, object],
+        ctrl: SR830,
+        freqGenChannel: int,
+        settle: Settler | None = None,
+    ) -> None:
+        """
+        :param steps: Generator of the steps, returns the result.
+        :type steps: Generator
+
+        :param ctrl: Lock-In Amplifier the steps read.
+        :type ctrl: SR830
+
+        :param freqGenChannel: Function generator channel the steps set.
+        :type freqGenChannel: int
+
+        :param settle: Settler of the mode, `None` waits the fixed `delay`. default: `None`
+        :type settle: Settler | None
+        """
+        self.steps = steps
+        self.ctrl = ctrl
+        self.freqGenChannel = freqGenChannel
+        self.settle = settle
+
+        self.step: Step | None = None
+        self.done = False
+        self.result = None
+        self.rounds = 0
+        """Dwells the job took, the last round it was read in."""
+        self.frequency = np.nan
+        """Frequency the channel was set to last."""
+
+    def advance(self, reading=None) -> None:
+        """Sends `reading` and takes the next step, or the result once the generator returns."""
+        try:
+            self.step = self.steps.send(reading) if self.step is not None else next(self.steps)
+        except StopIteration as stop:
+            self.step = None
+            self.done = True
+            self.result = stop.value
+
+
+def run(job: Job, freqGen: RigolDG, delay: float):
+    """Executes a single job, returns its result."""
+    return runInterleaved([job], freqGen, delay)[0]
+
+
+def runInterleaved(jobs: list[Job], freqGen: RigolDG, delay: float) -> list:
+    """
+    Executes jobs on different channels in lockstep
+
+    Each round sets the frequency of every unfinished job, waits once for all of them (the longest
+    predicted settle time when all jobs have a `Settler`, `delay` times the most `dwells` of their
+    steps otherwise) and then reads each job's lock-in. Jobs that finish early leave their channel
+    where it is.
+
+    Returns the results in the order of `jobs`.
+    """
+    for job in jobs:
+        job.advance()
+
+    rounds = 0
+    while not all(job.done for job in jobs):
+        active = [job for job in jobs if not job.done]
+        for job in active:
+            freqGen.set_frequency(job.freqGenChannel, job.step[0])
+            job.frequency = job.step[0]
+
+        settles = [job.settle for job in active]
+        if all(settle is not None for settle in settles):
+            dwell(settles if len(settles) > 1 else settles[0], delay, [job.step[1] for job in active])
+        else:
+            dwell(None, delay * max(job.step[3] if len(job.step) > 3 else 1 for job in active))
+
+        rounds += 1
+        for job in active:
+            job.rounds = rounds
+            job.advance(job.step[2](job.ctrl))
+
+    return [job.result for job in jobs]
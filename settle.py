@@ -0,0 +1,204 @@
+"""
+Adaptive settling after a frequency step
+
+Predicts how long the lock-in output needs to settle from the lock-in time constant and filter slope,
+the ring-down time of the fork and the size of the frequency step, instead of a fixed delay.
+"""
+
+import clock
+import numpy as np
+
+from LockIn_Amplifier import SR830, TIME_CONSTANTS
+
+
+FILTER_SETTLE: list[float] = [5.0, 7.0, 9.0, 10.0]
+"""Time constants to settle to 99% for a 6, 12, 18 and 24 dB/oct filter slope (`OFSL` index 0 - 3)."""
+
+
+class Settler:
+    def __init__(
+        self,
+        ctrl: SR830,
+        ringdown: float = 0.0,
+        linewidth: float | None = None,
+        tolerance: float = 0.01,
+        poll: bool = False,
+        pollTolerance: tuple[float, float] = (1e-3, 0.1),
+        maxPolls: int = 10,
+        minDelay: float = 0.0,
+        maxDelay: float = 10.0,
+    ) -> None:
+        """
+        :param ctrl: Lock-In Amplifier of the mode that is stepped.
+        :type ctrl: SR830
+
+        :param ringdown: Amplitude ring-down time of the fork `Q / (π f)`, in s. default: `0.0`
+        :type ringdown: float
+
+        :param linewidth: Full width at half maximum of the resonance, in Hz. Steps are scaled by it, `None` treats every step as a full step. default: `None`
+        :type linewidth: float | None
+
+        :param tolerance: Remaining fraction of the step response that counts as settled. default: `0.01`
+        :type tolerance: float
+
+        :param poll: Keep reading after the predicted dwell until successive readings agree. default: `False`
+        :type poll: bool
+
+        :param pollTolerance: Allowed change between successive readings as (relative amplitude, phase in deg). default: `(1e-3, 0.1)`
+        :type pollTolerance: tuple[float, float]
+
+        :param maxPolls: Maximum extra readings when polling. default: `10`
+        :type maxPolls: int
+
+        :param minDelay: Lower bound on the predicted dwell, in s. default: `0.0`
+        :type minDelay: float
+
+        :param maxDelay: Upper bound on the predicted dwell, in s. default: `10.0`
+        :type maxDelay: float
+        """
+        self.ctrl = ctrl
+        self.ringdown = ringdown
+        self.linewidth = linewidth
+        self.tolerance = tolerance
+        self.poll = poll
+        self.pollTolerance = pollTolerance
+        self.maxPolls = maxPolls
+        self.minDelay = minDelay
+        self.maxDelay = maxDelay
+
+        self.refresh()
+
+    @classmethod
+    def fromCalibration(
+        cls, ctrl: SR830, fRes: float, gamma: float, **kwargs
+    ) -> "Settler":
+        """
+        Settler from the results of `calibration.calibrateAirSingle` ([fRes, C, γ]).
+
+        The damping γ (rad/s) gives a ring-down time of `2 / γ` (= `Q / (π f)`) and a linewidth of `γ / 2π` Hz.
+        """
+        return cls(ctrl, ringdown=2 / gamma, linewidth=gamma / (2 * np.pi), **kwargs)
+
+    def refresh(self) -> None:
+        """Takes the time constant and filter slope from the lock-in state, call after changing them."""
+        self.ctrl.checkExternalChanges()
+        try:
+            self.timeConstant = TIME_CONSTANTS[int(self.ctrl.getState("timeConstant"))]
+            self.slope = int(self.ctrl.getState("slope"))
+        except (ValueError, IndexError):
+            self.timeConstant = TIME_CONSTANTS[8]
+            self.slope = 3
+
+    def predict(self, step: float = np.inf) -> float:
+        """
+        Predict the dwell needed after a frequency step
+
+        The step response decays from the relative disturbance `|step| / (linewidth / 2)` to `tolerance`,
+        through both the fork ring-down and the lock-in output filter.
+
+        Returns dwell time in s.
+        """
+        if self.linewidth is None or not np.isfinite(step):
+            disturbance = 1.0
+        else:
+            disturbance = min(1.0, abs(step) / (self.linewidth / 2))
+
+        if disturbance <= self.tolerance:
+            return self.minDelay
+
+        decays = np.log(disturbance / self.tolerance)
+        filterTime = FILTER_SETTLE[self.slope] * self.timeConstant * decays / np.log(100)
+        ringTime = self.ringdown * decays
+
+        return float(np.clip(filterTime + ringTime, self.minDelay, self.maxDelay))
+
+    def filterTime(self) -> float:
+        """Time for the lock-in output filter alone to settle to 99%, in s."""
+        return FILTER_SETTLE[self.slope] * self.timeConstant
+
+    def converge(self) -> int:
+        """
+        Poll until two successive readings agree within `pollTolerance`
+
+        Returns number of extra readings taken.
+        """
+        prev = self.ctrl.snap("R", "theta")
+        for i in range(self.maxPolls):
+            clock.sleep(self.timeConstant)
+            reading = self.ctrl.snap("R", "theta")
+            if abs(reading["R"] - prev["R"]) <= self.pollTolerance[0] * abs(
+                reading["R"]
+            ) and abs(reading["theta"] - prev["theta"]) <= self.pollTolerance[1]:
+                return i + 1
+            prev = reading
+        return self.maxPolls
+
+    def wait(self, step: float = np.inf) -> float:
+        """
+        Wait until the lock-in output has settled after a frequency step
+
+        Returns the predicted dwell in s (excluding polling).
+        """
+        delay = self.predict(step)
+        clock.sleep(delay)
+        if self.poll:
+            self.converge()
+        return delay
+
+
+def dwell(
+    settle: Settler | list[Settler | None] | None,
+    delay: float,
+    step: float | list[float] = np.inf,
+) -> float:
+    """
+    Wait after a frequency step
+
+    Sleeps the fixed `delay` when `settle` is `None`, otherwise the predicted settle time.
+    For several channels give a list of settlers and steps, the longest wait is used, a `None`
+    entry waits the fixed `delay`.
+
+    Returns the time waited in s (excluding polling).
+    """
+    if settle is None:
+        clock.sleep(delay)
+        return delay
+
+    if isinstance(settle, Settler):
+        return settle.wait(step if np.isscalar(step) else max(np.abs(step)))
+
+    steps = step if not np.isscalar(step) else len(settle) * [step]
+    wait = max(delay if s is None else s.predict(st) for s, st in zip(settle, steps))
+    clock.sleep(wait)
+    for s in settle:
+        if s is not None and s.poll:
+            s.converge()
+    return wait
+
+
+def snapRanged(
+    ctrl: SR830,
+    settle: Settler | None,
+    delay: float,
+    autoRange: bool = True,
+    maxSteps: int = 5,
+) -> np.record:
+    """
+    Read R and \u03b8, auto-ranging the sensitivity
+
+    Re-settles and reads again only if `SR830.autoRange` actually changed the range, waiting `delay`
+    or the filter settle time of `settle`.
+
+    Returns record with fields `R` and `theta`.
+    """
+    reading = ctrl.snap("R", "theta")
+    if not autoRange:
+        return reading
+
+    for _ in range(maxSteps):
+        if not ctrl.autoRange(reading["R"]):
+            break
+        clock.sleep(delay if settle is None else settle.filterTime())
+        reading = ctrl.snap("R", "theta")
+
+    return reading
@@ -0,0 +1,29 @@
+import os
+import sys
+
+import matplotlib
+import pytest
+
+matplotlib.use("Agg")
+
+# the modules sit flat in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import clock  # noqa: E402
+from metrics import RunMetrics, setMetrics  # noqa: E402
+
+
+@pytest.fixture
+def virtualClock():
+    """Runs the test on a `VirtualClock`, sleeps return at once and are counted."""
+    with clock.useClock(clock.VirtualClock(start=0.0)) as clk:
+        yield clk
+
+
+@pytest.fixture
+def metrics():
+    """Counts the test run on fresh `RunMetrics`."""
+    metrics = RunMetrics()
+    previous = setMetrics(metrics)
+    yield metrics
+    setMetrics(previous)
@@ -0,0 +1,121 @@
+import numpy as np
+import pytest
+
+from autotune import GainStore, gains, identify, settling
+from SFA_Controller import STREAM_DTYPE
+
+MODEL = {"pole": 0.6, "phaseSlope": 360 / np.pi, "fRes": 791.3, "amplitudeGain": 0.01}
+"""Loop of a 1 Hz wide resonance, 0.01 V at resonance per V of drive."""
+
+
+def stream(frequencies, theta0: float = 0.0, interval: float = 0.05, model: dict = MODEL) -> np.ndarray:
+    """
+    Binary stream samples of the normal mode following the lag model, the frequency of a sample is the
+    one set after its reading
+    """
+    a, K, f0 = model["pole"], model["phaseSlope"], model["fRes"]
+    samples = np.zeros(len(frequencies), dtype=STREAM_DTYPE)
+    theta = theta0
+    for k, f in enumerate(frequencies):
+        if k > 0:
+            theta = a * theta + (1 - a) * K * (f0 - frequencies[k - 1])
+        samples[k]["phase"] = theta
+    samples["frequency"] = frequencies
+    samples["amplitude"] = 1.0
+    samples["inputAmplitude"] = model["amplitudeGain"] * np.cos(np.deg2rad(samples["phase"]))
+    samples["deviceTime"] = interval * np.arange(len(samples))
+    samples["time"] = samples["deviceTime"] + 1e9
+    return samples
+
+
+def stepAndBack(step: float = 0.1, n: int = 30, skipped: int = 3) -> tuple[np.ndarray, np.ndarray]:
+    """The two segments of `autotune`, `skipped` readings lost between them."""
+    f0 = MODEL["fRes"]
+    full = stream(np.concatenate([np.full(n, f0 + step), np.full(n + skipped, f0)]))
+    return full[:n], full[n + skipped :]
+
+
+def test_identify_recovers_model():
+    model = identify(list(stepAndBack()))
+    assert model["pole"] == pytest.approx(MODEL["pole"])
+    assert model["phaseSlope"] == pytest.approx(MODEL["phaseSlope"])
+    assert model["fRes"] == pytest.approx(MODEL["fRes"])
+    assert model["linewidth"] == pytest.approx(1.0)
+    assert model["amplitudeGain"] == pytest.approx(MODEL["amplitudeGain"])
+
+
+def test_identify_pairs_readings_within_segments_only():
+    stepped, back = stepAndBack()
+    assert identify([stepped, back])["pole"] == pytest.approx(MODEL["pole"])
+    # as one stretch the first reading after the gap is paired with the last one before it
+    assert identify(np.concatenate([stepped, back]))["pole"] != pytest.approx(MODEL["pole"], abs=1e-3)
+
+
+def test_identify_needs_readings():
+    stepped, _ = stepAndBack(n=5)
+    with pytest.raises(RuntimeError):
+        identify(stepped)
+
+
+def test_identify_rejects_wrong_sign():
+    # a loop running away from the resonance is no stable lag
+    stepped, back = stepAndBack()
+    for segment in (stepped, back):
+        segment["phase"] *= -1
+    with pytest.raises(RuntimeError):
+        identify([stepped, back])
+
+
+def closedLoop(tuned: dict, model: dict, offset: float, n: int = 200) -> np.ndarray:
+    """Phase readings of the firmware loop with the `tuned` terms, after a jump of `offset` Hz."""
+    a, linewidth = model["pole"], model["linewidth"]
+    theta, detuning = 0.0, offset
+    history = np.empty(n)
+    for k in range(n):
+        theta = a * theta + (1 - a) * np.rad2deg(np.arctan(-2 * detuning / linewidth))
+        history[k] = theta
+        correction = (tuned["exponential"] if theta >= 0 else -tuned["exponential"]) * theta**2
+        correction += tuned["linear"] * theta
+        detuning += float(np.clip(correction, -0.5, 0.5))
+    return history
+
+
+def test_gains_lock_without_ringing():
+    model = identify(list(stepAndBack()))
+    tuned = gains(model, phaseRange=60.0, tolerance=1.0)
+    a, K = model["pole"], model["phaseSlope"]
+    critical = (1 - np.sqrt(a)) ** 2 / ((1 - a) * K)
+    assert critical <= tuned["linear"] <= 4 * critical
+    assert tuned["exponential"] >= 0
+    # up to the 60 deg of phaseRange
+    for offset in [0.05, 0.5, 0.85]:
+        theta = closedLoop(tuned, model, offset)
+        assert np.all(np.abs(theta[-20:]) < 0.01)
+        # the phase starts negative above the resonance and may not swing past 1 deg
+        assert np.max(theta) <= 1.0
+
+
+def test_gains_amplitude():
+    model = identify(list(stepAndBack()))
+    a = model["pole"]
+    tuned = gains(model)
+    assert tuned["amplitudeLinear"] == pytest.approx((1 - np.sqrt(a)) ** 2 / ((1 - a) * MODEL["amplitudeGain"]))
+    assert np.isnan(gains({**model, "amplitudeGain": np.nan})["amplitudeLinear"])
+
+
+def test_settling():
+    samples = stream(np.full(10, MODEL["fRes"]), theta0=-20.0)
+    readings, overshoot = settling(samples, "normal", tolerance=1.0)
+    # |θ| = 20 0.6^k drops below 1 deg at k = 6
+    assert readings == 6
+    assert overshoot == 0.0
+
+
+def test_gain_store(tmp_path):
+    path = tmp_path / "gains.json"
+    store = GainStore(path)
+    assert store.get("fork 3", "20 cSt") is None
+    store.put("fork 3", "20 cSt", "normal", {"linear": 0.001})
+    assert GainStore(path).get("fork 3", "20 cSt", "normal") == {"linear": 0.001}
+    store.forget(GainStore.key("fork 3", "20 cSt", "normal"))
+    assert GainStore(path).get("fork 3", "20 cSt", "normal") is None
@@ -0,0 +1,33 @@
+import clock
+from calibration import calibrateAir
+from Simulated_Instruments import simulatedSetup
+
+
+def calibrate(**kwargs) -> tuple[float, float]:
+    """Largest resonance error of `calibrateAir` against the coupled ground truth, and the instrument time."""
+    with clock.useClock(clock.VirtualClock(start=0.0)) as clk:
+        fork, ctrlNormal, ctrlShear, freqGen, _, _ = simulatedSetup(seed=0)
+        normal, shear = calibrateAir(ctrlNormal, ctrlShear, freqGen, debugPrints="none", **kwargs)
+        error = max(
+            abs(normal[0] - fork.trueResonance("normal", otherFrequency=shear[0])),
+            abs(shear[0] - fork.trueResonance("shear", otherFrequency=normal[0])),
+        )
+        return error, clk.monotonic()
+
+
+def test_interleaved_calibration(metrics):
+    error, seconds = calibrate()
+    sequentialError, sequentialSeconds = calibrate(interleave=False)
+    # the modes of the simulated fork move each other by more than 10 deg, the dense sweeps fall back
+    assert metrics.counters["crossTalk"] == 1
+    assert seconds < sequentialSeconds
+    assert error < 0.05
+    assert error <= sequentialError
+
+
+def test_interleaved_dense_sweeps(metrics):
+    error, seconds = calibrate(crossTalk=20.0)
+    sequentialError, sequentialSeconds = calibrate(interleave=False)
+    assert metrics.counters.get("crossTalk", 0) == 0
+    assert seconds < sequentialSeconds * 0.6
+    assert error <= sequentialError
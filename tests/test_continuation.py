@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from continuation import Continuation
+from Simulated_Instruments import simulatedSetup
+
+
+def test_predict_without_history():
+    track = Continuation()
+    assert track.predict(455.0) is None
+    assert track.bracket(455.0) is None
+
+
+def test_predict_extrapolates_linearly():
+    track = Continuation(order=1)
+    track.add(0.0, 790.0)
+    assert track.predict(5.0) == 790.0
+    track.add(1.0, 790.5)
+    assert track.predict(2.0) == pytest.approx(791.0)
+    # only the last order + 1 resonances count
+    track.add(2.0, 790.5)
+    assert track.predict(3.0) == pytest.approx(790.5)
+
+
+def test_predict_repeated_position_uses_newest():
+    track = Continuation(order=1)
+    track.add(0.0, 790.0)
+    track.add(0.0, 790.2)
+    assert track.predict(1.0) == pytest.approx(790.2)
+
+
+def test_bracket_widens_with_error():
+    track = Continuation(halfwidth=0.1, errorScale=4.0)
+    track.add(0.0, 790.0)
+    assert track.bracket(0.0) == pytest.approx((789.9, 790.1))
+    track.error = 0.05
+    assert track.bracket(0.0) == pytest.approx((789.8, 790.2))
+
+
+def test_reset_forgets_history():
+    track = Continuation()
+    track.add(0.0, 790.0)
+    track.error = 1.0
+    track.reset()
+    assert track.predict(0.0) is None
+    assert track.error == 0.0
+
+
+def lockAlong(track, setup, freqsShear):
+    fork, ctrlNormal, _, freqGen, _, _ = setup
+    found, truth = [], []
+    for fShear in freqsShear:
+        freqGen.set_frequency(2, fShear)
+        fRes, _, _ = track.lock(fShear, ctrlNormal, freqGen, 789.5, 794.5, freqGenChannel=1, delay=1.0)
+        found.append(fRes)
+        truth.append(fork.trueResonance("normal", otherFrequency=fShear))
+    return np.array(found), np.array(truth)
+
+
+def test_lock_follows_resonance(virtualClock, metrics):
+    track = Continuation()
+    found, truth = lockAlong(track, simulatedSetup(seed=1), np.linspace(454.0, 456.0, 5))
+    assert np.max(np.abs(found - truth)) < 0.01
+    assert len(track.history) == 2
+    assert metrics.counters.get("continuationLost", 0) == 0
+
+
+def test_lock_lost_falls_back_to_full_search(virtualClock, metrics):
+    track = Continuation(halfwidth=0.1)
+    # history far off the resonance, the bracketed lock can not find it
+    track.add(453.0, 792.5)
+    found, truth = lockAlong(track, simulatedSetup(seed=1), [454.0])
+    assert abs(found[0] - truth[0]) < 0.01
+    assert metrics.counters["continuationLost"] == 1
+    assert track.history == [(454.0, found[0])]
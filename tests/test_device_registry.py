@@ -0,0 +1,87 @@
+import pytest
+from serial.tools.list_ports_common import ListPortInfo
+
+import Device_Registry
+from Device_Registry import DeviceRegistry
+
+
+def portInfo(device: str, sn: str | None = None, pid: int | None = None, vid: int | None = None) -> ListPortInfo:
+    info = ListPortInfo(device, skip_link_detection=True)
+    info.serial_number, info.pid, info.vid = sn, pid, vid
+    return info
+
+
+@pytest.fixture
+def plug(monkeypatch, tmp_path):
+    """Plugs a fake serial port, a file in `tmp_path` with the given identity, returns its device name."""
+    ports: dict[str, ListPortInfo] = {}
+
+    def comports():
+        return list(ports.values())
+
+    def sysfs(device: str) -> ListPortInfo:
+        return ports.get(device, portInfo(device))
+
+    def plug(name: str, **identity) -> str:
+        device = str(tmp_path / name)
+        open(device, "w").close()
+        ports[device] = portInfo(device, **identity)
+        return device
+
+    monkeypatch.setattr(Device_Registry.list_ports, "comports", comports)
+    monkeypatch.setattr(Device_Registry.list_ports_linux, "SysFS", sysfs)
+    return plug
+
+
+def test_key():
+    assert DeviceRegistry.key(sn="A1") == "sn:A1"
+    assert DeviceRegistry.key(pid=0x4001, vid=0x0FE7) == "pidvid:4001:0FE7"
+    with pytest.raises(ValueError):
+        DeviceRegistry.key(pid=0x4001)
+
+
+def test_resolve_caches_on_disk(plug, tmp_path):
+    device = plug("ttyUSB0", sn="A1")
+    path = tmp_path / "ports.json"
+    assert DeviceRegistry(path).resolve(sn="A1") == device
+    assert DeviceRegistry(path).cache == {"sn:A1": device}
+
+
+@pytest.mark.parametrize("platform", ["linux", "win32"])
+def test_cached_port_is_reused(plug, monkeypatch, platform):
+    monkeypatch.setattr(Device_Registry.sys, "platform", platform)
+    device = plug("ttyUSB0", sn="A1")
+    registry = DeviceRegistry("")
+    registry.cache["sn:A1"] = device
+    assert registry.resolve(sn="A1") == device
+    # Linux checks the identity on sysfs, without enumerating
+    assert (registry._ports is None) == (platform == "linux")
+
+
+@pytest.mark.parametrize("platform", ["linux", "win32"])
+def test_swapped_ports_are_found_again(plug, monkeypatch, capsys, platform):
+    monkeypatch.setattr(Device_Registry.sys, "platform", platform)
+    normal = plug("ttyUSB0", sn="A1")
+    shear = plug("ttyUSB1", sn="B2")
+    registry = DeviceRegistry("")
+    # cached before a replug swapped the port numbers
+    registry.cache = {"sn:A1": shear, "sn:B2": normal}
+    assert registry.resolve(sn="A1") == normal
+    assert registry.resolve(sn="B2") == shear
+    assert registry.cache == {"sn:A1": normal, "sn:B2": shear}
+    assert "belongs to another device" in capsys.readouterr().out
+
+
+def test_unplugged_port_is_dropped(plug, monkeypatch):
+    monkeypatch.setattr(Device_Registry.sys, "platform", "linux")
+    registry = DeviceRegistry("")
+    registry.cache["pidvid:4001:0FE7"] = "/dev/missing"
+    with pytest.raises(LookupError):
+        registry.resolve(pid=0x4001, vid=0x0FE7)
+    assert registry.cache == {}
+
+
+def test_resolve_all_lists_every_missing_device(plug):
+    plug("ttyUSB0", sn="A1")
+    with pytest.raises(LookupError, match="shear.*\n.*height"):
+        DeviceRegistry("").resolveAll({"normal": {"sn": "A1"}, "shear": {"sn": "B2"}, "height": {"pid": 1, "vid": 2}})
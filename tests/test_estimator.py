@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+from estimator import ResonanceEstimator
+
+TRUTH = np.array([791.3, 1.0, 0.01])
+
+
+def reading(f: float, x: np.ndarray = TRUTH) -> tuple[float, float]:
+    """Noiseless amplitude in V and phase in deg of the driven oscillator."""
+    amplitude, phase = ResonanceEstimator(*x).model(f)
+    return amplitude, np.rad2deg(phase)
+
+
+def feed(estimator: ResonanceEstimator, freqs) -> ResonanceEstimator:
+    for f in freqs:
+        estimator.update(f, *reading(f))
+    return estimator
+
+
+def test_phase_convention():
+    amplitude, phase = reading(TRUTH[0])
+    assert amplitude == pytest.approx(TRUTH[2])
+    assert phase == pytest.approx(0.0)
+    # positive below the resonance, 45 deg half a linewidth away
+    assert reading(TRUTH[0] - TRUTH[1] / 2)[1] == pytest.approx(45.0, abs=0.1)
+    assert reading(TRUTH[0] + 1.0)[1] < 0
+
+
+def test_jacobian_matches_finite_differences():
+    estimator = ResonanceEstimator(791.0, 1.2, 0.008)
+    f = 791.4
+    numeric = np.empty((2, 3))
+    for i, h in enumerate([1e-6, 1e-6, 1e-9]):
+        dx = np.zeros(3)
+        dx[i] = h
+        numeric[:, i] = (np.array(estimator.model(f, estimator.x + dx)) - estimator.model(f, estimator.x - dx)) / (2 * h)
+    assert estimator.jacobian(f) == pytest.approx(numeric, rel=1e-4, abs=1e-9)
+
+
+def test_converges_to_resonance():
+    estimator = ResonanceEstimator(791.0, 1.5, 0.008)
+    feed(estimator, np.linspace(790.5, 792.0, 16))
+    assert estimator.updates == 16
+    assert estimator.fRes == pytest.approx(TRUTH[0], abs=1e-3)
+    assert estimator.linewidth == pytest.approx(TRUTH[1], rel=0.02)
+    assert estimator.amplitude == pytest.approx(TRUTH[2], rel=0.02)
+    assert estimator.fResStd < 0.01
+    assert estimator.known(0.01)
+    assert not estimator.known(estimator.fResStd / 2)
+
+
+def test_uncertainty_shrinks_with_readings():
+    estimator = ResonanceEstimator(791.0, 1.5, 0.008)
+    stds = [estimator.fResStd]
+    for f in np.linspace(790.8, 791.8, 6):
+        feed(estimator, [f])
+        stds.append(estimator.fResStd)
+    assert np.all(np.diff(stds) < 0)
+
+
+def test_nan_reading_is_ignored():
+    estimator = ResonanceEstimator(791.0, 1.5, 0.008)
+    x, P = estimator.x.copy(), estimator.P.copy()
+    estimator.update(791.2, np.nan, np.nan)
+    assert estimator.updates == 0
+    assert np.array_equal(estimator.x, x)
+    assert np.array_equal(estimator.P, P)
+    assert not estimator.known(np.inf)
+
+
+def test_amplitude_only_readings():
+    estimator = ResonanceEstimator(791.0, 1.5, 0.008)
+    for f in np.linspace(790.0, 792.5, 26):
+        estimator.update(f, reading(f)[0])
+    assert estimator.updates == 26
+    # the amplitude alone carries less, but moves the estimate more than half way
+    assert abs(estimator.fRes - TRUTH[0]) < 0.5 * abs(791.0 - TRUTH[0])
+
+
+def test_gate_rejects_inconsistent_reading():
+    estimator = feed(ResonanceEstimator(791.0, 1.5, 0.008), np.linspace(790.5, 792.0, 16))
+    assert estimator.known(0.01)
+    amplitude, phase = reading(791.3)
+    estimator.update(791.3, amplitude, phase + 20.0)
+    assert estimator.consistency > estimator.gate
+    assert not estimator.known(0.01)
+
+
+def test_drift_keeps_estimate_uncertain():
+    fixed = feed(ResonanceEstimator(791.0, 1.5, 0.008), np.linspace(790.5, 792.0, 16))
+    drifting = feed(ResonanceEstimator(791.0, 1.5, 0.008, drift=0.01), np.linspace(790.5, 792.0, 16))
+    assert drifting.fResStd > fixed.fResStd
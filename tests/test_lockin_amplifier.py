@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from LockIn_Amplifier import SENSITIVITIES
+from Simulated_Instruments import simulatedSetup
+
+
+@pytest.fixture
+def lockIn(virtualClock):
+    """Normal mode lock-in of the simulated setup, driven at resonance."""
+    fork, ctrlNormal, _, freqGen, _, _ = simulatedSetup(seed=0)
+    freqGen.set_frequency(1, fork.trueResonance("normal"))
+    virtualClock.sleep(5.0)
+    return ctrlNormal
+
+
+def test_autoRange_steps_one_range_at_a_time(lockIn):
+    lockIn.setSensitivity(len(SENSITIVITIES) - 1)
+    indices = [len(SENSITIVITIES) - 1]
+    while lockIn.autoRange(float(lockIn.snap("R", "theta")["R"])):
+        indices.append(lockIn.getState("sensitivity"))
+    assert all(a - b == 1 for a, b in zip(indices, indices[1:]))
+    # settled in range, no switching back
+    amplitude = float(lockIn.snap("R", "theta")["R"])
+    assert 0.15 <= amplitude / SENSITIVITIES[indices[-1]] <= 0.8
+    assert not lockIn.autoRange(amplitude)
+
+
+def test_autoRange_low_reading_near_full_scale(lockIn):
+    amplitude = float(lockIn.snap("R", "theta")["R"])
+    index = next(i for i, sens in enumerate(SENSITIVITIES) if amplitude <= 0.7 * sens)
+    lockIn.setSensitivity(index)
+    # a single reading far below the signal, e.g. before it settled
+    assert lockIn.autoRange(amplitude / 1000)
+    assert lockIn.getState("sensitivity") == index - 1
+    # the overload of the next reading goes straight back
+    assert lockIn.autoRange(float(lockIn.snap("R", "theta")["R"]))
+    assert lockIn.getState("sensitivity") == index
+    assert not lockIn.autoRange(float(lockIn.snap("R", "theta")["R"]))
+
+
+def test_autoRange_overload_steps_up(lockIn):
+    lockIn.setSensitivity(0)
+    assert lockIn.autoRange(float(lockIn.snap("R", "theta")["R"]))
+    assert lockIn.getState("sensitivity") == 1
+
+
+def dropSentinels(lockIn, monkeypatch, count: int) -> None:
+    """The next `count` `OUTX?` sentinels go missing, as after a lost line."""
+    link = lockIn.transport
+    execute = link._execute
+    dropped = [0]
+
+    def _execute(command: str) -> None:
+        if command.strip() == "OUTX?" and dropped[0] < count:
+            dropped[0] += 1
+            return
+        execute(command)
+
+    monkeypatch.setattr(link, "_execute", _execute)
+
+
+def test_missing_sentinel_is_repeated(lockIn, monkeypatch):
+    dropSentinels(lockIn, monkeypatch, 1)
+    assert np.isfinite(lockIn.readPhase())
+    assert lockIn.retries == 1
+
+
+def test_missing_sentinels_are_a_bad_read(lockIn, monkeypatch):
+    dropSentinels(lockIn, monkeypatch, lockIn.readDrops)
+    assert np.isnan(lockIn.readPhase())
+    assert lockIn.retries == lockIn.readDrops - 1
+    # the next query is framed again
+    assert np.isfinite(lockIn.readPhase())
@@ -0,0 +1,82 @@
+import pytest
+
+import clock
+from PLL import PLL1D, PLL2D, PLL2x1D
+from Simulated_Instruments import simulatedSetup
+
+
+@pytest.mark.parametrize("solver", ["proportional", "secant"])
+@pytest.mark.parametrize("offset", [-0.08, 0.08])
+def test_guess_with_precision_locks(virtualClock, solver, offset):
+    # a narrow bracket around a guess, as `Continuation` passes it, says nothing about the linewidth
+    fork, ctrlNormal, _, freqGen, _, _ = simulatedSetup(seed=0)
+    truth = fork.trueResonance("normal")
+    guess = truth + offset
+    fRes, _, phaseDeg = PLL1D(
+        ctrlNormal, freqGen, guess - 0.1, guess + 0.1, points=2, guess=guess, precision=0.003, solver=solver
+    )
+    assert abs(fRes - truth) < 0.01
+    assert abs(phaseDeg) < 1.0
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_joint_locks_both_modes(virtualClock, seed):
+    fork, ctrlNormal, ctrlShear, freqGen, _, _ = simulatedSetup(seed=seed)
+    optNormal, optShear = PLL2D(ctrlNormal, ctrlShear, freqGen)
+    # the ground truth of each mode with the other one driven at its lock
+    assert abs(optNormal[0] - fork.trueResonance("normal", otherFrequency=optShear[0])) < 0.003
+    assert abs(optShear[0] - fork.trueResonance("shear", otherFrequency=optNormal[0])) < 0.003
+    # seed search of at most 6 readings per mode and 9 joint steps
+    assert virtualClock.monotonic() <= 15 * 0.75
+
+
+def lock2x1D(seed: int, **kwargs) -> tuple[list[float], float]:
+    """Largest error of both modes of `PLL2x1D` against the coupled ground truth, and the instrument time."""
+    with clock.useClock(clock.VirtualClock(start=0.0)) as clk:
+        fork, ctrlNormal, ctrlShear, freqGen, _, _ = simulatedSetup(seed=seed)
+        optNormal, optShear = PLL2x1D(ctrlNormal, ctrlShear, freqGen, **kwargs)
+        errors = [
+            optNormal[0] - fork.trueResonance("normal", otherFrequency=optShear[0]),
+            optShear[0] - fork.trueResonance("shear", otherFrequency=optNormal[0]),
+        ]
+        return errors, clk.monotonic()
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_interleaved_halves_the_dwells(seed):
+    errors, seconds = lock2x1D(seed)
+    sequentialErrors, sequentialSeconds = lock2x1D(seed, interleave=False)
+    assert seconds <= sequentialSeconds / 2
+    assert max(map(abs, errors)) < max(map(abs, sequentialErrors)) + 0.05
+
+
+def test_interleaved_relocks_after_cross_talk(metrics):
+    # the secant runs lock the normal mode first, the later shear steps move it away
+    errors, _ = lock2x1D(0, solver="secant")
+    assert metrics.counters["crossTalk"] == 1
+    assert abs(errors[0]) < 0.005
+
+
+def lock1D(below: float, **kwargs) -> tuple[float, float]:
+    """Error of a `PLL1D` lock of the normal mode in a 5 Hz range starting `below` Hz below its resonance, and the instrument time."""
+    with clock.useClock(clock.VirtualClock(start=0.0)) as clk:
+        fork, ctrlNormal, _, freqGen, _, _ = simulatedSetup(seed=0)
+        truth = fork.trueResonance("normal")
+        fRes, _, _ = PLL1D(ctrlNormal, freqGen, truth - below, truth - below + 5, **kwargs)
+        return fRes - truth, clk.monotonic()
+
+
+@pytest.mark.parametrize("below", [0.7, 2.3, 4.3])
+def test_fit_stops_past_resonance(below):
+    error, seconds = lock1D(below, coarse="fit")
+    _, gridSeconds = lock1D(below, coarse="argmax")
+    assert abs(error) < 0.005
+    assert seconds < gridSeconds
+
+
+@pytest.mark.parametrize("below", [0.3, 1.7, 2.1, 2.3, 3.3, 4.7])
+def test_adaptive_locks_at_the_default_delay(below):
+    error, seconds = lock1D(below, coarse="adaptive")
+    _, gridSeconds = lock1D(below, coarse="argmax")
+    assert abs(error) < 0.005
+    assert seconds < gridSeconds
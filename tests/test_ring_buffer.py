@@ -0,0 +1,76 @@
+import threading
+
+import numpy as np
+
+from tracker import SAMPLE_DTYPE, RingBuffer
+
+PAIR_DTYPE = np.dtype([("index", "i8"), ("double", "i8")])
+
+
+def rows(values) -> np.ndarray:
+    data = np.zeros(len(values), dtype=PAIR_DTYPE)
+    data["index"] = values
+    data["double"] = 2 * np.asarray(values)
+    return data
+
+
+def test_empty():
+    buffer = RingBuffer(4)
+    assert buffer.data.dtype == SAMPLE_DTYPE
+    assert len(buffer.snapshot()) == 0
+    assert buffer.latest() is None
+
+
+def test_append_and_snapshot_since():
+    buffer = RingBuffer(8, PAIR_DTYPE)
+    for i in range(5):
+        buffer.append(i, 2 * i)
+    assert list(buffer.snapshot()["index"]) == [0, 1, 2, 3, 4]
+    assert list(buffer.snapshot(3)["index"]) == [3, 4]
+    assert len(buffer.snapshot(5)) == 0
+    assert buffer.latest()["index"] == 4
+
+
+def test_wraps_around_and_keeps_newest():
+    buffer = RingBuffer(4, PAIR_DTYPE)
+    for i in range(6):
+        buffer.append(i, 2 * i)
+    assert buffer.count == 6
+    # the oldest row left may be overwritten during a copy, it is not returned
+    assert list(buffer.snapshot()["index"]) == [3, 4, 5]
+    assert list(buffer.snapshot(4)["index"]) == [4, 5]
+
+
+def test_extend():
+    buffer = RingBuffer(8, PAIR_DTYPE)
+    buffer.extend(rows([0, 1, 2]))
+    buffer.append(3, 6)
+    buffer.extend(rows([]))
+    assert buffer.count == 4
+    assert list(buffer.snapshot()["index"]) == [0, 1, 2, 3]
+
+
+def test_extend_more_than_capacity():
+    buffer = RingBuffer(4, PAIR_DTYPE)
+    buffer.append(-1, -2)
+    buffer.extend(rows(np.arange(10)))
+    assert buffer.count == 11
+    assert list(buffer.snapshot()["index"]) == [7, 8, 9]
+
+
+def test_reader_never_sees_torn_rows():
+    buffer = RingBuffer(16, PAIR_DTYPE)
+    n = 20000
+
+    def write():
+        for i in range(n):
+            buffer.append(i, 2 * i)
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    while writer.is_alive():
+        samples = buffer.snapshot()
+        assert np.all(samples["double"] == 2 * samples["index"])
+        assert np.all(np.diff(samples["index"]) == 1)
+    writer.join()
+    assert buffer.latest()["index"] == n - 1
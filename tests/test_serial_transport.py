@@ -0,0 +1,81 @@
+from Serial_Transport import SerialTransport
+
+
+class ChunkedSerial:
+    """Port handing out the queued bytes `chunk` at a time, an empty read is a timeout."""
+
+    def __init__(self, data: bytes = b"", chunk: int = 3) -> None:
+        self.data = bytearray(data)
+        self.chunk = chunk
+        self.written = b""
+        self.closed = False
+
+    @property
+    def in_waiting(self) -> int:
+        return min(len(self.data), self.chunk)
+
+    def read(self, size: int = 1) -> bytes:
+        out = bytes(self.data[:size])
+        del self.data[:size]
+        return out
+
+    def write(self, data: bytes) -> None:
+        self.written += data
+
+    def reset_input_buffer(self) -> None:
+        self.data.clear()
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def test_readLine_joins_chunks():
+    transport = SerialTransport(ChunkedSerial(b"1.250000e-03\r-12.5\r", chunk=4))
+    assert transport.readLine() == "1.250000e-03"
+    assert transport.readLine() == "-12.5"
+
+
+def test_readLine_strips_newline_of_terminator_pairs():
+    transport = SerialTransport(ChunkedSerial(b"first\n\rsecond\r\nthird\r"))
+    assert [transport.readLine() for _ in range(3)] == ["first", "second", "third"]
+
+
+def test_readLine_multibyte_terminator_split_over_reads():
+    transport = SerialTransport(ChunkedSerial(b"ab\r\ncd\r\n", chunk=3), terminator=b"\r\n")
+    assert transport.readLine() == "ab"
+    assert transport.readLine() == "cd"
+
+
+def test_readLine_timeout_returns_partial_reply():
+    transport = SerialTransport(ChunkedSerial(b"01A+0001"))
+    assert transport.readLine() == "01A+0001"
+    assert transport.readLine() == ""
+
+
+def test_readExact_then_readLine():
+    transport = SerialTransport(ChunkedSerial(b"\x00\x01\x02\x0312\r", chunk=5))
+    assert transport.readExact(4) == b"\x00\x01\x02\x03"
+    assert transport.readLine() == "12"
+
+
+def test_readExact_short_on_timeout():
+    transport = SerialTransport(ChunkedSerial(b"\x01\x02"))
+    assert transport.readExact(4) == b"\x01\x02"
+
+
+def test_reset_input_buffer_drops_buffered_replies():
+    ser = ChunkedSerial(b"stale\rold\r", chunk=20)
+    transport = SerialTransport(ser)
+    assert transport.readLine() == "stale"
+    transport.reset_input_buffer()
+    ser.data += b"new\r"
+    assert transport.readLine() == "new"
+
+
+def test_write_and_close():
+    ser = ChunkedSerial()
+    transport = SerialTransport(ser)
+    transport.write("OUTP? 3\n\r")
+    transport.close()
+    assert ser.written == b"OUTP? 3\n\r"
+    assert ser.closed
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from LockIn_Amplifier import ESR_USER_REQUEST
+from Simulated_Instruments import simulatedSetup
+from settle import Settler, dwell
+
+
+@pytest.fixture
+def ctrl():
+    """Simulated normal mode lock-in, 100 ms time constant and 12 dB/oct slope."""
+    _, ctrlNormal, _, _, _, _ = simulatedSetup(seed=1)
+    return ctrlNormal
+
+
+def test_predict_full_step_is_filter_settle_time(ctrl):
+    settler = Settler(ctrl)
+    assert settler.timeConstant == pytest.approx(0.1)
+    assert settler.slope == 1
+    # 7 time constants to 99% at 12 dB/oct
+    assert settler.predict() == pytest.approx(0.7)
+    assert settler.predict() == pytest.approx(settler.filterTime())
+
+
+def test_predict_adds_ringdown(ctrl):
+    settler = Settler(ctrl, ringdown=0.2)
+    assert settler.predict() == pytest.approx(0.7 + 0.2 * np.log(100))
+
+
+def test_predict_scales_with_step(ctrl):
+    settler = Settler(ctrl, ringdown=0.2, linewidth=1.0)
+    # a step of a tenth of the half width decays from 0.1 instead of 1
+    assert settler.predict(0.05) == pytest.approx(settler.predict() / 2)
+    assert settler.predict(-0.05) == settler.predict(0.05)
+    assert settler.predict(0.2) < settler.predict(0.3) < settler.predict(np.inf)
+    # a step beyond the half width is a full step
+    assert settler.predict(2.0) == settler.predict()
+
+
+def test_predict_bounds(ctrl):
+    settler = Settler(ctrl, ringdown=1.0, linewidth=1.0, minDelay=0.05, maxDelay=2.0)
+    assert settler.predict(0.001) == 0.05
+    assert settler.predict() == 2.0
+
+
+def test_refresh_follows_time_constant(ctrl):
+    settler = Settler(ctrl)
+    ctrl.setTimeConstant(10)
+    settler.refresh()
+    assert settler.predict() == pytest.approx(7.0)
+
+
+def test_refresh_sees_front_panel_change(ctrl):
+    settler = Settler(ctrl)
+    # turned on the front panel, the driver's cache does not know
+    ctrl.transport._setTimeConstant(9)
+    ctrl.transport.esr |= ESR_USER_REQUEST
+    settler.refresh()
+    assert settler.timeConstant == pytest.approx(0.3)
+
+
+def test_fromCalibration(ctrl):
+    gamma = 2 * np.pi * 0.8
+    settler = Settler.fromCalibration(ctrl, 791.3, gamma)
+    assert settler.ringdown == pytest.approx(2 / gamma)
+    assert settler.linewidth == pytest.approx(0.8)
+
+
+def test_dwell_fixed_delay(virtualClock):
+    assert dwell(None, 0.25) == 0.25
+    assert virtualClock.slept == pytest.approx(0.25)
+
+
+def test_dwell_longest_of_settlers_and_fixed_delay(ctrl, virtualClock):
+    settler = Settler(ctrl, linewidth=1.0)
+    assert dwell([None, settler], 0.3, [np.inf, np.inf]) == pytest.approx(0.7)
+    assert dwell([settler, None], 0.3, [0.001, np.inf]) == pytest.approx(0.3)
+    assert dwell([None, None], 0.3) == pytest.approx(0.3)
+    assert virtualClock.slept == pytest.approx(1.3)
@@ -0,0 +1,129 @@
+import numpy as np
+import pytest
+
+from SFA_Controller import FRAME_DTYPE, FREQUENCY_SCALE, STREAM_FIELDS, StreamDecoder, crc16
+
+LINE = b"791.30000,1.00000,0.50000,0.01000000,455.10000,1.00000,-2.00000,0.00500000"
+
+
+def test_text_stream_lines():
+    decoder = StreamDecoder()
+    samples, replies = decoder.feed(LINE + b"\nt" + LINE + b"\nt", 10.0)
+    assert len(samples) == 2
+    assert replies == []
+    assert samples["time"][0] == 10.0
+    assert np.isnan(samples["deviceTime"][0])
+    assert [samples[name][0] for name in STREAM_FIELDS] == pytest.approx(
+        [791.3, 1.0, 0.5, 0.01, 455.1, 1.0, -2.0, 0.005]
+    )
+
+
+def test_replies_between_stream_lines():
+    decoder = StreamDecoder()
+    # a reply after a stream line starts with the stream's "t"
+    samples, replies = decoder.feed(b"x not recognised\r\n" + LINE + b"\nt791.30000\r\n" + LINE + b"\nt", 0.0)
+    assert len(samples) == 2
+    assert replies == ["x not recognised", "791.30000"]
+
+
+def test_partial_line_kept_for_next_feed():
+    decoder = StreamDecoder()
+    samples, _ = decoder.feed(LINE[:20], 1.0)
+    assert len(samples) == 0
+    samples, _ = decoder.feed(LINE[20:] + b"\nt", 2.0)
+    assert len(samples) == 1
+    assert samples["frequency"][0] == pytest.approx(791.3)
+    assert samples["time"][0] == 2.0
+
+
+def test_undecodable_line_is_dropped():
+    decoder = StreamDecoder()
+    broken = LINE.replace(b"0.50000", b"0.5-000")
+    samples, replies = decoder.feed(LINE + b"\nt" + broken + b"\nt" + LINE + b"\nt", 0.0)
+    assert len(samples) == 2
+    assert replies == []
+    assert decoder.dropped == 1
+
+
+def frame(sequence: int, millis: int = 1000, phase: float = 0.5) -> bytes:
+    """Frame as `sendFrame` in the firmware sends it."""
+    data = np.zeros(1, dtype=FRAME_DTYPE)
+    data["sync"] = 0xA55A
+    data["sequence"] = sequence
+    data["millis"] = millis
+    data["frequency"] = round(791.3 / FREQUENCY_SCALE)
+    data["amplitude"] = 1.0
+    data["phase"] = phase
+    data["inputAmplitude"] = 0.01
+    data["frequencyShear"] = round(455.1 / FREQUENCY_SCALE)
+    data["amplitudeShear"] = 1.0
+    data["phaseShear"] = -2.0
+    data["inputAmplitudeShear"] = 0.005
+    raw = np.frombuffer(data.tobytes(), dtype=np.uint8).reshape(1, -1)
+    data["crc"] = crc16(raw[:, 2:-2])[0]
+    return data.tobytes()
+
+
+def test_crc16_check_value():
+    # CRC-16/CCITT-FALSE of "123456789"
+    assert crc16(np.frombuffer(b"123456789", dtype=np.uint8).reshape(1, -1))[0] == 0x29B1
+
+
+def test_frames():
+    decoder = StreamDecoder()
+    samples, replies = decoder.feed(b"".join(frame(i, 1000 + 40 * i, 0.5 * i) for i in range(3)), 5.0)
+    assert len(samples) == 3
+    assert replies == []
+    assert list(samples["deviceTime"]) == pytest.approx([1.0, 1.04, 1.08])
+    assert list(samples["phase"]) == pytest.approx([0.0, 0.5, 1.0])
+    assert samples["frequency"][0] == pytest.approx(791.3)
+    assert samples["frequencyShear"][0] == pytest.approx(455.1)
+    assert np.all(samples["time"] == 5.0)
+    assert decoder.dropped == 0
+    assert decoder.corrupt == 0
+
+
+def test_frames_fed_byte_by_byte():
+    decoder = StreamDecoder()
+    data = frame(0) + frame(1)
+    samples = [decoder.feed(data[i : i + 1], 0.0)[0] for i in range(len(data))]
+    assert [len(s) for s in samples].count(1) == 2
+    assert sum(len(s) for s in samples) == 2
+
+
+def test_sequence_gaps_count_as_dropped():
+    decoder = StreamDecoder()
+    decoder.feed(frame(65534) + frame(65535) + frame(0), 0.0)
+    assert decoder.dropped == 0
+    samples, _ = decoder.feed(frame(3), 0.0)
+    assert len(samples) == 1
+    assert decoder.dropped == 2
+
+
+def test_wrong_crc_skips_frame():
+    decoder = StreamDecoder()
+    damaged = bytearray(frame(1))
+    damaged[20] ^= 0x01
+    samples, replies = decoder.feed(frame(0) + bytes(damaged) + frame(2), 0.0)
+    assert len(samples) == 2
+    assert list(samples["deviceTime"]) == pytest.approx([1.0, 1.0])
+    assert replies == []
+    assert decoder.corrupt == 1
+    assert decoder.dropped == 1
+
+
+def test_resync_after_truncated_frame():
+    decoder = StreamDecoder()
+    # bytes lost on the line, the next frame starts inside the 42 bytes of the cut one
+    data = b"".join(frame(i, 1000 + 40 * i) for i in range(4))
+    samples, _ = decoder.feed(data[:42 + 30] + data[2 * 42 :], 0.0)
+    assert list(samples["deviceTime"]) == pytest.approx([1.0, 1.08, 1.12])
+    assert decoder.corrupt == 1
+    assert decoder.dropped == 1
+
+
+def test_reply_between_frames():
+    decoder = StreamDecoder()
+    samples, replies = decoder.feed(frame(0) + b"x not recognised\r\n" + frame(1), 0.0)
+    assert len(samples) == 2
+    assert replies == ["x not recognised"]
@@ -0,0 +1,323 @@
+"""
+Continuous resonance tracking in a background thread
+
+A `ResonanceTracker` keeps one mode locked with the proportional phase update of `PLL1D` while other
+code runs, e.g. the Z-stage and height gauge of `viscosity1D`. Every reading is published as a
+timestamped (f, A, φ) sample to a preallocated `RingBuffer`, which readers copy without taking a
+lock, so a slow reader never stalls the loop.
+
+With a `ResonanceEstimator` every reading also updates the estimate of the resonance, and `estimate`
+waits until it is known to a given precision instead of for a number of locked samples. Give the
+estimator a `drift` when the resonance moves, e.g. while the stage approaches.
+
+While it runs, the tracker owns its lock-in and its function generator channel: don't read the
+lock-in or set that channel from other code.
+
+Example:
+    tracker = ResonanceTracker(ctrlNormal, freqGen, 1, delay=0.3)
+    tracker.start(791.3)
+    zStage.absolute_voltage(50)
+    fRes, A, phase = tracker.mean(tracker.next(5))
+    tracker.stop()
+
+    tracker = ResonanceTracker(ctrlNormal, freqGen, 1, estimator=ResonanceEstimator(791.3, 1.0, 0.01, drift=0.01))
+    tracker.start(791.3)
+    fRes, A, phase = tracker.estimate(0.005)
+"""
+
+import threading
+import clock
+import numpy as np
+
+from LockIn_Amplifier import SR830
+from rigol_dg1022 import RigolDG
+from settle import Settler, dwell
+from metrics import getMetrics
+from estimator import ResonanceEstimator
+
+
+SAMPLE_DTYPE = np.dtype(
+    [
+        ("time", "f8"),
+        ("frequency", "f8"),
+        ("amplitude", "f8"),
+        ("phase", "f8"),
+        ("locked", "?"),
+        ("estimate", "f8"),
+        ("estimateStd", "f8"),
+    ]
+)
+"""Fields of a tracker sample: time since epoch (s), drive frequency (Hz), R (V), θ (deg), if θ is within tolerance, and the estimated resonance and its standard deviation (Hz, NaN without estimator)."""
+
+
+class RingBuffer:
+    def __init__(self, capacity: int = 4096, dtype: np.dtype = SAMPLE_DTYPE) -> None:
+        """
+        Fixed size buffer of the newest samples, for one writer and any number of readers
+
+        The writer fills a row and only then advances `count`, readers copy the rows and drop those
+        the writer may have overwritten during the copy. Neither side takes a lock.
+
+        :param capacity: Number of samples kept. default: `4096`
+        :type capacity: int
+
+        :param dtype: Structured dtype of a sample. default: `SAMPLE_DTYPE`
+        :type dtype: np.dtype
+        """
+        self.capacity = capacity
+        self.data = np.zeros(capacity, dtype=dtype)
+        self.count = 0
+        """Number of samples written since the start, the newest is at `(count - 1) % capacity`."""
+
+    def append(self, *values) -> None:
+        self.data[self.count % self.capacity] = values
+        self.count += 1
+
+    def extend(self, rows: np.ndarray) -> None:
+        """Appends all `rows` (a structured array of the buffer's dtype) and then advances `count` once."""
+        n = len(rows)
+        if n == 0:
+            return
+        # more rows than fit overwrite each other, only the newest are written
+        kept = rows[-self.capacity :]
+        self.data[np.arange(self.count + n - len(kept), self.count + n) % self.capacity] = kept
+        self.count += n
+
+    def snapshot(self, since: int = 0) -> np.ndarray:
+        """
+        Copy of the samples still in the buffer from index `since` on, oldest first
+
+        The index of a sample is its position in the write order, so `since=count` before a wait gives
+        only the samples written after it.
+        """
+        end = self.count
+        data = self.data.copy()
+        # rows written during the copy replaced the oldest ones, the row after them may be half written
+        start = max(since, self.count - self.capacity + 1, 0)
+        if start >= end:
+            return np.zeros(0, dtype=self.data.dtype)
+        return data[np.arange(start, end) % self.capacity]
+
+    def latest(self) -> np.void | None:
+        """Newest sample, `None` when empty."""
+        samples = self.snapshot(self.count - 1)
+        return samples[-1] if len(samples) > 0 else None
+
+
+class ResonanceTracker:
+    def __init__(
+        self,
+        ctrl: SR830,
+        freqGen: RigolDG,
+        freqGenChannel: int = 1,
+        Kp: float = 1 / np.pi,
+        delay: float = 0.3,
+        tolerance: float = 1.0,
+        maxStep: float = 0.5,
+        capacity: int = 4096,
+        settle: Settler | None = None,
+        estimator: ResonanceEstimator | None = None,
+    ) -> None:
+        """
+        :param ctrl: Lock-In Amplifier of the tracked mode.
+        :type ctrl: SR830
+
+        :param freqGen: Function generator driving the mode.
+        :type freqGen: RigolDG
+
+        :param freqGenChannel: Channel of the function generator. default: `1`
+        :type freqGenChannel: int
+
+        :param Kp: Kp value of the phase update `f += Kp * θ` (θ in rad). default: `1 / π`
+        :type Kp: float
+
+        :param delay: Wait between a frequency update and the next reading, in s. default: `0.3`
+        :type delay: float
+
+        :param tolerance: Phase error in deg within which a sample counts as locked. default: `1.0`
+        :type tolerance: float
+
+        :param maxStep: Largest frequency update per reading, in Hz. default: `0.5`
+        :type maxStep: float
+
+        :param capacity: Number of samples kept in the ring buffer. default: `4096`
+        :type capacity: int
+
+        :param settle: Wait the predicted settle time of each update instead of `delay`. default: `None`
+        :type settle: Settler | None
+
+        :param estimator: Update this estimator with every reading, see `estimate`. default: `None`
+        :type estimator: ResonanceEstimator | None
+        """
+        self.ctrl = ctrl
+        self.freqGen = freqGen
+        self.freqGenChannel = freqGenChannel
+        self.Kp = Kp
+        self.delay = delay
+        self.tolerance = tolerance
+        self.maxStep = maxStep
+        self.settle = settle
+        self.estimator = estimator
+        self.buffer = RingBuffer(capacity)
+
+        self.frequency = np.nan
+        self.setpoint = 0.0
+        self.error: Exception | None = None
+        self._retarget: float | None = None
+        self._stop = threading.Event()
+        self._published = threading.Condition()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, frequency: float) -> None:
+        """Starts tracking from `frequency` in Hz."""
+        if self.running:
+            raise RuntimeError("Tracker is already running!")
+        self.frequency = float(frequency)
+        self.error = None
+        self._retarget = None
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name=f"ResonanceTracker-{self.freqGenChannel}", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        """Stops tracking after the current reading, the drive stays at the last frequency."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        with self._published:
+            self._published.notify_all()
+
+    def retarget(self, frequency: float | None = None, setpoint: float | None = None) -> None:
+        """
+        Moves the lock while running
+
+        :param frequency: Jump to this frequency in Hz before the next reading, e.g. after a mode hop. default: `None`
+        :type frequency: float | None
+
+        :param setpoint: Phase in deg to lock to instead of 0. default: `None`
+        :type setpoint: float | None
+        """
+        if setpoint is not None:
+            self.setpoint = float(setpoint)
+        if frequency is not None:
+            self._retarget = float(frequency)
+
+    def _run(self) -> None:
+        metrics = getMetrics()
+        step = np.inf
+        try:
+            self.freqGen.set_frequency(self.freqGenChannel, self.frequency)
+            while not self._stop.is_set():
+                dwell(self.settle, self.delay, step)
+                if self._stop.is_set():
+                    break
+                reading = self.ctrl.snap("R", "theta")
+                amplitude, phaseDeg = float(reading["R"]), float(reading["theta"])
+                error = phaseDeg - self.setpoint
+                estimate, estimateStd = np.nan, np.nan
+                if self.estimator is not None:
+                    self.estimator.update(self.frequency, amplitude, phaseDeg)
+                    estimate, estimateStd = self.estimator.fRes, self.estimator.fResStd
+                self.buffer.append(
+                    clock.now(),
+                    self.frequency,
+                    amplitude,
+                    phaseDeg,
+                    bool(abs(error) <= self.tolerance),
+                    estimate,
+                    estimateStd,
+                )
+                with self._published:
+                    self._published.notify_all()
+
+                target, self._retarget = self._retarget, None
+                if target is not None:
+                    step = target - self.frequency
+                elif np.isfinite(error):
+                    step = float(np.clip(self.Kp * np.deg2rad(error), -self.maxStep, self.maxStep))
+                else:
+                    metrics.count("nanReads")
+                    step = 0.0
+                self.frequency += step
+                self.freqGen.set_frequency(self.freqGenChannel, self.frequency)
+        except Exception as e:
+            self.error = e
+            print(f"Resonance tracker stopped: {e!r}")
+            with self._published:
+                self._published.notify_all()
+
+    def latest(self) -> np.void | None:
+        """Newest sample, `None` before the first reading."""
+        return self.buffer.latest()
+
+    def snapshot(self, since: int = 0) -> np.ndarray:
+        """Samples from index `since` on still in the ring buffer, see `RingBuffer.snapshot`."""
+        return self.buffer.snapshot(since)
+
+    def next(self, n: int = 1, timeout: float | None = None, locked: bool = True) -> np.ndarray:
+        """
+        Waits for `n` new samples
+
+        :param n: Number of samples taken after the call. default: `1`
+        :type n: int
+
+        :param timeout: Longest wait in s, `None` waits until the tracker stops. default: `None`
+        :type timeout: float | None
+
+        :param locked: Only count samples within `tolerance` of the setpoint. default: `True`
+        :type locked: bool
+
+        Returns the samples, fewer than `n` if the timeout passed or the tracker stopped.
+        """
+        since = self.buffer.count
+
+        def fresh() -> np.ndarray:
+            samples = self.buffer.snapshot(since)
+            return samples[samples["locked"]] if locked else samples
+
+        with self._published:
+            self._published.wait_for(
+                lambda: len(fresh()) >= n or not self.running, timeout=timeout
+            )
+        return fresh()[:n]
+
+    def estimate(self, precision: float, timeout: float | None = None) -> list[float]:
+        """
+        Waits until the estimator knows the resonance to `precision` Hz (one standard deviation)
+
+        Only readings taken after the call count, so the estimate includes the current state of the
+        sample. Returns [fRes, ampRes, phaRes] of the newest sample with fRes the estimate, or NaN
+        without an estimator or when the timeout passed or the tracker stopped first.
+        """
+        if self.estimator is None:
+            return [np.nan, np.nan, np.nan]
+        since = self.buffer.count
+
+        def known() -> bool:
+            samples = self.buffer.snapshot(since)
+            return len(samples) > 0 and samples[-1]["estimateStd"] <= precision
+
+        with self._published:
+            self._published.wait_for(lambda: known() or not self.running, timeout=timeout)
+        if not known():
+            return [np.nan, np.nan, np.nan]
+        getMetrics().count("estimatorStops")
+        sample = self.buffer.snapshot(since)[-1]
+        return [float(sample["estimate"]), float(sample["amplitude"]), float(sample["phase"])]
+
+    @staticmethod
+    def mean(samples: np.ndarray) -> list[float]:
+        """[fRes, ampRes, phaRes] averaged over `samples`, like the result of `PLL1D`; NaN when empty."""
+        if len(samples) == 0:
+            return [np.nan, np.nan, np.nan]
+        return [
+            float(np.mean(samples["frequency"])),
+            float(np.mean(samples["amplitude"])),
+            float(np.mean(samples["phase"])),
+        ]